@@ -1,7 +1,11 @@
 from collections import defaultdict
-from datatable_util import AttributeDict, DataTableException, CSV_GivenHeaders, FIXEDWIDTH, JoinType, sortKey
+from datatable_util import AttributeDict, CompactRow, RowSchema, RowFingerprints, DataTableException, CSV_GivenHeaders, FIXEDWIDTH, JoinType, sortKey
+from datatable_aggregate import accumulate, aggregateParallel, finalizeRows
+from datatable_index import INDEX_TYPES, inRange, hasPrefix
+from datatable_join import hashJoin, mergeJoin, joinedHeaders, sortedKeyGetter, isSorted
 from hierarchies import Hierarchy
 from functools import total_ordering
+import heapq
 import os
 
 @total_ordering
@@ -27,19 +31,33 @@ class DataColumn(object):
 		'''Gets the index'th row of data'''
 		return self.__dataTable[index][self.header]
 	def __contains__(self, value):
+		index = self.__dataTable._index(self.header)
+		if index is not None:
+			try:
+				return bool(index.lookup(value))
+			except TypeError:
+				pass
 		return value in iter(self)
+	def __sameTable(self, other):
+		return other.__dataTable is self.__dataTable or other.__dataTable == self.__dataTable
+	def _valueSet(self):
+		'''returns a collection of the values in this column which supports fast membership checks'''
+		index = self.__dataTable._index(self.header)
+		if index is not None:
+			return index
+		return set(self)
 	def __filter(self, value):
 		if value is None:
 			for row in self.__dataTable:
 				if row[self.header] is None:
 					yield row
 		elif isinstance(value, DataColumn):
-			if value.__dataTable == self.__dataTable:
+			if self.__sameTable(value):
 				for row in self.__dataTable:
 					if row[self.header] == row[value.header]:
 						yield row
 			else:
-				otherValues = set(value)
+				otherValues = value._valueSet()
 				for row in self.__dataTable:
 					if row[self.header] in otherValues:
 						yield row
@@ -65,7 +83,13 @@ Value may be one of the following:
 	method - returns rows where method returns true for column value
 	collection - returns rows where column value is in the collection
 	value - returns rows where column value equals the given value
+Uses the table's index on this column (see DataTable.createIndex) where one exists
 '''
+		if isinstance(value, DataColumn) and self.__sameTable(value):
+			return DataTable(self.__filter(value))
+		positions = self.__dataTable._lookup(self.header, value)
+		if positions is not None:
+			return self.__dataTable[positions]
 		return DataTable(self.__filter(value))
 	def set(self, value):
 		'''
@@ -73,27 +97,69 @@ Value may be one of the following:
 	If value is a function then sets each item to the result of calling value on the item
 	returns the modified datatable
 '''
+		self.__dataTable._beforeWrite()
 		if hasattr(value, '__call__'):
 			for row in self.__dataTable:
 				row[self.header] = value(row[self.header])
 		else:
 			for row in self.__dataTable:
 				row[self.header] = value
+		self.__dataTable._invalidateIndexes(self.header)
 		return self.__dataTable
+	def range(self, lo=None, hi=None, includeLo=True, includeHi=False):
+		'''
+	returns the rows where lo <= value < hi, for values of the type of the bounds (int and float values are both in range of numeric bounds)
+	either bound may be None to leave that end of the range open; includeLo and includeHi control if the bounds themselves match
+	Uses the sorted index on this column (see DataTable.createIndex) where one exists
+'''
+		index = self.__dataTable._index(self.header, 'sorted')
+		if index is not None:
+			return self.__dataTable[index.range(lo, hi, includeLo, includeHi)]
+		return DataTable(self.__filter(inRange(lo, hi, includeLo, includeHi)))
+	def between(self, lo, hi):
+		'''returns the rows where lo <= value < hi (see range)'''
+		return self.range(lo, hi)
+	def startswith(self, prefix):
+		'''returns the rows where the value is of the same type as prefix and starts with prefix (e.g. strings)'''
+		index = self.__dataTable._index(self.header, 'sorted')
+		if index is not None:
+			return self.__dataTable[index.prefix(prefix)]
+		return DataTable(self.__filter(hasPrefix(prefix)))
+	def minRow(self):
+		'''return the (first) row with the minimum value in this column'''
+		index = self.__dataTable._index(self.header, 'sorted')
+		if index is None:
+			return self.__dataTable.minRow(self.header)
+		if not len(index):
+			return None
+		return _copyRows([self.__dataTable[index.first()]])[0]
+	def maxRow(self):
+		'''return the (last) row with the maximum value in this column'''
+		index = self.__dataTable._index(self.header, 'sorted')
+		if index is None:
+			return self.__dataTable.maxRow(self.header)
+		if not len(index):
+			return None
+		return _copyRows([self.__dataTable[index.last()]])[0]
 	def sort(self):
 		self.__dataTable.sort(self.header)
 	def sizeOfGroups(self):
+		index = self.__dataTable._index(self.header)
+		if index is not None:
+			return {v: len(index.lookup(v)) for v in index}
 		groups = defaultdict(lambda:0)
 		for v in self:
 			groups[v] += 1
 		return dict(groups)
 	def fillDownBlanks(self):
+		self.__dataTable._beforeWrite()
 		prev = None
 		for i in range(len(self)):
 			if self[i]:
 				prev = self[i]
 			else:
 				self.__dataTable[i][self.header] = prev
+		self.__dataTable._invalidateIndexes(self.header)
 	def __repr__(self):
 		return "DataColumn(<dataTable>, '%s')" % self.header
 	def __str__(self):
@@ -111,6 +177,25 @@ class NullColumn(DataColumn):
 	def __repr__(self):
 		return "NullColumn(<dataTable>, '%s')" % self.header
 
+def _copyRows(rows, headers=None):
+	'''copies the rows (keeping only the given headers, if specified), keeping compact rows compact'''
+	schema = None if headers is None else RowSchema(headers)
+	def copyRow(row):
+		if isinstance(row, CompactRow):
+			if schema is None or row._schema.slots.keys() == schema.slots.keys():
+				return row.copy()
+			return schema.fromMapping(row)
+		if schema is None:
+			return AttributeDict(row)
+		return AttributeDict((h, row[h]) for h in schema.headers)
+	return [copyRow(row) for row in rows]
+
+def _rowSortKey(fields):
+	'''returns the key function ordering rows by the given fields (as used by sort)'''
+	def key(row):
+		return tuple(sortKey(row.get(field, None)) for field in fields)
+	return key
+
 def _copyAndApplyOp(op):
 	def copyOp(self, *args, **kwargs):
 		newData = DataTable(self)
@@ -130,18 +215,37 @@ for t in tables:
 	table.augment(t)
 		'''
 		return DataTable(row for table in tables for row in table)
-	def __init__(self, data=None, parseMethod=None):
+	def __init__(self, data=None, parseMethod=None, copyOnWrite=None, compact=None):
 		'''Create a data table from the given data
 	data may be one of the following:
 A sequence of dictionaries, where all of the dictionaries share common keys
 A sequence of sequences where the first item is the list of headers
-Another DataTable instance, which will create a deep copy
+Another DataTable instance, which will create a deep copy (or a copy-on-write copy, see below)
 A string which may be parsed into one of the previous by calling parseMethod on the string.
+copyOnWrite - if true, copies of this table (including the results of extend, project, exclude, append, remove and sorted)
+	share their rows with this table, and a table only copies the shared rows when it changes their contents.
+	Defaults to the mode of data if it is a DataTable, otherwise False.
+	In this mode rows taken from the table must only be changed through the table's own methods.
+compact - if true, stores the rows as CompactRows (a list of values per row plus one header -> slot schema shared by the rows)
+	instead of an AttributeDict per row.  Defaults to true if data is a compact DataTable or a sequence of CompactRows.
 '''
+		self.__indexes = {}
+		self.__shared = False
 		if isinstance(data, DataTable):
+			self.__copyOnWrite = data.__copyOnWrite if copyOnWrite is None else copyOnWrite
+			self.__compact = data.__compact if compact is None else compact
 			self.__headers = {h: DataColumn(self, c) for h, c in data.__headers.items()}
-			self.__data = [AttributeDict((h.header, row[h.header]) for h in self.__headers.values()) for row in data]
+			if self.__compact != data.__compact:
+				self.__data = self.__makeRows(data.__data, list(self.__headers.keys()))
+			elif self.__copyOnWrite:
+				self.__data = list(data.__data)
+				self.__shared = data.__shared = True
+			else:
+				self.__data = _copyRows(data.__data, list(self.__headers.keys()))
+			self.__indexes = dict.fromkeys(data.__indexes)
 			return
+		self.__copyOnWrite = bool(copyOnWrite)
+		self.__compact = bool(compact)
 		if isinstance(data, str):
 			data = parseMethod(data)
 		if not data:
@@ -153,9 +257,14 @@ A string which may be parsed into one of the previous by calling parseMethod on
 			self.__data = []
 			self.__headers = {}
 			return
-		if isinstance(data[0], dict):
+		if compact is None:
+			self.__compact = isinstance(data[0], CompactRow)
+		if isinstance(data[0], (dict, CompactRow)):
 			headers = {k for row in data for k in row.keys()}
 			self.__headers = {h: DataColumn(self, h) for h in headers}
+			if self.__compact:
+				self.__data = self.__makeRows(data, sorted(headers, key=sortKey))
+				return
 			for row in data:
 				for header in self.__headers.keys():
 					if header not in row:
@@ -164,12 +273,39 @@ A string which may be parsed into one of the previous by calling parseMethod on
 		else:
 			headers = data.pop(0)
 			self.__headers = {h: DataColumn(self, h) for h in headers}
+			if self.__compact:
+				schema = RowSchema(headers)
+				self.__data = [schema.fromValues(row) for row in data]
+				return
 			self.__data = [AttributeDict(zip(headers, row)) for row in data]
+	@staticmethod
+	def _fromRows(rows, headers, copyOnWrite=False, compact=False):
+		'''creates a DataTable which takes ownership of the given list of rows (each having exactly the given headers) without copying them'''
+		table = DataTable(copyOnWrite=copyOnWrite, compact=compact)
+		if rows:
+			table.__headers = {h: DataColumn(table, h) for h in headers}
+			table.__data = table.__makeRows(rows, list(headers)) if compact else rows
+		return table
+	def __makeRows(self, rows, headers):
+		'''converts the rows into the representation used by this table'''
+		if not self.__compact:
+			return [AttributeDict((h, row[h] if h in row else None) for h in headers) for row in rows]
+		first = rows[0] if rows else None
+		if isinstance(first, CompactRow) and first._schema.slots.keys() == set(headers) and all(isinstance(row, CompactRow) and row._schema is first._schema for row in rows):
+			return [row.copy() for row in rows]
+		schema = RowSchema(headers)
+		return [schema.fromMapping(row) for row in rows]
+	def isCompact(self):
+		'''Returns if the rows are stored as CompactRows'''
+		return self.__compact
 	def __iter__(self):
 		'''Gets an iterator over the data rows'''
 		return iter(self.__data)
 	def __getitem__(self, index):
-		'''Gets the index'th row of data'''
+		'''Gets the index'th row of data
+	index may also be a collection of row indices, a slice, or a dict of header -> value (same as filter)'''
+		if isinstance(index, dict):
+			return self.filter(index)
 		if '__iter__' in dir(index):
 			return DataTable(self[i] for i in index)
 		data = self.__data[index]
@@ -189,12 +325,99 @@ A string which may be parsed into one of the previous by calling parseMethod on
 	def headers(self):
 		'''Returns this table's header strings'''
 		return sorted(self.__headers.keys(), key=sortKey)
+	def createIndex(self, header, kind='hash'):
+		'''Builds an index of value -> row positions over the given column
+kind is one of:
+	'hash' - equality and membership filters on that column (DataColumn.filter, filter with a dict, self[{header: value}])
+		look the matching rows up instead of scanning the whole table
+	'sorted' - orders the rows by value (using sortKey), for DataColumn.between/range/startswith/minRow/maxRow
+The index is kept up to date by the table's own methods; if rows are modified directly, call createIndex again
+		'''
+		if header not in self.__headers:
+			raise DataTableException("Can't index missing column: %r" % (header,))
+		if kind not in INDEX_TYPES:
+			raise DataTableException("Unknown index kind: %r.  Expected one of: %s" % (kind, sorted(INDEX_TYPES)))
+		self.__indexes[header, kind] = INDEX_TYPES[kind](row[header] for row in self.__data)
+		return self
+	def dropIndex(self, header, kind=None):
+		'''Removes the index(es) over the given column'''
+		for key in list(self.__indexes.keys()):
+			if key[0] == header and kind in (None, key[1]):
+				del self.__indexes[key]
+		return self
+	def indexes(self):
+		'''Returns the headers of the indexed columns'''
+		return sorted({header for header, kind in self.__indexes.keys()}, key=sortKey)
+	def _index(self, header, kind='hash'):
+		'''returns the index of the given kind over the given column (rebuilding it if it is stale), or None if there isn't one
+	if the column's values can no longer be indexed (e.g. set to unhashable values) the index is dropped, and lookups scan the rows instead'''
+		if (header, kind) not in self.__indexes:
+			return None
+		index = self.__indexes[header, kind]
+		if index is None:
+			try:
+				index = self.__indexes[header, kind] = INDEX_TYPES[kind](row[header] for row in self.__data)
+			except (DataTableException, TypeError):
+				self.dropIndex(header, kind)
+				return None
+		return index
+	def _beforeWrite(self, headers=None):
+		'''called before the contents of the rows are changed - in copy-on-write mode takes private copies of any shared rows
+	(keeping only the given headers, if specified)'''
+		if not self.__shared:
+			return
+		self.__data = _copyRows(self.__data, headers)
+		self.__shared = False
+	def _invalidateIndexes(self, *headers):
+		'''marks the indexes over the given columns (all columns if none are given) to be rebuilt on their next use'''
+		for key in list(self.__indexes.keys()):
+			if not headers or key[0] in headers:
+				self.__indexes[key] = None
+	def __extendIndexes(self, start):
+		for (header, kind), index in self.__indexes.items():
+			if index is not None:
+				try:
+					index.extend((row[header] for row in self.__data[start:]), start)
+				except (DataTableException, TypeError):
+					# rebuilt (or dropped) on its next use
+					self.__indexes[header, kind] = None
+	def _lookup(self, header, value):
+		'''returns the ascending positions of the rows matching value in the given column (as described by DataColumn.filter),
+	or None if the column isn't indexed or the index can't answer the query
+	a DataColumn value is treated as coming from another table'''
+		index = self._index(header)
+		if index is None:
+			return None
+		if isinstance(value, DataColumn):
+			return index.lookupAll(value._valueSet())
+		if '__call__' in dir(value):
+			return None
+		if '__contains__' in dir(value) and not isinstance(value, str):
+			return index.lookupAll(value)
+		try:
+			return index.lookup(value)
+		except TypeError:
+			return None
 	def filter(self, filterFunction):
 		'''Returns a DataTable containing the lines in self filtered by the given filterFunciton
 	Accepts either a dictionary of header -> value which does exact matching on the pairs,
-	or a filter function which takes a dict as input and returns if that row should be included'''
+	or a filter function which takes a dict as input and returns if that row should be included
+	Indexed columns in the dictionary are used to narrow down the rows which are checked'''
 		if isinstance(filterFunction, dict):
-			return DataTable(line for line in self.__data if all(line[k] == v for k, v in filterFunction.items()))
+			candidates = self.__data
+			for k, v in filterFunction.items():
+				index = self._index(k)
+				if index is None:
+					continue
+				try:
+					positions = index.lookup(v)
+				except TypeError:
+					continue
+				if candidates is self.__data or len(positions) < len(candidates):
+					candidates = positions
+			if candidates is not self.__data:
+				candidates = [self.__data[i] for i in candidates]
+			return DataTable(line for line in candidates if all(line[k] == v for k, v in filterFunction.items()))
 		return DataTable(line for line in self.__data if filterFunction(line))
 	def __len__(self):
 		'''The number of rows'''
@@ -218,7 +441,7 @@ A string which may be parsed into one of the previous by calling parseMethod on
 			return self
 		if isinstance(other, list):
 			other = DataTable(other)
-		if isinstance(other, dict):
+		if isinstance(other, (dict, CompactRow)):
 			other = DataTable([other])
 		if not len(self):
 			return other
@@ -233,42 +456,58 @@ A string which may be parsed into one of the previous by calling parseMethod on
 		if isinstance(other, DataTable):
 			if self.headers() and other.headers() and self.headers() != other.headers():
 				raise DataTableException("headers don't match.  Expected: " + str(self.headers()) + "\nFound: " + str(other.headers()))
+			start = len(self.__data)
 			self.__data += other.__data
+			if self.__copyOnWrite or other.__copyOnWrite:
+				self.__shared = other.__shared = True
 		elif isinstance(other, list):
 			if other and self.headers() != sorted(other[0].keys(), key=sortKey):
 				raise DataTableException("headers don't match.  Expected: " + str(self.headers()) + "\nFound: " + str(sorted(other[0].keys(), key=sortKey)))
+			start = len(self.__data)
 			self.__data += other
-		elif isinstance(other, dict):
+		elif isinstance(other, (dict, CompactRow)):
 			if self.headers() and other and self.headers() != sorted(other.keys(), key=sortKey):
 				raise DataTableException("headers don't match.  Expected: " + str(self.headers()) + "\nFound: " + str(sorted(other.keys(), key=sortKey)))
-			elif other:
+			start = len(self.__data)
+			if other:
 				self.__data.append(other)
 		else:
 			print("other instance unknown: %s" % other.__class__)
 			raise NotImplemented()
+		self.__extendIndexes(start)
 		return self
 	append = __add__ = _copyAndApplyOp(__iadd__)
-	def __isub__(self, other):
-		'''remove the rows from other that are in self - uses exact match of rows'''
-		if isinstance(other, dict):
-			if other in self.__data:
-				self.__data.remove(other)
+	def __isub__(self, other, keyHeaders=None):
+		'''remove the rows from other that are in self - uses exact match of rows, removing one row from self for each row in other
+	if keyHeaders is given then rows are matched by their values for those headers instead (e.g. removal by primary key),
+		and every row in self which matches a row in other is removed'''
+		if isinstance(other, (dict, CompactRow)):
+			other = [other]
+		if keyHeaders is None:
+			toRemove = RowFingerprints(other, self.headers(), exact=True)
+			matches = toRemove.discard
 		else:
-			for row in other:
-				if row in self.__data:
-					self.__data.remove(row)
+			toRemove = RowFingerprints(other, keyHeaders)
+			matches = toRemove.__contains__
+		if not len(toRemove):
+			return self
+		self.__data = [row for row in self.__data if not matches(row)]
+		self._invalidateIndexes()
 		return self
 	remove = __sub__ = _copyAndApplyOp(__isub__)
 	def __iand__(self, other):
 		'''Add columns to the data tabel using the dictionary keys from other as the new headers and their values as fields on each row
 Overwrites existing columns'''
+		self._beforeWrite()
 		if hasattr(other, '__call__'):
 			if not self:
 				return self
-			for newHeader in other(self[0]).keys():
+			newHeaders = other(self[0]).keys()
+			for newHeader in newHeaders:
 				self.__headers[newHeader] = DataColumn(self, newHeader)
 			for row in self.__data:
 				row += other(row)
+			self._invalidateIndexes(*newHeaders)
 			return self
 		for header, value in other.items():
 			if header not in self.__headers:
@@ -279,31 +518,38 @@ Overwrites existing columns'''
 			else:
 				for row in self.__data:
 					row[header] = value
+			self._invalidateIndexes(header)
 		return self
 	extend = __and__ = _copyAndApplyOp(__iand__)
 	def __or__(self, other):
 		'''Pipes the DataTable into other
 	Calls other with an iterator for the rows in self'''
 		return other(iter(self))
-	def __removeColumn(self, header):
-		del self.__headers[header]
+	def __isHeader(self, header):
+		try:
+			return header in self.__headers
+		except TypeError:
+			return False
+	def __removeColumns(self, headers):
+		for header in headers:
+			del self.__headers[header]
+			self.dropIndex(header)
+		if self.__shared:
+			self._beforeWrite(list(self.__headers.keys()))
+			return
 		for row in self.__data:
-			del row[header]
+			for header in headers:
+				del row[header]
 	def __ixor__(self, other):
 		'''remove column(s) from the data tabel'''
 		if not self.__data:
 			return self
 		if '__call__' in dir(other):
-			for column in list(self.__headers.values()):
-				if other(column):
-					self.__removeColumn(column.header)
+			self.__removeColumns([column.header for column in list(self.__headers.values()) if other(column)])
 			return self
-		if other in self.__headers:
+		if self.__isHeader(other):
 			other = [other]
-		for key in other:
-			if key not in self.__headers:
-				continue
-			self.__removeColumn(key)
+		self.__removeColumns([key for key in set(other) if key in self.__headers])
 		return self
 	exclude = __xor__ = _copyAndApplyOp(__ixor__)
 	def __itruediv__(self, other):
@@ -311,16 +557,11 @@ Overwrites existing columns'''
 		if not self.__data:
 			return self
 		if '__call__' in dir(other):
-			for column in list(self.__headers.values()):
-				if not other(column):
-					self.__removeColumn(column.header)
+			self.__removeColumns([column.header for column in list(self.__headers.values()) if not other(column)])
 			return self
-		if other in self.__headers:
+		if self.__isHeader(other):
 			other = [other]
-		for key in list(self.__headers.keys()):
-			if key in other:
-				continue
-			self.__removeColumn(key)
+		self.__removeColumns([key for key in self.__headers.keys() if key not in other])
 		return self
 	project = __truediv__ = _copyAndApplyOp(__itruediv__)
 	def removeBlankColumns(self):
@@ -337,23 +578,54 @@ Overwrites existing columns'''
 					return
 		return self.exclude(headers)
 	def sort(self, *fields):
-		def key(row):
-			return tuple(sortKey(row.get(field, None)) for field in fields)
-		self.__data.sort(key=key)
+		self.__data.sort(key=_rowSortKey(fields))
+		self._invalidateIndexes()
 	sorted = _copyAndApplyOp(sort)
 	sorted.__doc__ = '''returns a new copy of the data table sorted'''
-	def iterBucket(self, *fields):
-		copy = self.sorted(*fields)
+	def __view(self, rows):
+		'''creates a copy-on-write DataTable sharing the given rows of this table'''
+		table = DataTable(copyOnWrite=True, compact=self.__compact)
+		if rows:
+			table.__headers = {h: DataColumn(table, h) for h in self.__headers}
+			table.__data = rows
+			table.__shared = True
+		return table
+	def iterBucket(self, *fields, ordered=True, views=False):
+		'''Yields (bucket, DataTable of rows matching that bucket) for each distinct combination of values in the given fields
+	ordered - yield the buckets in sorted order (if false, the rows are grouped by hashing in a single pass, and the buckets are yielded in order of first appearance)
+		if the table is already sorted on the fields, the rows are grouped as they are without sorting a copy
+	views - yield copy-on-write tables sharing the rows of this table, rather than copying the rows of each bucket
+		(this table also becomes copy-on-write shared, so changing the contents of either side copies its rows first)'''
+		if views and self.__data:
+			self.__shared = True
+			makeBucket = self.__view
+		else:
+			makeBucket = DataTable
+		if not ordered:
+			buckets = {}
+			for data in self.__data:
+				key = tuple(data[field] for field in fields)
+				if key in buckets:
+					buckets[key].append(data)
+				else:
+					buckets[key] = [data]
+			for key, bucket in buckets.items():
+				yield key, makeBucket(bucket)
+			return
+		rows = self.__data
+		sortedKey = _rowSortKey(fields)
+		if not isSorted(rows, sortedKey):
+			rows = sorted(rows, key=sortedKey)
 		currentKey = None
 		currentBucket = []
-		for data in copy:
+		for data in rows:
 			key = tuple(data[field] for field in fields)
 			if currentKey is not None and key != currentKey:
-				yield currentKey, DataTable(currentBucket)
+				yield currentKey, makeBucket(currentBucket)
 				currentBucket = []
 			currentKey = key
 			currentBucket.append(data)
-		yield currentKey, DataTable(currentBucket)
+		yield currentKey, makeBucket(currentBucket)
 	def sizeOfBuckets(self, *fields):
 		'''Returns a dict of bucket -> number of items in the bucket'''
 		buckets = defaultdict(lambda:0)
@@ -368,13 +640,14 @@ Overwrites existing columns'''
 			key = tuple(data[field] for field in fields)
 			buckets[key].append(data)
 		return AttributeDict((key, DataTable(bucket)) for key, bucket in buckets.items())
-	def filterBucket(self, predicate, *fields):
+	def filterBucket(self, predicate, *fields, ordered=True):
 		'''Filter the datatable using an aggregate predicate
 fields specifies how the data will be grouped
 predicate is a method which takes a bucket of data and returns if the bucket should be included in the result
+ordered - as for iterBucket, if false the result has the buckets in order of first appearance instead of sorted order
 '''
-		return DataTable.collect(bucket for key, bucket in self.iterBucket(*fields) if predicate(bucket))
-	def join(self, other, joinParams=None, otherFieldPrefix='', joinType=JoinType.LEFT_OUTER_JOIN):
+		return DataTable.collect(bucket for key, bucket in self.iterBucket(*fields, ordered=ordered) if predicate(bucket))
+	def join(self, other, joinParams=None, otherFieldPrefix='', joinType=JoinType.LEFT_OUTER_JOIN, expectedUnique=False, algorithm='hash'):
 		'''
 dataTable.join(otherTable, joinParams, otherFieldPrefix='')
 	returns a new table with rows in the first table joined with rows in the second table, using joinParams to map fields in the first to fields in the second
@@ -383,11 +656,19 @@ Parameters:
 	joinParams - a dictionary of <field in self> to <field in other>. Defaults to "natural join", merging common headers
 	otherFieldPrefix - a string to prepend to the fields added from the second table
 	joinType - the instance of JoinType which indicates if items should be included in one data table which aren't in the other
+	expectedUnique - the join fields are unique in other (e.g. looking rows up by primary key), which allows a faster lookup;
+		raises a DataTableException if they aren't
+	algorithm - one of:
+		'hash' - index the smaller table by its join fields; rows are in the order of this table
+		'merge' - sort-merge join (tables which aren't already sorted on their join fields are sorted first);
+			rows are in join field order and join fields match by sortKey (values of different types never match)
 		'''
 		if joinParams is None:
 			joinParams = {h: h for h in self.headers() if h in other.headers()}
 		elif not isinstance(joinParams, dict):
 			raise Exception("joinParams must be a dictionary of <field in self> to <field in other>")
+		if algorithm not in ('hash', 'merge'):
+			raise DataTableException("Unknown join algorithm: %r.  Expected 'hash' or 'merge'" % (algorithm,))
 
 		if not other:
 			if not self or not joinType.leftOuter:
@@ -402,37 +683,19 @@ Parameters:
 					other.renameColumn(header, otherFieldPrefix + header)
 			return other & {header: None for header in self.headers() if header not in joinParams}
 
-		newHeaders = [h for h in other.headers() if h not in joinParams.values()]
-
-		otherBuckets = other.bucket(*joinParams.values())
-		def tempJoin():
-			seenKeys = set()
-			for row in self:
-				newRow = dict(row)
-				key = tuple(row[field] for field in joinParams.keys())
-				seenKeys.add(key)
-				if key not in otherBuckets:
-					if joinType.leftOuter:
-						for header in newHeaders:
-							newRow[otherFieldPrefix+header] = None
-						yield newRow
-					continue
-				otherRows = otherBuckets[key]
-				for otherRow in otherRows:
-					for header in newHeaders:
-						newRow[otherFieldPrefix+header] = otherRow[header]
-					yield dict(newRow)
-			if joinType.rightOuter:
-				joinParamReversed = {v: k for k,v in joinParams.items()}
-				for otherRow in other:
-					key = tuple(otherRow[field] for field in joinParams.values())
-					if key not in seenKeys:
-						newRow = {joinParamReversed[k] if k in joinParamReversed else otherFieldPrefix+k: v for k, v in otherRow.items()}
-						for header in self.headers():
-							if header not in joinParams:
-								newRow[header] = None
-						yield newRow
-		return DataTable(tempJoin())
+		if algorithm == 'merge':
+			left, right = self.__data, list(other)
+			leftKey, rightKey = sortedKeyGetter(list(joinParams.keys())), sortedKeyGetter(list(joinParams.values()))
+			if not isSorted(left, leftKey):
+				left = sorted(left, key=leftKey)
+			if not isSorted(right, rightKey):
+				right.sort(key=rightKey)
+			rows = list(mergeJoin(left, right, joinParams, self.headers(), other.headers(), otherFieldPrefix, joinType, expectedUnique))
+		else:
+			rows = list(hashJoin(self, other, joinParams, self.headers(), other.headers(), otherFieldPrefix, joinType,
+					expectedUnique=expectedUnique, buildLeft=len(self) < len(other)))
+		return DataTable._fromRows(rows, joinedHeaders(self.headers(), other.headers(), joinParams, otherFieldPrefix),
+				self.__copyOnWrite, self.__compact)
 	def writeTo(self, fileName, *headers):
 		'''Write the contents of this DataTable to a file with the given name in the standard csv format'''
 		if not headers:
@@ -488,45 +751,56 @@ or a method which takes a table (this table) and the row index and returns the c
 				row['Field'] = column.header
 				yield row
 		return DataTable(tempIterRows())
-	def aggregate(self, groupBy, aggregations={}):
+	def aggregate(self, groupBy, aggregations={}, workers=None, chunkSize=50000):
 		'''return an aggregation of the data grouped by a given set of fields.
 Parameters:
 	groupBy - the set of fields to group
 	aggregations - a dict of field name -> aggregate method, where the method takes an intermediate DataTable
 		and returns the value for that field for that row.
+	workers - if more than 1, the rows are aggregated in chunks of chunkSize rows by a pool of that many processes
+		and the partial results combined (the aggregate methods must implement merge and be picklable - see datatable_aggregate)
 		'''
 		if not aggregations:
 			return self.project(groupBy).distinct()
-		accumulatedRows = {}
-		for row in self:
-			key = tuple(row[field] for field in groupBy)
-			if key not in accumulatedRows:
-				accumulatedRows[key] = {a: agg.newBucket(row) for a, agg in aggregations.items()}
-			accRow = accumulatedRows[key]
-			for a, agg in aggregations.items():
-				accRow[a] = agg.addRow(row, accRow[a])
-		newData = []
-		for key, accRow in sorted(accumulatedRows.items()):
-			newData.append(AttributeDict(zip(groupBy, key)) + {a: agg.finalize(accRow[a]) for a, agg in aggregations.items()})
-		return DataTable(newData)
+		if workers and workers > 1:
+			accumulatedRows = aggregateParallel(self.__data, groupBy, aggregations, workers, chunkSize)
+		else:
+			accumulatedRows = accumulate(self.__data, groupBy, aggregations)
+		return DataTable(list(finalizeRows(accumulatedRows, groupBy, aggregations)))
 	def renameColumn(self, column, newName):
 		'''rename the column in place'''
+		self._beforeWrite()
 		for row in self:
 			v = row[column]
 			del row[column]
 			row[newName] = v
 		del self.__headers[column]
 		self.__headers[newName] = DataColumn(self, newName)
+		self.dropIndex(newName)
+		for key in list(self.__indexes.keys()):
+			if key[0] == column:
+				self.__indexes[newName, key[1]] = self.__indexes.pop(key)
 	def minRow(self, *fields):
 		'''return the row with the minimum value(s) in the given field(s)'''
 		if not self:
 			return None
-		return self.sorted(*fields)[0]
+		if len(fields) == 1 and self._index(fields[0], 'sorted') is not None:
+			return self.column(fields[0]).minRow()
+		return _copyRows([min(self.__data, key=_rowSortKey(fields))])[0]
 	def maxRow(self, *fields):
 		'''return the row with the maximum value(s) in the given field(s)'''
 		if not self:
 			return None
-		return self.sorted(*fields)[-1]
+		if len(fields) == 1 and self._index(fields[0], 'sorted') is not None:
+			return self.column(fields[0]).maxRow()
+		return _copyRows([max(reversed(self.__data), key=_rowSortKey(fields))])[0]
+	def topK(self, k, *fields, descending=False):
+		'''returns a new DataTable with the k rows with the smallest (or largest, if descending) value(s) in the given field(s), in that order
+	rows with equal values keep their order in this table (for descending too, unlike reversing sorted(*fields)),
+	and only k rows are kept in a heap instead of sorting the whole table'''
+		rows = (heapq.nlargest if descending else heapq.nsmallest)(k, self.__data, key=_rowSortKey(fields))
+		# _fromRows copies compact rows itself
+		return DataTable._fromRows(rows if self.__compact else _copyRows(rows), self.headers(), self.__copyOnWrite, self.__compact)
 
 def diffToTable(diffResults, keyHeaders):
 	data = []
@@ -1,6 +1,13 @@
 '''Set of aggregations to be used with DataTable's aggregate method
 You are welcome to define your own classes, so long as they conform to the AggregateMethod interface
+Aggregations which implement merge (and can be pickled) may also be used to aggregate in parallel - see aggregateParallel
 '''
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+import pickle
+from datatable_util import AttributeDict, DataTableException
+from datatable_join import sortedKeyGetter
 
 def first(it):
 	try:
@@ -27,6 +34,12 @@ class AggregateMethod(object):
 	Override this to perform final calculations on the accumulated values to produce the final result (calculate averages, convert intermediate values into final results, etc.)
 		'''
 		return accumValue
+	def merge(self, accumValueA, accumValueB):
+		'''called when aggregating in parallel to combine the accumulated values for the same aggregate key from two partitions of the rows,
+	where the rows of accumValueA came before the rows of accumValueB.  The result is treated like the result of addRow
+	Override this to allow the aggregation to be run in parallel (add the sums, union the sets, etc.)
+		'''
+		raise NotImplementedError("%s doesn't support merging partial aggregations" % type(self).__name__)
 
 class SingleFieldAggregateMethod(AggregateMethod):
 	def __init__(self, field):
@@ -46,23 +59,30 @@ def makeAggMethod(fn):
 
 class First(SingleFieldAggregateMethod):
 	# relies on the default implementation of SingleFieldAggregateMethod which is 
-	pass
+	def merge(self, accumValueA, accumValueB):
+		return accumValueA
 
 class FirstNonBlank(SingleFieldAggregateMethod):
 	def addRow(self, row, accumValue):
 		return accumValue or row[self.field]
+	def merge(self, accumValueA, accumValueB):
+		return accumValueA or accumValueB
 
 class Sum(SingleFieldAggregateMethod):
 	def newBucket(self, row):
 		return 0
 	def addRow(self, row, accumValue):
 		return accumValue + row[self.field]
+	def merge(self, accumValueA, accumValueB):
+		return accumValueA + accumValueB
 
 class Count(AggregateMethod):
 	def newBucket(self, row):
 		return 0
 	def addRow(self, row, accumValue):
 		return accumValue + 1
+	def merge(self, accumValueA, accumValueB):
+		return accumValueA + accumValueB
 
 class CountDistinct(SingleFieldAggregateMethod):
 	'''Count the number of distinct values in a given field'''
@@ -71,6 +91,8 @@ class CountDistinct(SingleFieldAggregateMethod):
 	def addRow(self, row, accumValue):
 		accumValue.add(row[self.field])
 		return accumValue
+	def merge(self, accumValueA, accumValueB):
+		return accumValueA | accumValueB
 	def finalize(self, accumValue):
 		return len(accumValue)
 
@@ -81,6 +103,8 @@ class DistinctValues(SingleFieldAggregateMethod):
 	def addRow(self, row, accumValue):
 		accumValue.add(row[self.field])
 		return accumValue
+	def merge(self, accumValueA, accumValueB):
+		return accumValueA | accumValueB
 
 class AllValues(SingleFieldAggregateMethod):
 	'''return a list (in current order) of values for a given field'''
@@ -89,6 +113,8 @@ class AllValues(SingleFieldAggregateMethod):
 	def addRow(self, row, accumValue):
 		accumValue.append(row[self.field])
 		return accumValue
+	def merge(self, accumValueA, accumValueB):
+		return accumValueA + accumValueB
 
 class ConcatDistinct(AggregateMethod):
 	'''String-concatenate the distinct set of values using the given string to join the values'''
@@ -100,6 +126,8 @@ class ConcatDistinct(AggregateMethod):
 	def addRow(self, row, accumValue):
 		accumValue.add(row[self.field])
 		return accumValue
+	def merge(self, accumValueA, accumValueB):
+		return accumValueA | accumValueB
 	def finalize(self, accumValue):
 		return self.joinStr.join(accumValue)
 
@@ -114,6 +142,12 @@ class Concat(AggregateMethod):
 		if not accumValue:
 			return row[self.field]
 		return accumValue + self.joinStr + row[self.field]
+	def merge(self, accumValueA, accumValueB):
+		if not accumValueA:
+			return accumValueB
+		if not accumValueB:
+			return accumValueA
+		return accumValueA + self.joinStr + accumValueB
 	def finalize(self, accumValue):
 		return accumValue
 
@@ -121,6 +155,8 @@ class Value(SingleFieldAggregateMethod):
 	'''returns the given value'''
 	def newBucket(self, row):
 		return self.field
+	def merge(self, accumValueA, accumValueB):
+		return accumValueA
 
 class Average(SingleFieldAggregateMethod):
 	'''returns the average value for a given field'''
@@ -128,6 +164,8 @@ class Average(SingleFieldAggregateMethod):
 		return (0, 0)
 	def addRow(self, row, accumValue):
 		return (accumValue[0] + row[self.field], accumValue[1] + 1)
+	def merge(self, accumValueA, accumValueB):
+		return (accumValueA[0] + accumValueB[0], accumValueA[1] + accumValueB[1])
 	def finalize(self, accumValue):
 		return accumValue[0] / accumValue[1]
 
@@ -141,6 +179,8 @@ class WeightedAverage(AggregateMethod):
 	def addRow(self, row, accumValue):
 		weighting, totalWeight = accumValue
 		return weighting + row[self.averageField] * row[self.weightField], totalWeight + row[self.weightField]
+	def merge(self, accumValueA, accumValueB):
+		return accumValueA[0] + accumValueB[0], accumValueA[1] + accumValueB[1]
 	def finalize(self, accumValue):
 		weighting, totalWeight = accumValue
 		return weighting / totalWeight
@@ -148,10 +188,14 @@ class WeightedAverage(AggregateMethod):
 class Min(SingleFieldAggregateMethod):
 	def addRow(self, row, accumValue):
 		return accumValue if accumValue < row[self.field] else row[self.field]
+	def merge(self, accumValueA, accumValueB):
+		return accumValueA if accumValueA < accumValueB else accumValueB
 
 class Max(SingleFieldAggregateMethod):
 	def addRow(self, row, accumValue):
 		return accumValue if accumValue > row[self.field] else row[self.field]
+	def merge(self, accumValueA, accumValueB):
+		return accumValueA if accumValueA > accumValueB else accumValueB
 
 class Span(SingleFieldAggregateMethod):
 	'''return the difference between the greatest and the least'''
@@ -160,7 +204,103 @@ class Span(SingleFieldAggregateMethod):
 	def addRow(self, row, accumValue):
 		minValue, maxValue = accumValue
 		return minValue if minValue < row[self.field] else row[self.field], maxValue if maxValue > row[self.field] else row[self.field]
+	def merge(self, accumValueA, accumValueB):
+		(minA, maxA), (minB, maxB) = accumValueA, accumValueB
+		return minA if minA < minB else minB, maxA if maxA > maxB else maxB
 	def finalize(self, accumValue):
 		minValue, maxValue = accumValue
 		return minValue - maxValue
 
+
+def accumulate(rows, groupBy, aggregations, accumulatedRows=None):
+	'''accumulates the rows into (and returns) a dict of group key -> {aggregation name: accumulated value}'''
+	if accumulatedRows is None:
+		accumulatedRows = {}
+	for row in rows:
+		key = tuple(row[field] for field in groupBy)
+		if key not in accumulatedRows:
+			accumulatedRows[key] = {a: agg.newBucket(row) for a, agg in aggregations.items()}
+		accRow = accumulatedRows[key]
+		for a, agg in aggregations.items():
+			accRow[a] = agg.addRow(row, accRow[a])
+	return accumulatedRows
+
+def mergeAccumulated(accumulatedRows, otherAccumulatedRows, aggregations):
+	'''merges the accumulated values from the later rows in otherAccumulatedRows into accumulatedRows (and returns it)'''
+	for key, otherAccRow in otherAccumulatedRows.items():
+		if key not in accumulatedRows:
+			accumulatedRows[key] = otherAccRow
+			continue
+		accRow = accumulatedRows[key]
+		for a, agg in aggregations.items():
+			accRow[a] = agg.merge(accRow[a], otherAccRow[a])
+	return accumulatedRows
+
+def accumulateSorted(rows, groupBy, aggregations, strict=True):
+	'''
+	yields (group key, {aggregation name: accumulated value}) for each run of rows with the same group key, as soon as the run ends,
+	for rows which are already sorted on the groupBy fields (by sortKey, as DataTable.sort does), so only one group is held at a time
+strict - raise a DataTableException if a group's key sorts before the previous group's (e.g. the rows aren't sorted, or a group is split),
+	otherwise each run of rows with the same key is yielded as a group of its own
+	'''
+	sortedKey = sortedKeyGetter(groupBy)
+	currentKey = None
+	currentOrder = None
+	accRow = None
+	for row in rows:
+		key = tuple(row[field] for field in groupBy)
+		if accRow is None or key != currentKey:
+			if strict:
+				order = sortedKey(row)
+				if accRow is not None and order < currentOrder:
+					raise DataTableException("rows aren't sorted on %s: %r follows %r" % (', '.join(map(str, groupBy)), key, currentKey))
+				currentOrder = order
+			if accRow is not None:
+				yield currentKey, accRow
+			currentKey = key
+			accRow = {a: agg.newBucket(row) for a, agg in aggregations.items()}
+		for a, agg in aggregations.items():
+			accRow[a] = agg.addRow(row, accRow[a])
+	if accRow is not None:
+		yield currentKey, accRow
+
+def finalizeRow(key, accRow, groupBy, aggregations):
+	'''returns the resulting row for a group key and its accumulated values'''
+	return AttributeDict(zip(groupBy, key)) + {a: agg.finalize(accRow[a]) for a, agg in aggregations.items()}
+
+def finalizeRows(accumulatedRows, groupBy, aggregations):
+	'''yields the resulting rows (in group key order) for the accumulated values'''
+	for key, accRow in sorted(accumulatedRows.items()):
+		yield finalizeRow(key, accRow, groupBy, aggregations)
+
+def _accumulateChunk(rows, groupBy, aggregations):
+	return accumulate(rows, groupBy, aggregations)
+
+def aggregateParallel(rows, groupBy, aggregations, workers, chunkSize=50000):
+	'''
+	accumulates the rows into a dict of group key -> {aggregation name: accumulated value} using a pool of worker processes
+Rows are split into chunks of chunkSize rows, each accumulated by a worker, and the partial results are combined (in row order)
+	with each aggregation's merge method.  At most 2 chunks per worker are in flight at a time.
+The aggregations must implement merge and, like the rows, must be picklable (e.g. classes defined at module level rather than lambdas)
+	'''
+	for a, agg in aggregations.items():
+		if type(agg).merge is AggregateMethod.merge:
+			raise DataTableException("Can't aggregate %r in parallel: %s doesn't implement merge" % (a, type(agg).__name__))
+	try:
+		pickle.dumps(aggregations)
+	except Exception as e:
+		raise DataTableException("Can't aggregate in parallel: the aggregations can't be pickled to send to the worker processes (%s)" % e)
+	rows = iter(rows)
+	accumulatedRows = {}
+	with ProcessPoolExecutor(max_workers=workers) as executor:
+		pending = deque()
+		while True:
+			while len(pending) < 2 * workers:
+				chunk = list(islice(rows, chunkSize))
+				if not chunk:
+					break
+				pending.append(executor.submit(_accumulateChunk, chunk, groupBy, aggregations))
+			if not pending:
+				break
+			mergeAccumulated(accumulatedRows, pending.popleft().result(), aggregations)
+	return accumulatedRows
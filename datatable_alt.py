@@ -2,19 +2,32 @@
 alternate datatable implementation using dict of lists
 provides a proxy dict implementation which provides read+write-through access to the data by row
 '''
-from collections import defaultdict
-from datatable_util import AttributeDict, DataTableException, CSV_GivenHeaders, FIXEDWIDTH, JoinType, sortKey
+from collections import defaultdict, Counter
+from datatable_util import AttributeDict, RowFingerprints, DataTableException, CSV_GivenHeaders, FIXEDWIDTH, JoinType, sortKey
+from datatable_storage import KINDS, ColumnStorage, TypedStorage, SelectionStorage, DictionaryStorage, ChunkedStorage, DEFAULT_COMPACTION, columnKind, inferKind, canHold, makeStorage, fullStorage, mergeChunks, select, gather, sortIndices
+from array import array
+from datatable_columnar import writeColumns, readColumns
+from datatable_expr import Expr, evaluate, toIndices, toStorage
 from hierarchies import Hierarchy
+import heapq
 import os
 from functools import total_ordering
+from itertools import chain, repeat
 
 @total_ordering
 class DataColumn(object):
 	def __init__(self, dataTable, header, data=[]):
+		'''creates a column of dataTable from the header's values (if header is another DataColumn),
+	or with the given header and data, which may be a sequence of values, a sequence of rows (taking the values for this header)
+	or a ColumnStorage (see datatable_storage), which is shared rather than copied'''
 		self.__dataTable = dataTable
+		self.__shared = False
 		if isinstance(header, DataColumn):
 			self.header = header.header
-			self.__data = list(header.__data)
+			self.__data = header.__data.copy() if isinstance(header.__data, ColumnStorage) else list(header.__data)
+		elif isinstance(data, ColumnStorage):
+			self.header = header
+			self.__data = data
 		else:
 			self.header = header
 			self.__data = []
@@ -29,7 +42,7 @@ class DataColumn(object):
 	def __eq__(self, other):
 		if not isinstance(other, DataColumn):
 			return False
-		return self.__data == other.__data
+		return len(self) == len(other) and all(a == b for a, b in zip(self.__data, other.__data))
 	def __lt__(self, other):
 		if not isinstance(other, DataColumn) or self.__dataTable is not other.__dataTable:
 			raise NotImplemented()
@@ -41,34 +54,160 @@ class DataColumn(object):
 	def __getitem__(self, index):
 		'''Gets the index'th row of data'''
 		return self.__data[index]
+	def __setitem__(self, index, value):
+		'''Sets the index'th row of data'''
+		if isinstance(self.__data, SelectionStorage):
+			self.compact()
+		elif self.__shared and isinstance(self.__data, ColumnStorage):
+			self.__data = self.__data.copy()
+			self.__shared = False
+		if isinstance(self.__data, ColumnStorage) and self.__data.setValue(index, value):
+			return
+		self.__writableData()[index] = value
+	def __writableData(self):
+		'''returns the list of values, first copying the values out of any storage which can't be changed in place
+	(or copying the list if it is shared with a view)'''
+		if isinstance(self.__data, ColumnStorage):
+			self.__data = list(self.__data)
+		elif self.__shared:
+			self.__data = list(self.__data)
+		self.__shared = False
+		return self.__data
+	def _sortData(self):
+		'''returns the values (a list or ColumnStorage) for datatable_storage.sortIndices to sort by'''
+		return self.__data
+	def _gather(self, indices):
+		'''returns the values at the given indices (an array('q')) in new storage of the same kind, with None where the index is -1'''
+		return gather(self.__data, indices)
+	def _view(self, indices, composed=None):
+		'''returns a SelectionStorage of the values at the given indices (a range or array('q')), which shares this column's values
+	(which are then copied before this column is next changed in place)
+	composed - dict passed to datatable_storage.select, to share the composed index vectors between the columns of a table'''
+		self.__shared = True
+		return select(self.__data, indices, composed)
+	def compact(self):
+		'''if this column is a view of another column's values (see DataTable.select), copies the selected values into storage of its own;
+	if it is held in chunks (see _append), merges the chunks into one
+	returns the column'''
+		if isinstance(self.__data, SelectionStorage):
+			self.__data = self.__data.compact()
+			self.__shared = False
+		elif isinstance(self.__data, ChunkedStorage):
+			# a single chunk may be shared with other columns, so is copied before it's next changed in place
+			self.__shared = len(self.__data.chunks) == 1
+			self.__data = self.__data.merged()
+		return self
+	def _freeze(self):
+		'''makes the values an immutable chunk (if they are held in a list or an array) so that they may be shared without copying'''
+		if isinstance(self.__data, list) or (isinstance(self.__data, ColumnStorage) and self.__data.writable()):
+			self.__data = ChunkedStorage([self.__data])
+			self.__shared = False
+	def _chunks(self):
+		'''returns the values as a list of immutable chunks (lists or ColumnStorages)'''
+		self._freeze()
+		if isinstance(self.__data, ChunkedStorage):
+			return list(self.__data.chunks)
+		return [self.__data]
+	def _append(self, values, policy=DEFAULT_COMPACTION):
+		'''appends the values (a chunk, which must not be changed afterwards) to this column without copying its existing values
+	values are stored in the same kind of storage as the column if they fit, and the chunks are merged according to the CompactionPolicy'''
+		kind = self.kind()
+		if isinstance(values, list) and kind != 'object' and (canHold(kind, columnKind(values)) or all(value is None for value in values)):
+			values = makeStorage(values, kind)
+		self._freeze()
+		data = self.__data if isinstance(self.__data, ChunkedStorage) else ChunkedStorage([self.__data])
+		self.__data = data.appended(values, policy)
+	@staticmethod
+	def _adopt(dataTable, header, data):
+		'''creates a column of dataTable which takes ownership of data (a list of values or a ColumnStorage) without copying it'''
+		column = DataColumn(dataTable, header)
+		column.__data = data
+		return column
+	def storage(self):
+		'''returns the ColumnStorage holding the values, or None if they are held in a list'''
+		return self.__data if isinstance(self.__data, ColumnStorage) else None
+	def kind(self):
+		'''returns the kind of storage holding the values ('int64', 'float64', 'bool', 'string', 'category'), or 'object' for a list'''
+		return self.__data.kind if isinstance(self.__data, ColumnStorage) else 'object'
+	def setType(self, kind=None):
+		'''
+	Changes the storage of the values in place:
+		'int64', 'float64', 'bool' - an array (plus a null bitmap), for columns holding only int/float/bool values (or None)
+		'string' - utf-8 encoded into a single buffer, for columns holding only str values (or None)
+		'category' - dictionary encoded: the distinct str values plus an int code per row, for str columns with few distinct values
+			(filters and sizeOfGroups then work on the codes, and the hash of each distinct value is only computed once)
+		'object' - a list of the values (the default storage, which can hold anything)
+	kind defaults to the most compact one which can hold the current values (see datatable_storage.inferKind)
+	raises a DataTableException if the values can't all be stored as the given kind
+	returns the column'''
+		values = self.__data if isinstance(self.__data, list) else list(self.__data)
+		actualKind = columnKind(values)
+		if kind is None:
+			kind = inferKind(values)
+		elif kind not in KINDS:
+			raise DataTableException("Unknown column kind %r, expected one of %s" % (kind, ', '.join(KINDS)))
+		elif kind != 'object' and not canHold(kind, actualKind) and any(value is not None for value in values):
+			raise DataTableException("Column %r has values which can't be stored as %s" % (self.header, kind))
+		storage = makeStorage(values, kind)
+		if storage is not None or values is not self.__data:
+			self.__data = values if storage is None else storage
+			self.__shared = False
+		return self
+	def _encodeCategories(self):
+		'''stores the values dictionary encoded (as setType('category')) if they are str values with few distinct values (see datatable_storage.inferKind)'''
+		data = self.__data
+		if isinstance(data, list) and type(next((value for value in data if value is not None), None)) is str and inferKind(data) == 'category':
+			self.__data = makeStorage(data, 'category')
+			self.__shared = False
+	def take(self, indices):
+		'''returns the values at the given indices, as a ColumnStorage of the same kind if this column has one, otherwise as a list'''
+		if isinstance(self.__data, ColumnStorage):
+			return self.__data.take(indices)
+		data = self.__data
+		return [data[i] for i in indices]
 	def __contains__(self, value):
 		return value in self.__data
 	def __filter(self, value):
-		if value is None:
-			for i in range(len(self)):
-				if self[i] is None:
+		if isinstance(self.__data, TypedStorage) and (value is None or type(value) in (int, float, bool)):
+			yield from self.__data.indicesOf(value)
+		elif isinstance(self.__data, DictionaryStorage) and not isinstance(value, DataColumn) and not hasattr(value, '__call__') and ('__contains__' not in dir(value) or isinstance(value, str)):
+			yield from self.__data.indicesOf(value)
+		elif getattr(self.__data, 'encoded', False) and not isinstance(value, DataColumn):
+			# dictionary encoded: evaluate the criteria once per distinct value
+			if hasattr(value, '__call__'):
+				matches = self.__data.mapValues(value)
+			elif value is None or ('__contains__' not in dir(value) or isinstance(value, str)):
+				matches = self.__data.mapValues(lambda v: v == value)
+			else:
+				matches = self.__data.mapValues(lambda v: v in value)
+			for i, match in enumerate(matches):
+				if match:
+					yield i
+		elif value is None:
+			for i, v in enumerate(self.__data):
+				if v is None:
 					yield i
 		elif isinstance(value, DataColumn):
 			if value.__dataTable == self.__dataTable:
-				for i in range(len(self)):
-					if self[i] == value[i]:
+				for i, (v, other) in enumerate(zip(self.__data, value.__data)):
+					if v == other:
 						yield i
 			else:
 				otherValues = set(value)
-				for i in range(len(self)):
-					if self[i] in otherValues:
+				for i, v in enumerate(self.__data):
+					if v in otherValues:
 						yield i
 		elif '__call__' in dir(value):
-			for i in range(len(self)):
-				if value(self[i]):
+			for i, v in enumerate(self.__data):
+				if value(v):
 					yield i
 		elif '__contains__' in dir(value) and not isinstance(value, str):
-			for i in range(len(self)):
-				if self[i] in value:
+			for i, v in enumerate(self.__data):
+				if v in value:
 					yield i
 		else:
-			for i in range(len(self)):
-				if self[i] == value:
+			for i, v in enumerate(self.__data):
+				if v == value:
 					yield i
 	def filter(self, value):
 		'''
@@ -88,25 +227,35 @@ Value may be one of the following:
 	If value is a function then sets each item to the result of calling value on the item
 	returns the modified datatable
 '''
+		kind = self.kind()
+		self.__shared = False
 		if hasattr(value, '__call__'):
 			self.__data = [value(data) for data in self]
+			if kind != 'object':
+				self.setType()
+		elif kind != 'object' and (value is None or canHold(kind, columnKind([value]))):
+			self.__data = fullStorage(kind, value, len(self))
 		else:
 			self.__data = [value] * len(self)
 		return self.__dataTable
 	def sort(self):
 		self.__dataTable.sort(self.header)
 	def sizeOfGroups(self):
+		if isinstance(self.__data, DictionaryStorage):
+			dictionary = self.__data.dictionary + [None]
+			return {dictionary[code]: count for code, count in Counter(self.__data.codes).items()}
 		groups = defaultdict(lambda:0)
 		for v in self:
 			groups[v] += 1
 		return dict(groups)
 	def fillDownBlanks(self):
+		data = self.__writableData()
 		prev = None
-		for i in range(len(self.__data)):
-			if self.__data[i]:
-				prev = self.__data[i]
+		for i in range(len(data)):
+			if data[i]:
+				prev = data[i]
 			elif prev:
-				self.__data[i] = prev
+				data[i] = prev
 	def __repr__(self):
 		return "DataColumn(<dataTable>, '%s')" % self.header
 	def __str__(self):
@@ -132,6 +281,63 @@ def _copyAndApplyOp(op):
 	copyOp.__doc__ = op.__doc__
 	return copyOp
 
+def _joinKeys(columns, length):
+	'''returns an iterator over the join key of each row (the bare value for a single field, otherwise a tuple)'''
+	if not columns:
+		return repeat((), length)
+	if len(columns) == 1:
+		return iter(columns[0])
+	return zip(*columns)
+
+def _joinIndices(leftColumns, rightColumns, leftLength, rightLength, joinType):
+	'''
+	Hash joins the rows of two tables on their key columns, returning (leftIndices, rightIndices, rightOnly):
+		the array('q') index vectors of the left and right row of each output row (-1 where there isn't a row on that side),
+		and the position of the first unmatched right row (these are all at the end).
+	The output is in the order of the left rows (each followed by its matches in the order of the right rows), followed by the unmatched right rows in their original order.
+	Dictionary encoded key columns are matched by their codes, hashing each distinct value once rather than once per row.
+	'''
+	leftStorages = [c.storage() for c in leftColumns]
+	rightStorages = [c.storage() for c in rightColumns]
+	if len(leftColumns) == 1 and isinstance(leftStorages[0], DictionaryStorage) and isinstance(rightStorages[0], DictionaryStorage):
+		# translate the left codes to right codes (None for values not on the right; None always has code -1)
+		translate = [rightStorages[0].code(value) for value in leftStorages[0].dictionary]
+		translate.append(-1)
+		leftKeys = map(translate.__getitem__, leftStorages[0].codes)
+		rightKeys = iter(rightStorages[0].codes)
+	else:
+		leftKeys = _joinKeys(leftColumns, leftLength)
+		rightKeys = _joinKeys(rightColumns, rightLength)
+	buckets = {}
+	for j, key in enumerate(rightKeys):
+		bucket = buckets.get(key)
+		if bucket is None:
+			buckets[key] = [j]
+		else:
+			bucket.append(j)
+	leftIndices = array('q')
+	rightIndices = array('q')
+	seenKeys = set()
+	for i, key in enumerate(leftKeys):
+		bucket = buckets.get(key)
+		if bucket is not None:
+			seenKeys.add(key)
+			if len(bucket) == 1:
+				leftIndices.append(i)
+				rightIndices.append(bucket[0])
+			else:
+				leftIndices.extend(repeat(i, len(bucket)))
+				rightIndices.extend(bucket)
+		elif joinType.leftOuter:
+			leftIndices.append(i)
+			rightIndices.append(-1)
+	rightOnly = len(leftIndices)
+	if joinType.rightOuter:
+		unmatched = sorted(chain.from_iterable(bucket for key, bucket in buckets.items() if key not in seenKeys))
+		leftIndices.extend(repeat(-1, len(unmatched)))
+		rightIndices.extend(unmatched)
+	return leftIndices, rightIndices, rightOnly
+
 class DataTable(object):
 	@staticmethod
 	def collect(tables):
@@ -142,26 +348,57 @@ table = tables.next()
 for t in tables:
 	table.augment(t)
 		'''
-		data = {}
+		chunks = {}
 		size = 0
 		for table in tables:
 			for column in table.columns():
-				if column.header not in data:
-					data[column.header] = [None]*size
-				data[column.header] += list(column)
-			for h in data.keys():
+				if column.header not in chunks:
+					chunks[column.header] = [[None] * size]
+				chunks[column.header] += column._chunks()
+			for h in chunks.keys():
 				if h not in table.headers():
-					data[h] += [None] * len(table)
+					chunks[h].append([None] * len(table))
 			size += len(table)
-		return DataTable(DataColumn(None, header, columnData) for header, columnData in data.items())
-	def __init__(self, data=None, parseMethod=None):
+		return DataTable._fromColumns({header: ChunkedStorage(columnChunks) for header, columnChunks in chunks.items()}, size)
+	def __init__(self, data=None, parseMethod=None, types=None, compaction=None):
 		'''Create a data table from the given data
 	data may be one of the following:
 A sequence of dictionaries, where all of the dictionaries share common keys
 A sequence of sequences where the first item is the list of headers
 Another DataTable instance, which will create a deep copy
 A string which may be parsed into one of the previous by calling parseMethod on the string.
+types - how to store the values of each column (see DataColumn.setType):
+	None - keep the storage of the columns of data (lists of values, unless data is a DataTable or DataColumns with typed storage)
+	'infer' - store each column in the most compact kind of storage which can hold its values (typed arrays for int/float/bool columns, etc)
+	a dict of header -> kind, for the kind of the given columns (other columns are inferred); use 'object' to keep a column in a list
+compaction - the datatable_storage.CompactionPolicy deciding when the chunks of values appended to the columns are merged
+	(defaults to that of data if it is a DataTable, otherwise datatable_storage.DEFAULT_COMPACTION)
 '''
+		if compaction is None:
+			compaction = data.__compaction if isinstance(data, DataTable) else DEFAULT_COMPACTION
+		self.__compaction = compaction
+		self._schemaVersion = 0
+		self.__headersVersion = None
+		fromRows = self.__init(data, parseMethod)
+		if types is None and fromRows:
+			for column in self.__headers.values():
+				column._encodeCategories()
+		elif types is not None:
+			for header, column in self.__headers.items():
+				column.setType(None if types == 'infer' else types.get(header))
+	@staticmethod
+	def _fromColumns(columns, length):
+		'''creates a DataTable which takes ownership of the given dict of header -> values (a list or ColumnStorage per column) without copying them'''
+		table = DataTable()
+		table.__headers = {header: DataColumn._adopt(table, header, data) for header, data in columns.items()}
+		table.__length = length
+		table.__schemaChanged()
+		return table
+	def __schemaChanged(self):
+		'''called when columns are added, removed or renamed: bumps the schema version, invalidating anything cached for the previous set of headers'''
+		self._schemaVersion += 1
+	def __init(self, data, parseMethod):
+		'''builds the columns from data, returning if they were built from rows (rather than copied from a DataTable or DataColumns)'''
 		if isinstance(data, DataTable):
 			self.__headers = {h: DataColumn(self, c) for h, c in data.__headers.items()}
 			self.__length = len(data)
@@ -189,15 +426,35 @@ A string which may be parsed into one of the previous by calling parseMethod on
 			data = [{headers[i]: row[i] for i in range(len(headers))} for row in data]
 			self.__headers = {h: DataColumn(self, h, data) for h in headers}
 		self.__length = len(data)
+		return True
 	def getRow(self, index):
 		return DataRowProxy(self, index)
+	def cursor(self):
+		'''Gets an iterator over the data rows which yields the same DataRowProxy for every row, moved on to the next row each time
+	for row-wise code which doesn't keep the rows it's given (e.g. filter and aggregate functions): this saves creating a proxy per row,
+	but a row is only valid until the iterator moves on (iterate the table itself to keep rows)'''
+		row = DataRowProxy(self, 0)
+		for i in range(len(self)):
+			row._moveTo(i)
+			yield row
 	def select(self, indices):
+		'''Returns a DataTable of the rows at the given indices (a slice or a sequence of row indices)
+	the result is a view: its columns refer to the values of this table's columns (through one shared index vector) rather than copying them;
+	selecting from a view composes the index vectors.  A view's column copies its values when it is changed (or with compact)'''
 		if isinstance(indices, slice):
 			start, stop, step = indices.indices(len(self)) #calculate the actual start, stop, step given the current length
 			indices = range(start, stop, step)
-		else:
-			indices = list(indices)
-		return DataTable(DataColumn(None, c.header, (c[i] for i in indices)) for c in self.__headers.values())
+		elif not isinstance(indices, (range, array)):
+			indices = array('q', indices)
+		composed = {}
+		return DataTable._fromColumns({h: c._view(indices, composed) for h, c in self.__headers.items()}, len(indices))
+	def compact(self):
+		'''copies the values of any columns which are views (see select) into storage of their own, so that they no longer refer to (and keep alive) the columns they were selected from,
+	and merges the chunks of any columns which have had rows appended to them into one
+	returns this table'''
+		for column in self.__headers.values():
+			column.compact()
+		return self
 	def __iter__(self):
 		'''Gets an iterator over the data rows'''
 		for i in range(len(self)):
@@ -216,17 +473,35 @@ A string which may be parsed into one of the previous by calling parseMethod on
 		return self.column(header)
 	def columns(self):
 		'''Returns the DataColumn objects associated with this DataTable'''
-		return sorted(self.__headers.values())
+		return [self.__headers[h] for h in self._sortedHeaders()]
 	def headers(self):
 		'''Returns this table's header strings'''
-		return sorted(self.__headers.keys(), key=sortKey)
+		return list(self._sortedHeaders())
+	def _sortedHeaders(self):
+		'''returns the headers in sorted order, cached until the schema next changes (the list must not be changed)'''
+		if self.__headersVersion != self._schemaVersion:
+			self.__sortedHeaders = sorted(self.__headers.keys(), key=sortKey)
+			self.__headersVersion = self._schemaVersion
+		return self.__sortedHeaders
+	def _columnMap(self):
+		'''returns the dict of header -> DataColumn (the table's own, which is changed in place as columns are added and removed)'''
+		return self.__headers
+	def where(self, expr):
+		'''Returns a DataTable containing the rows for which the column expression (see datatable_expr) is true, e.g.
+	dt.where((col('qty') > 5) & col('region').isin(regions))
+	the expression is evaluated over whole columns at a time, without creating a row for each line'''
+		return self.select(toIndices(evaluate(expr, self, len(self))))
 	def filter(self, filterFunction):
 		'''Returns a DataTable containing the lines in self filtered by the given filterFunciton
 	Accepts either a dictionary of header -> value which does exact matching on the pairs,
-	or a filter function which takes a dict as input and returns if that row should be included'''
+	a column expression (see where),
+	or a filter function which takes a dict as input and returns if that row should be included
+		(it's given a DataRowProxy for the row which is reused for the next row, see cursor)'''
+		if isinstance(filterFunction, Expr):
+			return self.where(filterFunction)
 		if isinstance(filterFunction, dict):
 			return self.select(i for i in range(len(self)) if all(self.column(k)[i] == v for k, v in filterFunction.items()))
-		return DataTable(line for line in self if filterFunction(line))
+		return self.select([i for i, line in enumerate(self.cursor()) if filterFunction(line)])
 	def __len__(self):
 		'''The number of rows'''
 		return self.__length
@@ -253,6 +528,7 @@ A string which may be parsed into one of the previous by calling parseMethod on
 			other = DataTable([other])
 		if not len(self):
 			return other
+		self._freeze()
 		selfNewHeaders = {h: None for h in other.headers() if h not in self.headers()}
 		otherNewHeaders = {h: None for h in self.headers() if h not in other.headers()}
 		return (self & selfNewHeaders) + (other & otherNewHeaders)
@@ -265,38 +541,58 @@ A string which may be parsed into one of the previous by calling parseMethod on
 			if self.headers() and other.headers() and self.headers() != other.headers():
 				raise DataTableException("headers don't match.  Expected: " + str(self.headers()) + "\nFound: " + str(other.headers()))
 			for h in self.headers():
-				self.__headers[h] = DataColumn(self, h, list(self.__headers[h]) + list(other.__headers[h]))
+				for chunk in other.__headers[h]._chunks():
+					self.__headers[h]._append(chunk, self.__compaction)
 			self.__length = self.__length + len(other)
 		elif isinstance(other, list):
 			if other and self.headers() != sorted(other[0].keys(), key=sortKey):
 				raise DataTableException("headers don't match.  Expected: " + str(self.headers()) + "\nFound: " + str(sorted(other[0].keys(), key=sortKey)))
 			for h in self.headers():
-				self.__headers[h] = DataColumn(self, h, list(self.__headers[h]) + [row[h] for row in other])
+				self.__headers[h]._append([row[h] for row in other], self.__compaction)
 			self.__length = self.__length + len(other)
 		elif isinstance(other, dict):
 			if self.headers() and other and self.headers() != sorted(other.keys(), key=sortKey):
 				raise DataTableException("headers don't match.  Expected: " + str(self.headers()) + "\nFound: " + str(sorted(other.keys(), key=sortKey)))
 			if other:
 				for h in self.headers():
-					self.__headers[h] = DataColumn(self, h, list(self.__headers[h]) + [other[h]])
+					self.__headers[h]._append([other[h]], self.__compaction)
 			self.__length = self.__length + 1
 		else:
 			print("other instance unknown: %s" % other.__class__)
 			raise NotImplemented()
 		return self
-	append = __add__ = _copyAndApplyOp(__iadd__)
-	def __isub__(self, other):
-		'''remove the rows from other that are in self - uses exact match of rows'''
-		if isinstance(other, dict):
+	def __add__(self, other):
+		'''returns a new DataTable with the rows of other appended to the rows of this table (see __iadd__)
+	the new table shares the existing values of this table's columns (as immutable chunks) rather than copying them'''
+		self._freeze()
+		newData = DataTable(self)
+		newData += other
+		return newData
+	append = __add__
+	def _freeze(self):
+		'''makes the values of the columns immutable chunks, so that copies of this table (and tables appended to it) can share them'''
+		for column in self.__headers.values():
+			column._freeze()
+	def __isub__(self, other, keyHeaders=None):
+		'''remove the rows from self that match a row in other - uses exact match of rows
+	if keyHeaders is given then rows are matched by their values for those headers instead (e.g. removal by primary key)'''
+		if isinstance(other, (dict, DataRowProxy)):
 			other = [other]
-		indices = [i for i in range(len(self)) if self.getRow(i) not in other]
-		for c in self.__headers.values():
-			self.__headers[c.header] = DataColumn(self, c.header, [c[i] for i in indices])
+		headers = self.headers() if keyHeaders is None else list(keyHeaders)
+		toRemove = RowFingerprints(other, headers, exact=keyHeaders is None)
+		if not len(toRemove):
+			return self
+		keys = zip(*(self.column(h) for h in headers))
+		indices = array('q', (i for i, key in enumerate(keys) if not toRemove.hasKey(key)))
+		for c in list(self.__headers.values()):
+			self.__headers[c.header] = DataColumn._adopt(self, c.header, c._gather(indices))
 		self.__length = len(indices)
 		return self
 	remove = __sub__ = _copyAndApplyOp(__isub__)
 	def __iand__(self, other):
 		'''Add columns to the data tabel using the dictionary keys from other as the new headers and their values as fields on each row
+Values may be a constant, a function of the row, or a column expression (see datatable_expr), e.g. {'total': col('qty') * col('price')},
+	which is evaluated over whole columns at a time (the new column is typed if the columns it refers to are all typed)
 Overwrites existing columns'''
 		if hasattr(other, '__call__'):
 			if not self:
@@ -306,14 +602,24 @@ Overwrites existing columns'''
 				results.append(other(row))
 			for header in results[0].keys():
 				self.__headers[header] = DataColumn(self, header, (row[header] for row in results))
+			self.__schemaChanged()
 			return self
+		expressions = {header: value for header, value in other.items() if isinstance(value, Expr)}
+		results = {header: toStorage(evaluate(value, self, len(self))) for header, value in expressions.items()}
+		for header, data in results.items():
+			self.__headers[header] = DataColumn._adopt(self, header, data)
+			if isinstance(data, list) and all(self.column(h).kind() != 'object' for h in expressions[header].headers()):
+				self.__headers[header].setType()
 		for header, value in other.items():
+			if header in expressions:
+				continue
 			data = []
 			if hasattr(value, '__call__'):
 				data = [value(row) for row in self]
 			else:
 				data = [value] * len(self)
 			self.__headers[header] = DataColumn(self, header, data)
+		self.__schemaChanged()
 		return self
 	extend = __and__ = _copyAndApplyOp(__iand__)
 	def __or__(self, other):
@@ -326,6 +632,7 @@ Overwrites existing columns'''
 			for column in list(self.__headers.values()):
 				if other(column):
 					del self.__headers[column.header]
+			self.__schemaChanged()
 			return self
 		if other in self.__headers:
 			other = [other]
@@ -333,6 +640,7 @@ Overwrites existing columns'''
 			if key not in self.__headers:
 				continue
 			del self.__headers[key]
+		self.__schemaChanged()
 		return self
 	exclude = __xor__ = _copyAndApplyOp(__ixor__)
 	def __itruediv__(self, other):
@@ -341,6 +649,7 @@ Overwrites existing columns'''
 			for column in list(self.__headers.values()):
 				if not other(column):
 					del self.__headers[column.header]
+			self.__schemaChanged()
 			return self
 		if other in self.__headers:
 			other = [other]
@@ -348,22 +657,34 @@ Overwrites existing columns'''
 			if key in other:
 				continue
 			del self.__headers[key]
+		self.__schemaChanged()
 		return self
 	project = __truediv__ = _copyAndApplyOp(__itruediv__)
 	def removeBlankColumns(self):
 		'''returns a copy of this DataTable with all of the blank columns removed'''
 		blanks = [h for h, col in self.__headers.items() if not any(col)]
 		return self.exclude(blanks)
-	def sorted(self, *fields):
-		'''returns a new copy of the data table sorted'''
-		def key(idx):
-			return tuple(sortKey(self.column(field)[idx]) for field in fields)
-		idxs = sorted(range(len(self)), key=key)
-		return self.select(idxs)
-	def sort(self, *fields):
-		other = self.sorted(*fields)
+	def sorted(self, *fields, ascending=True, nulls=None):
+		'''
+	returns a new copy of the data table sorted by the given fields (a view of this table's values in sorted order, see select)
+	the sort is stable, and by default orders rows as datatable.DataTable.sort does (by sortKey of each field's value)
+	ascending - a bool, or a list of a bool for each field
+	nulls - where None values sort: 'first', 'last', or None to place them as sortKey does (after the values when descending)
+	the rows are sorted a field at a time using the columns' typed or dictionary encoded values (see datatable_storage.sortIndices)
+		'''
+		if isinstance(ascending, bool):
+			ascending = [ascending] * len(fields)
+		if len(ascending) != len(fields):
+			raise DataTableException("ascending must be a bool or have one value per field")
+		# fields the table doesn't have are all None, so don't change the order
+		keys = [(self.__headers[field]._sortData(), up) for field, up in zip(fields, ascending) if field in self.__headers]
+		return self.select(sortIndices([data for data, up in keys], len(self), [up for data, up in keys], nulls))
+	def sort(self, *fields, ascending=True, nulls=None):
+		'''sorts the table in place (see sorted), gathering each column into its sorted order once'''
+		other = self.sorted(*fields, ascending=ascending, nulls=nulls).compact()
 		for h in self.__headers.keys():
-			self.__headers[h] = DataColumn(self, h, other.column(h))
+			column = other.column(h)
+			self.__headers[h] = DataColumn._adopt(self, h, column.storage() or list(column))
 		return self
 	def iterBucket(self, *fields):
 		buckets = defaultdict(lambda : [])
@@ -416,45 +737,42 @@ Parameters:
 					other.renameColumn(header, otherFieldPrefix + header)
 			return other & {header: None for header in self.headers() if header not in joinParams}
 
-		newHeaders = other.headers()
-		for header in joinParams.values():
-			newHeaders.remove(header)
-
-		otherBuckets = other.bucket(*joinParams.values())
-		def tempJoin():
-			seenKeys = set()
-			for row in self:
-				newRow = dict(row)
-				key = tuple(row[field] for field in joinParams.keys())
-				seenKeys.add(key)
-				if key not in otherBuckets:
-					if joinType.leftOuter:
-						for header in newHeaders:
-							newRow[otherFieldPrefix+header] = None
-						yield newRow
-					continue
-				otherRows = otherBuckets[key]
-				for otherRow in otherRows:
-					for header in newHeaders:
-						newRow[otherFieldPrefix+header] = otherRow[header]
-					yield dict(newRow)
-			if joinType.rightOuter:
-				joinParamReversed = {v: k for k,v in joinParams.items()}
-				for otherRow in other:
-					key = tuple(otherRow[field] for field in joinParams.values())
-					if key not in seenKeys:
-						newRow = {joinParamReversed[k] if k in joinParamReversed else otherFieldPrefix+k: v for k, v in otherRow.items()}
-						for header in self.headers():
-							if header not in joinParams:
-								newRow[header] = None
-						yield newRow
-		return DataTable(tempJoin())
+		leftIndices, rightIndices, rightOnly = _joinIndices([self.column(h) for h in joinParams.keys()], [other.column(h) for h in joinParams.values()], len(self), len(other), joinType)
+		columns = {}
+		for header, column in self.__headers.items():
+			if header in joinParams and rightOnly < len(leftIndices):
+				# the key fields of the unmatched rows from other are taken from other's key fields
+				columns[header] = mergeChunks([column._gather(leftIndices[:rightOnly]), other.column(joinParams[header])._gather(rightIndices[rightOnly:])])
+			else:
+				columns[header] = column._gather(leftIndices)
+		rightKeys = set(joinParams.values())
+		for header, column in other.__headers.items():
+			if header in rightKeys:
+				continue
+			indices = rightIndices
+			if otherFieldPrefix + header in self.__headers and otherFieldPrefix + header not in joinParams:
+				# as for the other fields of self, a field named the same in both is None in the unmatched rows from other
+				indices = rightIndices[:rightOnly] + array('q', repeat(-1, len(rightIndices) - rightOnly))
+			columns[otherFieldPrefix + header] = column._gather(indices)
+		return DataTable._fromColumns(columns, len(leftIndices))
 	def writeTo(self, fileName, *headers):
 		'''Write the contents of this DataTable to a file with the given name in the standard csv format'''
 		if not headers:
 			headers = self.headers()
 		with open(os.path.expanduser(fileName), 'w') as f:
 			f.write(self | CSV_GivenHeaders(*headers))
+	def save(self, path):
+		'''Write the contents of this DataTable to a file in the binary columnar format (see datatable_columnar), which may be read back with DataTable.load
+	int, float, bool and str columns are stored as typed binary blocks (str columns with few distinct values dictionary encoded), other columns are pickled'''
+		writeColumns(path, len(self), ((c.header, c) for c in self.columns()))
+	@staticmethod
+	def load(path, mmap=True):
+		'''Read a DataTable from a file written by save
+	if mmap is true the file is memory-mapped and the typed columns read their values from it without copying
+		(so the table opens in constant time and processes sharing the file share the page cache);
+	a column copies its values into memory when it is changed'''
+		length, columns = readColumns(path, mmap)
+		return DataTable._fromColumns(dict(columns), length)
 	def duplicates(self, *fields):
 		'''given a list of fields as keys, return a DataTable instance with the rows for which those fields are not unique'''
 		matchCount = {}
@@ -505,12 +823,13 @@ Parameters:
 	groupBy - the set of fields to group
 	aggregations - a dict of field name -> aggregate method, where the method takes an intermediate DataTable
 		and returns the value for that field for that row.
+		(the rows are passed to the aggregate methods through one DataRowProxy which is reused for each row, see cursor)
 		'''
 		if not aggregations:
 			return self.project(groupBy).distinct()
 		accumulatedRows = {}
-		for row in self:
-			key = tuple(row[field] for field in groupBy)
+		keys = zip(*(self.column(field) for field in groupBy)) if groupBy else repeat(())
+		for key, row in zip(keys, self.cursor()):
 			if key not in accumulatedRows:
 				accumulatedRows[key] = {a: agg.newBucket(row) for a, agg in aggregations.items()}
 			accRow = accumulatedRows[key]
@@ -526,42 +845,64 @@ Parameters:
 		del self.__headers[column]
 		self.__headers[newName] = dataColumn
 		self.__headers[newName].header = newName
+		self.__schemaChanged()
+	def __sortKey(self, fields):
+		columns = [self.column(field) for field in fields]
+		def key(idx):
+			return tuple(sortKey(column[idx]) for column in columns)
+		return key
 	def minRow(self, *fields):
 		'''return the row with the minimum value(s) in the given field(s)'''
 		if not self:
 			return None
-		return self.sorted(*fields)[0]
+		return self.select([min(range(len(self)), key=self.__sortKey(fields))])[0]
 	def maxRow(self, *fields):
 		'''return the row with the maximum value(s) in the given field(s)'''
 		if not self:
 			return None
-		return self.sorted(*fields)[-1]
+		return self.select([max(reversed(range(len(self))), key=self.__sortKey(fields))])[0]
+	def topK(self, k, *fields, descending=False):
+		'''returns a new DataTable with the k rows with the smallest (or largest, if descending) value(s) in the given field(s), in that order
+	rows with equal values keep their order in this table (for descending too, unlike reversing sorted(*fields)),
+	and only k rows are kept in a heap instead of sorting the whole table'''
+		return self.select((heapq.nlargest if descending else heapq.nsmallest)(k, range(len(self)), key=self.__sortKey(fields)))
 
 class DataRowProxy(object):
+	'''a row of a DataTable, reading and writing its values in the table's columns
+	fields are looked up in the table's dict of header -> column, and the sorted headers are cached by the table (until its columns change),
+	so reading a field doesn't depend on the number of columns'''
 	def __init__(self, dataTable, idx):
 		self.__dataTable = dataTable
+		self.__columns = dataTable._columnMap()
+		self.__idx = idx
+	def _moveTo(self, idx):
+		'''points this proxy at another row of the table (see DataTable.cursor)'''
 		self.__idx = idx
 	def __getitem__(self, header):
-		if header not in self.keys():
+		if header not in self.__columns:
 			raise KeyError("Invalid key: %s" % header)
-		return self.__dataTable.column(header)[self.__idx]
+		return self.__columns[header][self.__idx]
 	def __setitem__(self, key, value):
-		if key not in self.keys():
+		if key not in self.__columns:
 			raise KeyError("DataRowProxy doesn't support setting of keys not belonging to its associated DataTable")
-		self.__dataTable.column(key)[self.__idx] = value
+		self.__columns[key][self.__idx] = value
 	def __contains__(self, key):
-		return key in self.keys()
+		return key in self.__columns
 	def __getattr__(self, header):
-		if header not in self.__dataTable.headers():
+		if header.startswith('_DataRowProxy__'):
+			raise AttributeError(header)
+		if header not in self.__columns:
 			raise AttributeError("Source table doesn't have column with header: " + header + ".  Available columns: %r" % self.__dataTable.headers())
-		return self.__dataTable.column(header)[self.__idx]
+		return self.__columns[header][self.__idx]
 	def __setattr__(self, key, value):
-		if key.startswith('_') or key not in self.keys():
+		if key.startswith('_') or key not in self.__columns:
 			super(DataRowProxy, self).__setattr__(key, value)
 		else:
-			self.__dataTable.column(key)[self.__idx] = value
+			self.__columns[key][self.__idx] = value
 	def __iter__(self):
-		return ((column.header, column[self.__idx]) for column in self.__dataTable.columns())
+		columns = self.__columns
+		idx = self.__idx
+		return ((header, columns[header][idx]) for header in self.__dataTable._sortedHeaders())
 	items = __iter__
 	iteritems = __iter__
 	def asDict(self):
@@ -0,0 +1,207 @@
+'''
+AsyncDataTableStream - a DataTableStream style pipeline over an async iterator of rows (e.g. rows read from a socket or an async DB driver),
+	so that one event loop can run many pipelines concurrently without threads, e.g.
+		async def rows():
+			async for line in reader:
+				yield parse(line)
+		total = await AsyncDataTableStream(rows(), headers).filter(isValid).aggregate(['region'], {'sales': Sum('sales')}).toTable()
+Stages (filter, transform, extend, project, exclude, join, aggregate, distinct) return new streams without reading any rows;
+	the terminal operations (toList, toTable, first, reduce, sizeOfBuckets, writeTo) are coroutines which read the rows.
+The functions given to filter, transform and extend may be coroutine functions (async def), which are awaited for each row.
+Like DataTableStream, a stream of an async iterator can only be read once (raising a DataTableException the second time),
+	while a stream of an async iterable which starts a new pass when iterated (or of a list or DataTable) may be read again.
+'''
+import asyncio
+import os
+from inspect import isawaitable
+from datatable import DataTable
+from datatable_aggregate import accumulate, finalizeRows
+from datatable_join import HashJoinIndex
+from datatable_sort import BATCH_SIZE
+from datatable_source import isReplayable
+from datatable_stream import DataTableStream, createColumnFilter, _headerSet
+from datatable_util import AttributeDict, DataTableException, JoinType, _quoteField
+
+async def _rowsOf(rows):
+	for row in rows:
+		yield row
+
+class AsyncDataTableStream(object):
+	def __init__(self, rows, headers):
+		'''creates a stream of the given rows (an async iterable, or a (sync) iterable such as a list or DataTable) with the given headers'''
+		if hasattr(rows, '__aiter__'):
+			self.__makeRows = rows.__aiter__
+			self.__once = rows.__aiter__() is rows
+		else:
+			self.__makeRows = lambda: _rowsOf(rows)
+			self.__once = iter(rows) is rows
+		self.__read = False
+		self.__headers = headers
+	@staticmethod
+	def __derived(makeRows, headers, *inputs):
+		'''returns a stream of the rows of the async iterator returned by makeRows() (which reads the input streams), called again for each pass'''
+		stream = AsyncDataTableStream([], headers)
+		stream.__makeRows = makeRows
+		stream.__once = any(i.__once for i in inputs)
+		return stream
+	def __aiter__(self):
+		'''Gets an async iterator over the data rows'''
+		if self.__once and self.__read:
+			raise DataTableException("The rows of this stream have already been read and can't be replayed")
+		self.__read = True
+		return self.__makeRows()
+	def headers(self):
+		'''Returns this stream's header strings'''
+		return self.__headers
+	def filter(self, filterFunction):
+		'''Returns a stream of the rows for which filterFunction (which may be a coroutine function) returns true
+	Accepts either a dictionary of header -> value which does exact matching on the pairs (see DataTableStream.filter),
+	or a filter function which takes a dict as input and returns if that row should be included'''
+		if isinstance(filterFunction, dict):
+			filters = [(header, createColumnFilter(value)) for header, value in filterFunction.items()]
+			filterFunction = lambda row: all(matches(row[header]) for header, matches in filters)
+		async def it():
+			async for row in self:
+				include = filterFunction(row)
+				if isawaitable(include):
+					include = await include
+				if include:
+					yield row
+		return AsyncDataTableStream.__derived(it, self.__headers, self)
+	def transform(self, transformFunction, newHeaders=None):
+		'''Returns a stream of the rows returned by transformFunction (which may be a coroutine function) for each row'''
+		async def it():
+			async for row in self:
+				newRow = transformFunction(row)
+				if isawaitable(newRow):
+					newRow = await newRow
+				yield newRow
+		return AsyncDataTableStream.__derived(it, newHeaders or set(), self)
+	def extend(self, other):
+		'''Add columns to the data using the dictionary keys from other as the new headers and their values as fields on each row
+	values may be constants or functions of the row (which may be coroutine functions); other may also be a function of the row returning a dict
+Overwrites existing columns'''
+		if hasattr(other, '__call__'):
+			async def transform(row):
+				values = other(row)
+				if isawaitable(values):
+					values = await values
+				return row + values
+			return self.transform(transform, set())
+		async def transform(row):
+			values = {}
+			for header, value in other.items():
+				if hasattr(value, '__call__'):
+					value = value(row)
+					if isawaitable(value):
+						value = await value
+				values[header] = value
+			return row + values
+		return self.transform(transform, set(self.__headers).union(other.keys()))
+	def project(self, headers):
+		'''Returns a stream of the rows with only the given header(s)'''
+		headers = _headerSet(headers, self.__headers)
+		return self.transform(lambda row: AttributeDict((header, value) for header, value in row.items() if header in headers), {header for header in self.__headers if header in headers})
+	def exclude(self, headers):
+		'''Returns a stream of the rows without the given header(s)'''
+		headers = _headerSet(headers, self.__headers)
+		return self.transform(lambda row: AttributeDict((header, value) for header, value in row.items() if header not in headers), {header for header in self.__headers if header not in headers})
+	def join(self, other, joinParams=None, otherFieldPrefix='', joinType=JoinType.LEFT_OUTER_JOIN, expectedUnique=False):
+		'''
+	Returns a stream of the rows of this stream joined with the rows of other (a DataTable, DataTableStream or list of rows, read into memory when the joined rows are first read)
+	as DataTableStream.join with the hash algorithm: the rows are in the order of this stream, followed by the unmatched rows of other for right outer joins
+		'''
+		if joinParams is None:
+			joinParams = {h: h for h in self.headers() if h in other.headers()}
+		elif not isinstance(joinParams, dict):
+			raise Exception("joinParams must be a dictionary of <field in self> to <field in other>")
+		otherHeaders = list(other.headers())
+		async def it():
+			otherRows = other if isinstance(other, DataTable) else list(other)
+			index = HashJoinIndex(otherRows, joinParams, self.headers(), otherHeaders, otherFieldPrefix, joinType, expectedUnique)
+			async for row in self:
+				for joined in index.probe(row):
+					yield joined
+			for joined in index.unmatched():
+				yield joined
+		rightKeys = set(joinParams.values())
+		stream = AsyncDataTableStream.__derived(it, set(self.headers()).union(otherFieldPrefix + h for h in otherHeaders if h not in rightKeys), self)
+		stream.__once = stream.__once or not isReplayable(other)
+		return stream
+	def distinct(self):
+		'''Returns a stream with only the unique rows'''
+		async def it():
+			headers = self.headers()
+			rows = set()
+			async for row in self:
+				items = tuple(row[h] for h in headers)
+				if items not in rows:
+					rows.add(items)
+					yield row
+		return AsyncDataTableStream.__derived(it, self.__headers, self)
+	def aggregate(self, groupBy, aggregations={}):
+		'''return a stream of the aggregation of the data grouped by a given set of fields (see DataTableStream.aggregate)
+	reads the whole stream (accumulating it in batches of rows) before it yields the resulting rows'''
+		if not aggregations:
+			return self.project(groupBy).distinct()
+		async def it():
+			accumulatedRows = {}
+			batch = []
+			async for row in self:
+				batch.append(row)
+				if len(batch) >= BATCH_SIZE:
+					accumulate(batch, groupBy, aggregations, accumulatedRows)
+					batch = []
+			accumulate(batch, groupBy, aggregations, accumulatedRows)
+			for row in finalizeRows(accumulatedRows, groupBy, aggregations):
+				yield row
+		return AsyncDataTableStream.__derived(it, set(groupBy).union(aggregations.keys()), self)
+	async def toList(self):
+		'''reads the rows into a list'''
+		return [row async for row in self]
+	async def toTable(self):
+		'''reads the rows into a DataTable'''
+		return DataTable(await self.toList())
+	async def toStream(self):
+		'''reads the rows into memory, returning a (synchronous) DataTableStream of them'''
+		return DataTableStream(await self.toList(), self.__headers)
+	async def first(self):
+		'''returns the first row (or None if there are none), reading no further rows'''
+		async for row in self:
+			return row
+		return None
+	async def reduce(self, reduction, startingValue=None):
+		'''as functools.reduce over the rows'''
+		rows = self.__aiter__()
+		if startingValue is None:
+			try:
+				startingValue = await rows.__anext__()
+			except StopAsyncIteration:
+				raise TypeError("reduce() of empty stream with no initial value")
+		async for row in rows:
+			startingValue = reduction(startingValue, row)
+		return startingValue
+	async def sizeOfBuckets(self, *fields):
+		'''Returns a dict of bucket -> number of items in the bucket'''
+		sizes = {}
+		async for row in self:
+			key = tuple(row[field] for field in fields)
+			sizes[key] = sizes.get(key, 0) + 1
+		return sizes
+	async def writeTo(self, fileName, *headers):
+		'''Write the rows to a file with the given name in the standard csv format (as DataTableStream.writeTo)
+	the rows are written in batches, each written by the event loop's default executor so that writing doesn't block the loop'''
+		if not headers:
+			headers = self.headers()
+		loop = asyncio.get_running_loop()
+		f = await loop.run_in_executor(None, open, os.path.expanduser(fileName), 'w')
+		try:
+			lines = [','.join(_quoteField(h) for h in headers)]
+			async for row in self:
+				lines.append(','.join(_quoteField(row[header]) for header in headers))
+				if len(lines) >= BATCH_SIZE:
+					await loop.run_in_executor(None, f.write, '\n'.join(lines) + '\n')
+					lines = []
+			await loop.run_in_executor(None, f.write, '\n'.join(lines))
+		finally:
+			await loop.run_in_executor(None, f.close)
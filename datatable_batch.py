@@ -0,0 +1,208 @@
+'''
+Batched stages for DataTableStream: adds a batched method to DataTableStream (once this module is imported), e.g.
+	stream.batched(1000).filter(col('qty') > 5).extend({'total': col('qty') * col('price')}).set('region', str.upper).project(['region', 'total']).aggregate(...)
+The filter, extend, set, project and exclude stages following batched() are run on batches of rows held as columns (header -> list of values),
+	rather than passing each row through a generator per stage and copying it (row + {...}) in each extend:
+		filter produces a mask for the batch and keeps the selected values of each column
+		extend and set compute whole columns of the batch (column expressions from datatable_expr are evaluated a column at a time)
+		project and exclude just drop columns
+	rows are only built at the edges, when the batches are read as rows
+Row functions (filter or extend functions of a row) are called with a BatchRow, reading its values from the batch's columns,
+	which is reused for each row of the batch: it is only valid for the call (use asDict() to keep a copy).
+The first operation which isn't one of those reads the resulting rows as an ordinary DataTableStream.
+'''
+from itertools import compress, islice
+from datatable_expr import Expr, evaluate, _isNumpy
+from datatable_stream import DataTableStream, createColumnFilter, _headerSet
+from datatable_source import DerivedSource
+from datatable_util import AttributeDict
+
+class BatchRow(object):
+	'''a row of a Batch, reading its values from the batch's columns (see Batch.cursor)'''
+	def __init__(self, columns, idx):
+		self.__columns = columns
+		self.__idx = idx
+	def _moveTo(self, idx):
+		self.__idx = idx
+	def __getitem__(self, header):
+		return self.__columns[header][self.__idx]
+	def __getattr__(self, header):
+		if header.startswith('_BatchRow__'):
+			raise AttributeError(header)
+		if header not in self.__columns:
+			raise AttributeError("Batch doesn't have column with header: %s.  Available columns: %r" % (header, list(self.__columns.keys())))
+		return self.__columns[header][self.__idx]
+	def __contains__(self, header):
+		return header in self.__columns
+	def get(self, header, default=None):
+		return self.__columns[header][self.__idx] if header in self.__columns else default
+	def keys(self):
+		return self.__columns.keys()
+	def __iter__(self):
+		return iter(self.__columns)
+	def __len__(self):
+		return len(self.__columns)
+	def values(self):
+		idx = self.__idx
+		return (values[idx] for values in self.__columns.values())
+	def items(self):
+		idx = self.__idx
+		return ((header, values[idx]) for header, values in self.__columns.items())
+	def asDict(self):
+		return AttributeDict(self.items())
+	def __add__(self, other):
+		row = self.asDict()
+		row += other
+		return row
+	def __repr__(self):
+		return 'BatchRow(%r)' % self.asDict()
+
+class Batch(object):
+	'''a batch of rows held as columns: columns is a dict of header -> list of values (each of length rows)'''
+	def __init__(self, columns, length):
+		self.columns = columns
+		self.length = length
+	@staticmethod
+	def fromRows(rows, headers=None):
+		'''returns a batch of the given rows, with the given headers (defaults to all of the headers of the rows)'''
+		if not headers:
+			headers = {}
+			for row in rows:
+				headers.update(dict.fromkeys(row.keys()))
+		return Batch({header: [row.get(header, None) for row in rows] for header in headers}, len(rows))
+	def headers(self):
+		return list(self.columns.keys())
+	def column(self, header):
+		return self.columns[header]
+	def rows(self):
+		'''returns the rows of the batch (as AttributeDicts)'''
+		headers = self.headers()
+		if not headers:
+			return [AttributeDict() for i in range(self.length)]
+		return [AttributeDict(zip(headers, values)) for values in zip(*self.columns.values())]
+	def cursor(self):
+		'''yields the same BatchRow for each row of the batch, moved on to the next row each time'''
+		row = BatchRow(self.columns, 0)
+		for i in range(self.length):
+			row._moveTo(i)
+			yield row
+	def select(self, mask):
+		'''returns a batch of the rows for which mask (a list of the same length) is true'''
+		columns = {header: list(compress(values, mask)) for header, values in self.columns.items()}
+		length = sum(1 for selected in mask if selected)
+		return Batch(columns, length)
+	def withColumns(self, columns):
+		'''returns a batch with the given columns (a dict of header -> list of values) added or replaced'''
+		newColumns = dict(self.columns)
+		newColumns.update(columns)
+		return Batch(newColumns, self.length)
+
+def _values(batch, value):
+	'''returns the list of values of a column of the batch computed from value:
+	a column expression (evaluated over the batch), a function of the row, or a constant'''
+	if isinstance(value, Expr):
+		values = evaluate(value, batch, batch.length)
+		return values.tolist() if _isNumpy(values) else values
+	if hasattr(value, '__call__'):
+		return [value(row) for row in batch.cursor()]
+	return [value] * batch.length
+
+def _filterStage(filterFunction):
+	if isinstance(filterFunction, dict):
+		filters = [(header, createColumnFilter(value)) for header, value in filterFunction.items()]
+		def stage(batch):
+			mask = None
+			for header, matches in filters:
+				columnMask = list(map(matches, batch.column(header)))
+				mask = columnMask if mask is None else [a and b for a, b in zip(mask, columnMask)]
+			return batch if mask is None else batch.select(mask)
+		return stage
+	return lambda batch: batch.select(_values(batch, filterFunction))
+
+def _extendStage(other):
+	if hasattr(other, '__call__') and not isinstance(other, Expr):
+		def stage(batch):
+			newRows = [other(row) for row in batch.cursor()]
+			return batch.withColumns(Batch.fromRows(newRows).columns)
+		return stage
+	return lambda batch: batch.withColumns({header: _values(batch, value) for header, value in other.items()})
+
+def _setStage(header, value):
+	if hasattr(value, '__call__') and not isinstance(value, Expr):
+		return lambda batch: batch.withColumns({header: [value(v) for v in batch.column(header)]})
+	return lambda batch: batch.withColumns({header: _values(batch, value)})
+
+class BatchedDataTableStream(object):
+	'''
+	A stream whose filter, extend, set, project and exclude stages are run on batches of rows held as columns (see the module documentation)
+	any other DataTableStream method is called on the stream of its results (see sequential)
+	'''
+	def __init__(self, stream, headers, size=1000, stages=()):
+		self.__stream = stream
+		self.__size = size
+		self.__stages = list(stages)
+		self.__headers = headers
+	def __then(self, stage, headers):
+		'''returns a new BatchedDataTableStream which also runs the given stage'''
+		return BatchedDataTableStream(self.__stream, headers, self.__size, self.__stages + [stage])
+	def filter(self, filterFunction):
+		'''as DataTableStream.filter; filterFunction may also be a (boolean) column expression (see datatable_expr), evaluated over the whole batch'''
+		return self.__then(_filterStage(filterFunction), self.__headers)
+	def extend(self, other):
+		'''as DataTableStream.extend; the values of other may also be column expressions, evaluated over the whole batch'''
+		headers = set(self.__headers).union(other.keys()) if isinstance(other, dict) else set()
+		return self.__then(_extendStage(other), headers)
+	def set(self, header, value):
+		'''sets the values of the column (as DataTableStream.column(header).set):
+	value may be a function of the value, a column expression (evaluated over the whole batch) or a constant'''
+		return self.__then(_setStage(header, value), self.__headers)
+	def project(self, other):
+		'''keeps the given header(s) (see DataTableStream.project)'''
+		if '__call__' in dir(other):
+			return self.sequential().project(other)
+		headers = _headerSet(other, self.__headers)
+		return self.__then(lambda batch: Batch({h: v for h, v in batch.columns.items() if h in headers}, batch.length), {h for h in self.__headers if h in headers})
+	def exclude(self, other):
+		'''removes the given header(s) (see DataTableStream.exclude)'''
+		if '__call__' in dir(other):
+			return self.sequential().exclude(other)
+		headers = _headerSet(other, self.__headers)
+		return self.__then(lambda batch: Batch({h: v for h, v in batch.columns.items() if h not in headers}, batch.length), {h for h in self.__headers if h not in headers})
+	def headers(self):
+		return self.__headers
+	def replayable(self):
+		return self.__stream.replayable()
+	def batches(self):
+		'''yields the (non-empty) Batches of rows resulting from the stages'''
+		rows = iter(self.__stream)
+		headers = self.__stream.headers()
+		while True:
+			chunk = list(islice(rows, self.__size))
+			if not chunk:
+				return
+			batch = Batch.fromRows(chunk, headers)
+			for stage in self.__stages:
+				batch = stage(batch)
+				if not batch.length:
+					break
+			else:
+				yield batch
+	def __iter__(self):
+		for batch in self.batches():
+			yield from batch.rows()
+	def sequential(self):
+		'''returns an ordinary DataTableStream of the resulting rows (the stages following it aren't batched)'''
+		return DataTableStream(DerivedSource(self.__iter__, self.__stream), self.__headers)
+	def __getattr__(self, name):
+		if name.startswith('_'):
+			raise AttributeError(name)
+		return getattr(self.sequential(), name)
+	def __getitem__(self, index):
+		return self.sequential()[index]
+	def __or__(self, other):
+		return other(iter(self))
+
+def batched(self, size=1000):
+	'''returns a stream which runs the filter, extend, set, project and exclude stages following it on batches of size rows held as columns (see datatable_batch)'''
+	return BatchedDataTableStream(self, self.headers(), size)
+DataTableStream.batched = batched
@@ -0,0 +1,125 @@
+'''
+Benchmarks comparing the run time and memory usage of alternative DataTable modes and representations
+Run this module as a script to print the results:
+	python datatable_benchmark.py [rows]
+'''
+import sys
+import time
+import tracemalloc
+from datatable import DataTable
+import datatable_alt
+import datatable_stream
+import datatable_batch
+from datatable_expr import col
+from datatable_aggregate import Sum, Count, Max
+
+def measure(fn):
+	'''calls fn and returns (result, elapsed seconds, peak bytes allocated while running fn)'''
+	tracemalloc.start()
+	start = time.perf_counter()
+	try:
+		result = fn()
+		elapsed = time.perf_counter() - start
+		peak = tracemalloc.get_traced_memory()[1]
+	finally:
+		tracemalloc.stop()
+	return result, elapsed, peak
+
+def measureRetained(fn):
+	'''calls fn and returns (result, elapsed seconds, bytes still allocated by fn after it returns)'''
+	tracemalloc.start()
+	start = time.perf_counter()
+	try:
+		before = tracemalloc.get_traced_memory()[0]
+		result = fn()
+		elapsed = time.perf_counter() - start
+		retained = tracemalloc.get_traced_memory()[0] - before
+	finally:
+		tracemalloc.stop()
+	return result, elapsed, retained
+
+def makeRows(rows, columns=10):
+	'''generates rows of sample data: an int key column, an int group column, a float amount column and string columns'''
+	for i in range(rows):
+		row = {'key': i, 'group': i % 97, 'amount': i * 0.5}
+		row.update(('s%02d' % c, 'value %d' % ((i + c) % 1000)) for c in range(columns - 3))
+		yield row
+
+def report(title, results):
+	print(title)
+	for name, elapsed, peak in results:
+		print('\t%-24s %8.3fs %10.1fMB' % (name, elapsed, peak / 2**20))
+
+def benchmarkCopyOnWrite(rows=100000):
+	'''chains the operations which copy the table (extend, project, exclude, sorted, append, remove) in the default and copy-on-write modes'''
+	def chain(dt):
+		projected = (dt & {'total': lambda row: row.amount * 2}) / ['key', 'group', 'total']
+		return projected, dt.sorted('group'), dt ^ 's03', dt + dt[:10], dt - dt[:10]
+	results = []
+	for copyOnWrite in (False, True):
+		dt = DataTable(makeRows(rows), copyOnWrite=copyOnWrite)
+		_, elapsed, peak = measure(lambda: chain(dt))
+		results.append(('copyOnWrite=%s' % copyOnWrite, elapsed, peak))
+	report('copy-on-write (%d rows): extend+project, sorted, exclude, append, remove' % rows, results)
+
+def benchmarkCompactRows(rows=100000, columns=20):
+	'''memory retained by a table with an AttributeDict per row vs one with CompactRows sharing a schema, and the time to scan it'''
+	results = []
+	for compact in (False, True):
+		dt, elapsed, retained = measureRetained(lambda: DataTable(makeRows(rows, columns), compact=compact))
+		results.append(('compact=%s build' % compact, elapsed, retained))
+		_, elapsed, peak = measure(lambda: dt.filter(lambda row: row.group == 3 and row.amount > 10))
+		results.append(('compact=%s filter' % compact, elapsed, peak))
+		del dt
+	report('row storage (%d rows x %d columns): retained memory after build, peak memory of filter' % (rows, columns), results)
+
+def benchmarkAltRowAccess(rows=100000, columns=20):
+	'''row-wise operations on a datatable_alt table (which reads its values through a DataRowProxy per row): aggregate, filter with a function, and a full scan of the rows'''
+	dt = datatable_alt.DataTable(makeRows(rows, columns))
+	aggregations = {'total': Sum('amount'), 'rows': Count(), 'last': Max('key')}
+	results = []
+	_, elapsed, peak = measure(lambda: dt.aggregate(['group'], aggregations))
+	results.append(('aggregate', elapsed, peak))
+	_, elapsed, peak = measure(lambda: dt.filter(lambda row: row.group == 3 and row['amount'] > 10))
+	results.append(('filter', elapsed, peak))
+	_, elapsed, peak = measure(lambda: sum(len(row.asDict()) for row in dt))
+	results.append(('scan (asDict)', elapsed, peak))
+	report('datatable_alt row access (%d rows x %d columns)' % (rows, columns), results)
+
+def benchmarkStreamBatches(rows=100000, columns=10):
+	'''a 6 stage DataTableStream pipeline (filter, extend, set, extend, filter, project) run a row at a time,
+	and batched (see datatable_batch) with the same row functions, and with column expressions'''
+	table = DataTable(makeRows(rows, columns))
+	def rowPipeline(stream):
+		return (stream.filter(lambda row: row.group < 80)
+			.extend({'total': lambda row: row.amount * 2})
+			.column('s03').set(str.upper)
+			.extend({'bucket': lambda row: row.key % 10})
+			.filter(lambda row: row.total > 100)
+			.project(['key', 'total', 'bucket', 's03']))
+	def batchedRowFunctions(stream):
+		return (stream.batched().filter(lambda row: row.group < 80)
+			.extend({'total': lambda row: row.amount * 2})
+			.set('s03', str.upper)
+			.extend({'bucket': lambda row: row.key % 10})
+			.filter(lambda row: row.total > 100)
+			.project(['key', 'total', 'bucket', 's03']))
+	def batchedExpressions(stream):
+		return (stream.batched().filter(col('group') < 80)
+			.extend({'total': col('amount') * 2})
+			.set('s03', str.upper)
+			.extend({'bucket': col('key') % 10})
+			.filter(col('total') > 100)
+			.project(['key', 'total', 'bucket', 's03']))
+	results = []
+	for name, pipeline in (('row at a time', rowPipeline), ('batched row functions', batchedRowFunctions), ('batched expressions', batchedExpressions)):
+		count, elapsed, peak = measure(lambda: sum(1 for row in pipeline(table.stream())))
+		results.append((name, elapsed, peak))
+	report('stream pipeline (%d rows x %d columns, %d rows out): per row overhead of 6 stages' % (rows, columns, count), results)
+
+if __name__ == '__main__':
+	rows = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+	benchmarkCopyOnWrite(rows)
+	benchmarkCompactRows(rows)
+	benchmarkAltRowAccess(rows)
+	benchmarkStreamBatches(rows)
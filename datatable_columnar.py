@@ -0,0 +1,113 @@
+'''
+Binary columnar file format used by datatable_alt.DataTable.save and DataTable.load.
+Layout:
+	MAGIC (8 bytes), the length of the header (8 byte little-endian unsigned int), the header (utf-8 JSON), then the column blocks
+The header describes the schema: the number of rows and for each column its header, kind and the [offset, size] of each of its blocks
+	(offsets are relative to the start of the blocks, and each block starts on an 8 byte boundary):
+		int64, float64, bool - 'values': the values as a native array, 'nulls': the null bitmap (or null)
+		string - 'offsets': the int64 offsets of each value in 'blob', 'blob': the utf-8 encoded values, 'nulls'
+		category - 'codes': the int32 code of each value (-1 for None), with the distinct values stored as for string in 'offsets' and 'blob'
+		object - 'pickle': the pickled list of values (any column which isn't all one of the other kinds)
+Loading (optionally) memory-maps the file, so that the columns read their values straight from the page cache without copying them.
+'''
+import json
+import mmap as _mmap
+import os
+import pickle
+import struct
+import sys
+from datatable_util import DataTableException
+from datatable_storage import TYPECODES, TypedStorage, StringStorage, DictionaryStorage, makeStorage
+
+MAGIC = b'PYDTCOL1'
+_LENGTH = struct.Struct('<Q')
+
+def _padding(size):
+	return b'\0' * (-size % 8)
+
+def writeColumns(path, length, columns):
+	'''writes the columns (a sequence of (header, values)) of a table with the given number of rows to the file at path
+	headers must be representable in JSON (e.g. strings or numbers)'''
+	schema = []
+	blocks = []
+	position = 0
+	def addBlock(data):
+		nonlocal position
+		data = memoryview(data).cast('B')
+		blocks.append(data)
+		block = [position, len(data)]
+		padding = _padding(len(data))
+		blocks.append(padding)
+		position += len(data) + len(padding)
+		return block
+	for header, values in columns:
+		values = list(values)
+		storage = makeStorage(values)
+		column = {'header': header, 'kind': 'object' if storage is None else storage.kind}
+		if storage is None:
+			column['pickle'] = addBlock(pickle.dumps(values, pickle.HIGHEST_PROTOCOL))
+			schema.append(column)
+			continue
+		if isinstance(storage, DictionaryStorage):
+			offsets, blob, nulls = makeStorage(storage.dictionary, 'string').buffers()
+			column['codes'] = addBlock(storage.codes)
+			column['offsets'] = addBlock(offsets)
+			column['blob'] = addBlock(blob)
+			schema.append(column)
+			continue
+		if isinstance(storage, StringStorage):
+			offsets, blob, nulls = storage.buffers()
+			column['offsets'] = addBlock(offsets)
+			column['blob'] = addBlock(blob)
+		else:
+			data, nulls = storage.buffers()
+			column['values'] = addBlock(data)
+		column['nulls'] = None if nulls is None else addBlock(nulls)
+		schema.append(column)
+	try:
+		header = json.dumps({'length': length, 'byteorder': sys.byteorder, 'columns': schema}).encode('utf-8')
+	except TypeError as e:
+		raise DataTableException("Can't save the table: its headers must be representable in JSON (%s)" % e)
+	with open(os.path.expanduser(path), 'wb') as f:
+		f.write(MAGIC)
+		f.write(_LENGTH.pack(len(header)))
+		f.write(header)
+		f.write(_padding(len(MAGIC) + _LENGTH.size + len(header)))
+		for block in blocks:
+			f.write(block)
+
+def readColumns(path, mmap=True):
+	'''reads the file written by writeColumns, returning (length, [(header, storage or list of values)])
+	if mmap is true the storages read from a read-only memory map of the file, otherwise the file is read into memory once'''
+	with open(os.path.expanduser(path), 'rb') as f:
+		if mmap:
+			buffer = memoryview(_mmap.mmap(f.fileno(), 0, access=_mmap.ACCESS_READ))
+		else:
+			buffer = memoryview(f.read())
+	if bytes(buffer[:len(MAGIC)]) != MAGIC:
+		raise DataTableException("%s isn't a columnar DataTable file" % path)
+	headerStart = len(MAGIC) + _LENGTH.size
+	headerLength = _LENGTH.unpack(buffer[len(MAGIC):headerStart])[0]
+	header = json.loads(str(buffer[headerStart:headerStart + headerLength], 'utf-8'))
+	if header['byteorder'] != sys.byteorder:
+		raise DataTableException("%s was written on a %s-endian machine" % (path, header['byteorder']))
+	start = headerStart + headerLength
+	start += -start % 8
+	def block(location, format='B'):
+		if location is None:
+			return None
+		offset, size = location
+		return buffer[start + offset:start + offset + size].cast(format)
+	columns = []
+	for column in header['columns']:
+		kind = column['kind']
+		if kind in TYPECODES:
+			storage = TypedStorage(kind, block(column['values'], TYPECODES[kind]), block(column['nulls']))
+		elif kind == 'string':
+			storage = StringStorage(block(column['offsets'], 'q'), block(column['blob']), block(column['nulls']))
+		elif kind == 'category':
+			storage = DictionaryStorage(list(StringStorage(block(column['offsets'], 'q'), block(column['blob']))), block(column['codes'], 'i'))
+		else:
+			storage = pickle.loads(block(column['pickle']))
+		columns.append((column['header'], storage))
+	return header['length'], columns
@@ -0,0 +1,329 @@
+'''
+Column expressions, evaluated a whole column at a time rather than once per row.
+Build expressions from col(header) (and plain values, or lit(value)) with the usual operators:
+	arithmetic: +, -, *, /, //, %, unary -
+	comparisons: ==, !=, <, <=, >, >=
+	logic: & (and), | (or), ~ (not) - use parentheses, as these bind more tightly than comparisons
+	methods: isin(values), isNull(), notNull(), apply(fn)
+e.g. datatable_alt's dt.where((col('qty') > 5) & col('region').isin(regions)) or dt.extend({'total': col('qty') * col('price')})
+None (null) values propagate: any operation on None gives None (except isNull/notNull, and & / | where the other side decides the result),
+	and where treats None as false.
+When NumPy is installed, operations over typed columns without nulls (see datatable_storage) are computed with NumPy
+	(except /, // and %, which keep Python's semantics for division by zero; note int64 arithmetic wraps on overflow).
+Operations between a dictionary encoded ('category') column and a single value are evaluated once per distinct value rather than per row.
+An expression may also be called with a single row (a dict), so it can be used anywhere a row function is accepted (e.g. DataTable.filter).
+'''
+import operator
+from array import array
+from datatable_util import DataTableException
+from datatable_storage import ColumnStorage, TypedStorage, TYPECODES, numpy
+
+def _vector(values):
+	'''returns the values of a column as a numpy array if they may be operated on with numpy, otherwise as a list'''
+	storage = values.storage() if callable(getattr(values, 'storage', None)) else values
+	if isinstance(storage, ColumnStorage):
+		vector = storage.numpyValues()
+		if vector is not None:
+			return vector
+	return values if isinstance(values, list) else list(values)
+
+def _encoded(expr, columns):
+	'''returns the storage of the column if expr is a column of dictionary encoded values (see datatable_storage.DictionaryStorage), otherwise None'''
+	if not isinstance(expr, Column):
+		return None
+	values = columns[expr.header]
+	storage = values.storage() if callable(getattr(values, 'storage', None)) else values
+	return storage if getattr(storage, 'encoded', False) else None
+
+def _isNumpy(value):
+	return numpy is not None and isinstance(value, numpy.ndarray)
+
+def _isNumpyScalar(value):
+	return isinstance(value, _Scalar) and type(value.value) in (int, float, bool)
+
+def _listOf(value, length):
+	'''returns the values of an operand as a list'''
+	if isinstance(value, _Scalar):
+		return [value.value] * length
+	if _isNumpy(value):
+		return value.tolist()
+	return value
+
+def toStorage(values):
+	'''converts the result of evaluating an expression to the values of a column: typed storage for a numpy result, otherwise a list'''
+	if _isNumpy(values):
+		kind = {'int64': 'int64', 'float64': 'float64', 'bool': 'bool'}.get(values.dtype.name)
+		if kind is None:
+			return values.tolist()
+		data = array(TYPECODES[kind])
+		data.frombytes(values.astype(numpy.int8 if kind == 'bool' else values.dtype).tobytes())
+		return TypedStorage(kind, data)
+	return values
+
+def toIndices(mask):
+	'''returns the indices where the result of evaluating a (boolean) expression is true'''
+	if _isNumpy(mask):
+		return numpy.flatnonzero(mask).tolist()
+	return [i for i, value in enumerate(mask) if value]
+
+class _Scalar(object):
+	'''the result of evaluating a literal - a single value standing for every row'''
+	def __init__(self, value):
+		self.value = value
+
+def _nullable(op):
+	'''wraps a binary operator to return None if either operand is None'''
+	def nullableOp(a, b):
+		if a is None or b is None:
+			return None
+		return op(a, b)
+	return nullableOp
+
+def _and(a, b):
+	if a is None:
+		return None if b is None or b else False
+	if not a:
+		return False
+	return None if b is None else bool(b)
+
+def _or(a, b):
+	if a is None:
+		return True if b else None
+	if a:
+		return True
+	return None if b is None else bool(b)
+
+def _wrap(value):
+	return value if isinstance(value, Expr) else Literal(value)
+
+class Expr(object):
+	'''base class for column expressions'''
+	def headers(self):
+		'''returns the set of headers of the columns this expression refers to'''
+		raise NotImplementedError()
+	def evaluate(self, columns, length):
+		'''
+		evaluates the expression over a whole table
+	columns - mapping of header -> the values of that column (a DataColumn, ColumnStorage or list), for each header in headers()
+	length - the number of rows
+	returns the values of the expression (a list, or a numpy array), or a _Scalar if the expression doesn't refer to any columns'''
+		raise NotImplementedError()
+	def __call__(self, row):
+		'''evaluates the expression for a single row (a dict)'''
+		result = self.evaluate({h: [row[h]] for h in self.headers()}, 1)
+		return result.value if isinstance(result, _Scalar) else _listOf(result, 1)[0]
+	def __add__(self, other):
+		return BinaryOp('+', operator.add, self, other)
+	def __radd__(self, other):
+		return BinaryOp('+', operator.add, other, self)
+	def __sub__(self, other):
+		return BinaryOp('-', operator.sub, self, other)
+	def __rsub__(self, other):
+		return BinaryOp('-', operator.sub, other, self)
+	def __mul__(self, other):
+		return BinaryOp('*', operator.mul, self, other)
+	def __rmul__(self, other):
+		return BinaryOp('*', operator.mul, other, self)
+	def __truediv__(self, other):
+		return BinaryOp('/', operator.truediv, self, other, vectorized=False)
+	def __rtruediv__(self, other):
+		return BinaryOp('/', operator.truediv, other, self, vectorized=False)
+	def __floordiv__(self, other):
+		return BinaryOp('//', operator.floordiv, self, other, vectorized=False)
+	def __rfloordiv__(self, other):
+		return BinaryOp('//', operator.floordiv, other, self, vectorized=False)
+	def __mod__(self, other):
+		return BinaryOp('%', operator.mod, self, other, vectorized=False)
+	def __rmod__(self, other):
+		return BinaryOp('%', operator.mod, other, self, vectorized=False)
+	def __neg__(self):
+		return UnaryOp('-', operator.neg, self)
+	def __eq__(self, other):
+		return BinaryOp('==', operator.eq, self, other)
+	def __ne__(self, other):
+		return BinaryOp('!=', operator.ne, self, other)
+	def __lt__(self, other):
+		return BinaryOp('<', operator.lt, self, other)
+	def __le__(self, other):
+		return BinaryOp('<=', operator.le, self, other)
+	def __gt__(self, other):
+		return BinaryOp('>', operator.gt, self, other)
+	def __ge__(self, other):
+		return BinaryOp('>=', operator.ge, self, other)
+	def __and__(self, other):
+		return LogicalOp('&', _and, numpy.logical_and if numpy is not None else None, self, other)
+	def __rand__(self, other):
+		return LogicalOp('&', _and, numpy.logical_and if numpy is not None else None, other, self)
+	def __or__(self, other):
+		return LogicalOp('|', _or, numpy.logical_or if numpy is not None else None, self, other)
+	def __ror__(self, other):
+		return LogicalOp('|', _or, numpy.logical_or if numpy is not None else None, other, self)
+	def __invert__(self):
+		return UnaryOp('~', lambda a: not a, self, numpyOp=numpy.logical_not if numpy is not None else None)
+	__hash__ = object.__hash__
+	def __bool__(self):
+		raise DataTableException("Column expressions can't be used as booleans - use & | ~ rather than and/or/not, and parentheses around comparisons")
+	def isin(self, values):
+		'''true where the value is one of the given values'''
+		return IsIn(self, values)
+	def isNull(self):
+		'''true where the value is None'''
+		return NullTest(self, True)
+	def notNull(self):
+		'''true where the value isn't None'''
+		return NullTest(self, False)
+	def apply(self, fn):
+		'''calls fn on each (non-None) value'''
+		return UnaryOp(getattr(fn, '__name__', 'fn'), fn, self)
+
+class Column(Expr):
+	'''the values of a column'''
+	def __init__(self, header):
+		self.header = header
+	def headers(self):
+		return {self.header}
+	def evaluate(self, columns, length):
+		return _vector(columns[self.header])
+	def __repr__(self):
+		return 'col(%r)' % (self.header,)
+
+class Literal(Expr):
+	'''the same value for every row'''
+	def __init__(self, value):
+		self.value = value
+	def headers(self):
+		return set()
+	def evaluate(self, columns, length):
+		return _Scalar(self.value)
+	def __repr__(self):
+		return repr(self.value)
+
+class BinaryOp(Expr):
+	def __init__(self, symbol, op, left, right, vectorized=True):
+		self.symbol = symbol
+		self.op = op
+		self.left = _wrap(left)
+		self.right = _wrap(right)
+		self.vectorized = vectorized
+	def headers(self):
+		return self.left.headers() | self.right.headers()
+	def evaluate(self, columns, length):
+		op = _nullable(self.op)
+		encoded = _encoded(self.left, columns)
+		if encoded is not None and not self.right.headers():
+			value = self.right.evaluate(columns, length).value
+			return encoded.mapValues(lambda v: op(v, value))
+		encoded = _encoded(self.right, columns)
+		if encoded is not None and not self.left.headers():
+			value = self.left.evaluate(columns, length).value
+			return encoded.mapValues(lambda v: op(value, v))
+		left = self.left.evaluate(columns, length)
+		right = self.right.evaluate(columns, length)
+		if isinstance(left, _Scalar) and isinstance(right, _Scalar):
+			return _Scalar(op(left.value, right.value))
+		if self.vectorized and self.__numpyOperands(left, right):
+			return self.op(left.value if isinstance(left, _Scalar) else left, right.value if isinstance(right, _Scalar) else right)
+		return list(map(op, _listOf(left, length), _listOf(right, length)))
+	def __numpyOperands(self, left, right):
+		if not (_isNumpy(left) or _isNumpyScalar(left)) or not (_isNumpy(right) or _isNumpyScalar(right)):
+			return False
+		# numpy adds and multiplies bools as logical or/and, rather than as ints
+		return self.symbol in ('==', '!=', '<', '<=', '>', '>=') or not any(_isNumpy(v) and v.dtype == bool for v in (left, right))
+	def __repr__(self):
+		return '(%r %s %r)' % (self.left, self.symbol, self.right)
+
+class LogicalOp(BinaryOp):
+	def __init__(self, symbol, op, numpyOp, left, right):
+		BinaryOp.__init__(self, symbol, op, left, right)
+		self.numpyOp = numpyOp
+	def evaluate(self, columns, length):
+		left = self.left.evaluate(columns, length)
+		right = self.right.evaluate(columns, length)
+		if isinstance(left, _Scalar) and isinstance(right, _Scalar):
+			return _Scalar(self.op(left.value, right.value))
+		if (_isNumpy(left) or _isNumpyScalar(left)) and (_isNumpy(right) or _isNumpyScalar(right)):
+			return self.numpyOp(left.value if isinstance(left, _Scalar) else left, right.value if isinstance(right, _Scalar) else right)
+		return list(map(self.op, _listOf(left, length), _listOf(right, length)))
+
+class UnaryOp(Expr):
+	def __init__(self, symbol, op, operand, numpyOp=None):
+		self.symbol = symbol
+		self.op = op
+		self.operand = _wrap(operand)
+		self.numpyOp = numpyOp
+	def headers(self):
+		return self.operand.headers()
+	def evaluate(self, columns, length):
+		encoded = _encoded(self.operand, columns)
+		if encoded is not None:
+			return encoded.mapValues(lambda v: None if v is None else self.op(v))
+		values = self.operand.evaluate(columns, length)
+		if isinstance(values, _Scalar):
+			return _Scalar(None if values.value is None else self.op(values.value))
+		if _isNumpy(values) and (self.numpyOp is not None or self.op is operator.neg):
+			return (self.numpyOp or self.op)(values)
+		return [None if value is None else self.op(value) for value in _listOf(values, length)]
+	def __repr__(self):
+		return '%s(%r)' % (self.symbol, self.operand)
+
+class IsIn(Expr):
+	def __init__(self, operand, values):
+		self.operand = _wrap(operand)
+		self.values = set(values)
+	def headers(self):
+		return self.operand.headers()
+	def evaluate(self, columns, length):
+		encoded = _encoded(self.operand, columns)
+		if encoded is not None:
+			return encoded.mapValues(self.values.__contains__)
+		values = self.operand.evaluate(columns, length)
+		if isinstance(values, _Scalar):
+			return _Scalar(values.value in self.values)
+		if _isNumpy(values) and all(type(value) in (int, float, bool) for value in self.values):
+			return numpy.isin(values, list(self.values))
+		contains = self.values.__contains__
+		return list(map(contains, _listOf(values, length)))
+	def __repr__(self):
+		return '%r.isin(%r)' % (self.operand, self.values)
+
+class NullTest(Expr):
+	def __init__(self, operand, isNull):
+		self.operand = _wrap(operand)
+		self.testNull = isNull
+	def headers(self):
+		return self.operand.headers()
+	def evaluate(self, columns, length):
+		encoded = _encoded(self.operand, columns)
+		if encoded is not None:
+			return encoded.mapValues(lambda v: (v is None) == self.testNull)
+		values = self.operand.evaluate(columns, length)
+		if isinstance(values, _Scalar):
+			return _Scalar((values.value is None) == self.testNull)
+		if _isNumpy(values):
+			return numpy.full(len(values), not self.testNull)
+		if self.testNull:
+			return [value is None for value in values]
+		return [value is not None for value in values]
+	def __repr__(self):
+		return '%r.%s()' % (self.operand, 'isNull' if self.testNull else 'notNull')
+
+def col(header):
+	'''returns an expression for the values of the column with the given header'''
+	return Column(header)
+
+def lit(value):
+	'''returns an expression with the given value for every row'''
+	return Literal(value)
+
+def evaluate(expr, table, length):
+	'''evaluates expr (or a plain value) over the columns of table (anything with headers() and column(header)), returning a list or numpy array
+	raises a DataTableException if the expression refers to a column which isn't in the table'''
+	expr = _wrap(expr)
+	headers = set(table.headers())
+	missing = expr.headers() - headers
+	if missing:
+		raise DataTableException("Expression %r refers to unknown column(s): %s" % (expr, ', '.join(map(repr, sorted(missing, key=str)))))
+	result = expr.evaluate({h: table.column(h) for h in expr.headers()}, length)
+	if isinstance(result, _Scalar):
+		return [result.value] * length
+	return result
@@ -0,0 +1,146 @@
+'''
+Secondary indexes over the values of a single DataTable column.
+Indexes map column values to the (ascending) row positions holding them, so that filters can be answered without
+scanning every row of the table:
+	HashIndex - equality and membership lookups
+	SortedIndex - range, min/max and prefix lookups, using the same sortKey ordering as DataTable.sort
+Create them through DataTable.createIndex - the table keeps them up to date as it changes.
+'''
+from bisect import bisect_left, bisect_right
+from collections import defaultdict
+from heapq import merge
+from datatable_util import DataTableException, sortKey
+
+NUMBER_TYPES = (int, float)
+
+class HashIndex(object):
+	'''value -> row positions index used for equality and membership lookups'''
+	def __init__(self, values=()):
+		self.__positions = defaultdict(list)
+		self.extend(values)
+	def extend(self, values, start=0):
+		'''index the given values, the first of which is at row position start'''
+		positions = self.__positions
+		try:
+			for i, value in enumerate(values, start):
+				positions[value].append(i)
+		except TypeError:
+			raise DataTableException("can't build a hash index over unhashable value: %r" % (value,))
+	def __len__(self):
+		'''The number of distinct values in the index'''
+		return len(self.__positions)
+	def __contains__(self, value):
+		try:
+			return value in self.__positions
+		except TypeError:
+			return False
+	def __iter__(self):
+		return iter(self.__positions)
+	def keys(self):
+		return self.__positions.keys()
+	def lookup(self, value):
+		'''returns the row positions holding value (raises TypeError if value is unhashable)'''
+		positions = self.__positions.get(value)
+		if positions is None:
+			return []
+		return positions
+	def lookupAll(self, values):
+		'''returns the row positions (in ascending order) holding any of the given values
+	values may be any collection supporting 'in', or another index'''
+		positions = self.__positions
+		if hasattr(values, '__len__') and hasattr(values, '__iter__') and len(values) <= len(positions):
+			found = {}
+			for value in values:
+				try:
+					if value in positions:
+						found[value] = positions[value]
+				except TypeError:
+					continue
+			matches = list(found.values())
+		else:
+			matches = [p for value, p in positions.items() if value in values]
+		if len(matches) == 1:
+			return matches[0]
+		return sorted(i for p in matches for i in p)
+
+class SortedIndex(object):
+	'''row positions ordered by their value (by sortKey, ties in row order), used for range, min/max and prefix lookups'''
+	def __init__(self, values=()):
+		self.__keys = []
+		self.__positions = []
+		self.extend(values)
+	def extend(self, values, start=0):
+		'''index the given values, the first of which is at row position start'''
+		entries = sorted((sortKey(value), i) for i, value in enumerate(values, start))
+		if self.__positions:
+			entries = list(merge(zip(self.__keys, self.__positions), entries))
+		self.__keys = [key for key, i in entries]
+		self.__positions = [i for key, i in entries]
+	def __len__(self):
+		'''The number of indexed rows'''
+		return len(self.__positions)
+	def range(self, lo=None, hi=None, includeLo=True, includeHi=False):
+		'''returns the ascending positions of the rows with lo <= value < hi (of the type of the bounds, see rangeTypes)
+	either bound may be None to leave that end of the range open, includeLo and includeHi control if the bounds themselves match'''
+		types = rangeTypes(lo, hi)
+		if types is None:
+			return sorted(self.__positions)
+		keys = self.__keys
+		positions = []
+		for t in types:
+			# keys are (hash(type), value), so (h,) sorts before all of the keys of type t and (h + 1,) after them
+			h = hash(t)
+			start = bisect_left(keys, (h,)) if lo is None else (bisect_left if includeLo else bisect_right)(keys, (h, lo))
+			stop = bisect_left(keys, (h + 1,)) if hi is None else (bisect_right if includeHi else bisect_left)(keys, (h, hi))
+			positions += self.__positions[start:stop]
+		return sorted(positions)
+	def prefix(self, prefix):
+		'''returns the ascending positions of the rows with values (of the same type as prefix) starting with prefix'''
+		keys = self.__keys
+		start = stop = bisect_left(keys, sortKey(prefix))
+		keyType = sortKey(prefix)[0]
+		while stop < len(keys) and keys[stop][0] == keyType and keys[stop][1].startswith(prefix):
+			stop += 1
+		return sorted(self.__positions[start:stop])
+	def first(self):
+		'''returns the position of the first row holding the minimum value (or None if empty)'''
+		if not self.__positions:
+			return None
+		return self.__positions[0]
+	def last(self):
+		'''returns the position of the last row holding the maximum value (or None if empty)'''
+		if not self.__positions:
+			return None
+		return self.__positions[-1]
+
+def rangeTypes(lo=None, hi=None):
+	'''returns the types of the values in a range with the given bounds (or None if both are None, for all values):
+	int and float for numeric bounds, which compare by value (so 100 <= 250.0 < 500), otherwise the type of the bounds
+	raises a DataTableException if the bounds are of different types'''
+	types = None
+	for bound in (lo, hi):
+		if bound is not None:
+			boundTypes = NUMBER_TYPES if type(bound) in NUMBER_TYPES else (type(bound),)
+			if types is not None and boundTypes != types:
+				raise DataTableException("The bounds of a range must be of the same type, not %r and %r" % (lo, hi))
+			types = boundTypes
+	return types
+
+def inRange(lo=None, hi=None, includeLo=True, includeHi=False):
+	'''returns a predicate matching the values which SortedIndex.range would return'''
+	types = rangeTypes(lo, hi)
+	def predicate(value):
+		if types is not None and type(value) not in types:
+			return False
+		if lo is not None and (value < lo if includeLo else value <= lo):
+			return False
+		if hi is not None and (value > hi if includeHi else value >= hi):
+			return False
+		return True
+	return predicate
+
+def hasPrefix(prefix):
+	'''returns a predicate matching the values which SortedIndex.prefix would return'''
+	return lambda value: type(value) is type(prefix) and value.startswith(prefix)
+
+INDEX_TYPES = {'hash': HashIndex, 'sorted': SortedIndex}
@@ -0,0 +1,228 @@
+'''
+Join engines used by DataTable.join and DataTableStream.join:
+	hashJoin - indexes one side in memory (with HashJoinIndex when it is the right side) and probes it with the other
+	mergeJoin - streams two inputs already sorted on their join fields, holding only one run of duplicate keys in memory
+The rows of the two sides are combined as follows (for joinParams of <field in left> -> <field in right>):
+	matched rows contain all of the fields from the left row, plus the non-key fields from the right row (named otherFieldPrefix + field)
+	unmatched left rows (outer joins) have None for the fields from the right
+	unmatched right rows (outer joins) have their key fields named as in the left, and None for the non-key fields from the left
+The hash join outputs rows in the order of the left rows (each followed by its matches in the order of the right rows),
+	followed by the unmatched right rows in their original order.
+The merge join outputs rows in join key order, with unmatched right rows in place among the left rows.
+'''
+from operator import itemgetter
+from datatable_util import AttributeDict, DataTableException, JoinType, sortKey
+
+def _keyGetter(fields):
+	'''returns a function extracting the join key from a row (the bare value for a single field, otherwise a tuple)'''
+	if not fields:
+		return lambda row: ()
+	return itemgetter(*fields)
+
+def joinedHeaders(leftHeaders, rightHeaders, joinParams, otherFieldPrefix=''):
+	'''returns the headers of the rows produced by joining rows with leftHeaders to rows with rightHeaders'''
+	rightKeys = set(joinParams.values())
+	return list(leftHeaders) + [otherFieldPrefix + h for h in rightHeaders if h not in rightKeys]
+
+def _rowBuilders(joinParams, leftHeaders, rightHeaders, otherFieldPrefix):
+	'''returns the functions creating the (matched, left only, right only) output rows'''
+	rightKeys = set(joinParams.values())
+	newHeaders = [h for h in rightHeaders if h not in rightKeys]
+	prefixedHeaders = [otherFieldPrefix + h for h in newHeaders]
+	emptyRight = dict.fromkeys(prefixedHeaders)
+	reversedParams = {v: k for k, v in joinParams.items()}
+	rightOuterHeaders = [(reversedParams[h] if h in reversedParams else otherFieldPrefix + h, h) for h in rightHeaders]
+	emptyLeft = [(h, None) for h in leftHeaders if h not in joinParams]
+	def matched(leftRow, rightRow):
+		row = AttributeDict(leftRow)
+		row.update(zip(prefixedHeaders, map(rightRow.__getitem__, newHeaders)))
+		return row
+	def leftOnly(leftRow):
+		row = AttributeDict(leftRow)
+		row.update(emptyRight)
+		return row
+	def rightOnly(rightRow):
+		row = AttributeDict((outHeader, rightRow[h]) for outHeader, h in rightOuterHeaders)
+		row.update(emptyLeft)
+		return row
+	return matched, leftOnly, rightOnly
+
+def sortedKeyGetter(fields):
+	'''returns a function extracting the ordering key of a row for the given fields (the key used by DataTable.sort)'''
+	return lambda row: tuple(sortKey(row[field]) for field in fields)
+
+def _values(key):
+	'''the field values of a key returned by sortedKeyGetter'''
+	return tuple(value for _, value in key)
+
+def isSorted(rows, key):
+	'''returns if the rows are in (non-decreasing) order of the key function'''
+	previous = None
+	for i, row in enumerate(rows):
+		k = key(row)
+		if i and k < previous:
+			return False
+		previous = k
+	return True
+
+def _sortedRuns(rows, key, side):
+	'''yields (key, rows) for each run of rows with the same key, checking that the keys are ascending'''
+	run = None
+	for row in rows:
+		k = key(row)
+		if run is not None and k == runKey:
+			run.append(row)
+			continue
+		if run is not None:
+			if k < runKey:
+				raise DataTableException("%s side of merge join isn't sorted on its join fields: %r follows %r" % (side, _values(k), _values(runKey)))
+			yield runKey, run
+		runKey, run = k, [row]
+	if run is not None:
+		yield runKey, run
+
+def _uniqueRuns(runs):
+	'''passes on the (key, rows) runs, raising a DataTableException for any run of more than one row'''
+	for runKey, run in runs:
+		if len(run) > 1:
+			raise DataTableException("join key %r is repeated in the table expected to have unique keys" % (_values(runKey),))
+		yield runKey, run
+
+class HashJoinIndex(object):
+	'''
+	The key -> rows index over the right rows of a hash join (used by hashJoin, and for left rows which arrive one at a time, e.g. asynchronously)
+	probe returns the output rows for each left row, and after the last left row unmatched yields the unmatched right rows (for right outer joins).
+	Parameters are as for hashJoin (right must be a sequence).
+	'''
+	def __init__(self, right, joinParams, leftHeaders, rightHeaders, otherFieldPrefix='', joinType=JoinType.LEFT_OUTER_JOIN, expectedUnique=False):
+		self.__leftKey = _keyGetter(list(joinParams.keys()))
+		self.__rightKey = _keyGetter(list(joinParams.values()))
+		self.__matched, self.__leftOnly, self.__rightOnly = _rowBuilders(joinParams, leftHeaders, rightHeaders, otherFieldPrefix)
+		self.__joinType = joinType
+		self.__right = right
+		self.__index = {}
+		for rightRow in right:
+			key = self.__rightKey(rightRow)
+			if key not in self.__index:
+				self.__index[key] = [rightRow]
+			elif expectedUnique:
+				raise DataTableException("join key %r is repeated in the table expected to have unique keys" % (key,))
+			else:
+				self.__index[key].append(rightRow)
+		self.__seenKeys = set()
+	def probe(self, leftRow):
+		'''returns the list of output rows for the left row'''
+		key = self.__leftKey(leftRow)
+		rightRows = self.__index.get(key)
+		if rightRows is None:
+			return [self.__leftOnly(leftRow)] if self.__joinType.leftOuter else []
+		if self.__joinType.rightOuter:
+			self.__seenKeys.add(key)
+		return [self.__matched(leftRow, rightRow) for rightRow in rightRows]
+	def unmatched(self):
+		'''yields the right rows which didn't match any of the left rows probed (for right outer joins)'''
+		if not self.__joinType.rightOuter:
+			return
+		for rightRow in self.__right:
+			if self.__rightKey(rightRow) not in self.__seenKeys:
+				yield self.__rightOnly(rightRow)
+
+def hashJoin(left, right, joinParams, leftHeaders, rightHeaders, otherFieldPrefix='', joinType=JoinType.LEFT_OUTER_JOIN, expectedUnique=False, buildLeft=False):
+	'''
+	Yields the rows of left joined with the rows of right
+Builds a lightweight key -> rows index over one side (the right side unless buildLeft) and probes it with the rows of the other;
+	each output row is created with a single allocation.
+Parameters:
+	left, right - the rows to join (right must be a sequence if buildLeft is false; left must be if buildLeft is true)
+	joinParams - dict of <field in left> -> <field in right>
+	leftHeaders, rightHeaders - the headers of the rows on each side
+	otherFieldPrefix - prefix for the non-key fields from the right
+	joinType - the JoinType indicating which unmatched rows are included
+	expectedUnique - the join keys of right are unique (1:1 or n:1 lookups): indexes one row per key (always building the right side),
+		raising a DataTableException if a key is repeated
+	buildLeft - index the left side instead (use when it is the smaller side)
+	'''
+	if expectedUnique or not buildLeft:
+		index = HashJoinIndex(right, joinParams, leftHeaders, rightHeaders, otherFieldPrefix, joinType, expectedUnique)
+		for leftRow in left:
+			yield from index.probe(leftRow)
+		yield from index.unmatched()
+		return
+
+	leftKey = _keyGetter(list(joinParams.keys()))
+	rightKey = _keyGetter(list(joinParams.values()))
+	matched, leftOnly, rightOnly = _rowBuilders(joinParams, leftHeaders, rightHeaders, otherFieldPrefix)
+	index = {}
+	for i, leftRow in enumerate(left):
+		key = leftKey(leftRow)
+		if key in index:
+			index[key].append(i)
+		else:
+			index[key] = [i]
+	matches = [None] * len(left)
+	unmatchedRight = []
+	for rightRow in right:
+		positions = index.get(rightKey(rightRow))
+		if positions is None:
+			if joinType.rightOuter:
+				unmatchedRight.append(rightRow)
+			continue
+		for i in positions:
+			if matches[i] is None:
+				matches[i] = [rightRow]
+			else:
+				matches[i].append(rightRow)
+	for leftRow, rightRows in zip(left, matches):
+		if rightRows is not None:
+			for rightRow in rightRows:
+				yield matched(leftRow, rightRow)
+		elif joinType.leftOuter:
+			yield leftOnly(leftRow)
+	for rightRow in unmatchedRight:
+		yield rightOnly(rightRow)
+
+def mergeJoin(left, right, joinParams, leftHeaders, rightHeaders, otherFieldPrefix='', joinType=JoinType.LEFT_OUTER_JOIN, expectedUnique=False):
+	'''
+	Yields the rows of left joined with the rows of right, where both are sorted on their join fields (by sortKey, as DataTable.sort does)
+Both sides are streamed: only the current run of right rows sharing a join key is held in memory.
+	Join keys match when they are equal under sortKey (so values of different types never match).
+	Raises a DataTableException if either side is found to be out of order.
+Parameters are as for hashJoin; expectedUnique raises a DataTableException if a join key is repeated in right
+	(reading the rest of right after the last left row to check it, as hashJoin checks all of right)
+	'''
+	leftKey = sortedKeyGetter(list(joinParams.keys()))
+	rightKey = sortedKeyGetter(list(joinParams.values()))
+	matched, leftOnly, rightOnly = _rowBuilders(joinParams, leftHeaders, rightHeaders, otherFieldPrefix)
+	rightRuns = _sortedRuns(right, rightKey, 'right')
+	if expectedUnique:
+		rightRuns = _uniqueRuns(rightRuns)
+	runKey, run = next(rightRuns, (None, None))
+	runMatched = False
+	previous = None
+	for leftRow in left:
+		key = leftKey(leftRow)
+		if previous is not None and key < previous:
+			raise DataTableException("left side of merge join isn't sorted on its join fields: %r follows %r" % (_values(key), _values(previous)))
+		previous = key
+		while run is not None and runKey < key:
+			if joinType.rightOuter and not runMatched:
+				for rightRow in run:
+					yield rightOnly(rightRow)
+			runKey, run = next(rightRuns, (None, None))
+			runMatched = False
+		if run is not None and runKey == key:
+			runMatched = True
+			for rightRow in run:
+				yield matched(leftRow, rightRow)
+		elif joinType.leftOuter:
+			yield leftOnly(leftRow)
+	if joinType.rightOuter:
+		while run is not None:
+			if not runMatched:
+				for rightRow in run:
+					yield rightOnly(rightRow)
+			runKey, run = next(rightRuns, (None, None))
+			runMatched = False
+	elif expectedUnique:
+		for runKey, run in rightRuns:
+			pass
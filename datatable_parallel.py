@@ -0,0 +1,140 @@
+'''
+Parallel row-wise stages for DataTableStream: adds a parallel method to DataTableStream (once this module is imported), e.g.
+	stream.parallel(workers=8).transform(parseLine).filter(isValid).extend({'score': score}).aggregate(...)
+The filter, transform and extend stages following parallel() are recorded (as data, rather than as chained generators)
+	and run together on chunks of chunkSize rows by a pool of worker processes (or threads);
+	the first operation which isn't one of those reads the results as an ordinary DataTableStream.
+At most 2 chunks per worker are in flight at a time, so memory use doesn't depend on the length of the stream.
+With the process executor the stage functions (and the rows) are pickled to send them to the workers,
+	so they must be defined at module level rather than as lambdas or nested functions (use executor='thread' for those).
+'''
+import os
+import pickle
+from collections import deque
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor, wait, FIRST_COMPLETED
+from itertools import islice
+from datatable_util import DataTableException
+from datatable_stream import DataTableStream, createColumnFilter
+from datatable_source import DerivedSource
+
+EXECUTORS = {'process': ProcessPoolExecutor, 'thread': ThreadPoolExecutor}
+
+def _extendRow(row, other):
+	'''returns the row with the columns of other added (as DataTableStream.extend)'''
+	if hasattr(other, '__call__'):
+		return row + other(row)
+	return row + {header: value(row) if hasattr(value, '__call__') else value for header, value in other.items()}
+
+def _applyStages(stages, rows):
+	'''returns the list of rows produced by running the rows through the stages (a list of (operation, argument))'''
+	for operation, argument in stages:
+		if operation == 'filter':
+			rows = [row for row in rows if argument(row)]
+		elif operation == 'match':
+			filters = [(header, createColumnFilter(value)) for header, value in argument.items()]
+			rows = [row for row in rows if all(matches(row[header]) for header, matches in filters)]
+		elif operation == 'transform':
+			rows = [argument(row) for row in rows]
+		else:
+			rows = [_extendRow(row, argument) for row in rows]
+	return rows
+
+class ParallelDataTableStream(object):
+	'''
+	A stream whose filter, transform and extend stages are run in parallel on chunks of rows (see the module documentation)
+	reading it reads the rows of the stream it was created from, and runs the stages on a new pool;
+	any other DataTableStream method is called on the stream of its results (see sequential)
+	'''
+	def __init__(self, stream, headers, workers=None, chunkSize=1000, ordered=True, executor='process', stages=()):
+		if not isinstance(executor, Executor) and executor not in EXECUTORS:
+			raise DataTableException("Unknown executor: %r.  Expected 'process', 'thread' or a concurrent.futures.Executor" % (executor,))
+		self.__stream = stream
+		self.__workers = workers or os.cpu_count() or 1
+		self.__chunkSize = chunkSize
+		self.__ordered = ordered
+		self.__executor = executor
+		self.__stages = list(stages)
+		self.__headers = headers
+	def __then(self, stage, headers):
+		'''returns a new ParallelDataTableStream which also runs the given stage'''
+		return ParallelDataTableStream(self.__stream, headers, self.__workers, self.__chunkSize, self.__ordered, self.__executor, self.__stages + [stage])
+	def filter(self, filterFunction):
+		if isinstance(filterFunction, dict):
+			return self.__then(('match', filterFunction), self.headers())
+		return self.__then(('filter', filterFunction), self.headers())
+	def transform(self, transformFunction, newHeaders=None):
+		return self.__then(('transform', transformFunction), newHeaders or set())
+	def extend(self, other):
+		headers = set(self.headers()).union(other.keys()) if isinstance(other, dict) else set()
+		return self.__then(('extend', other), headers)
+	def headers(self):
+		return self.__headers
+	def replayable(self):
+		return self.__stream.replayable()
+	def __iter__(self):
+		return self.__run()
+	def sequential(self):
+		'''returns an ordinary DataTableStream of the results (the stages following it aren't run in parallel)'''
+		return DataTableStream(DerivedSource(self.__run, self.__stream), self.__headers)
+	def __getattr__(self, name):
+		if name.startswith('_'):
+			raise AttributeError(name)
+		return getattr(self.sequential(), name)
+	def __getitem__(self, index):
+		return self.sequential()[index]
+	def __or__(self, other):
+		return other(iter(self))
+	def __checkPicklable(self, chunk):
+		for operation, argument in self.__stages:
+			try:
+				pickle.dumps(argument)
+			except Exception as e:
+				raise DataTableException("Can't run the %s stage in worker processes: %r can't be pickled (%s).  Define it at module level, or use executor='thread'" % (operation, argument, e))
+		try:
+			pickle.dumps(chunk)
+		except Exception as e:
+			raise DataTableException("Can't send the rows to worker processes: they can't be pickled (%s).  Use executor='thread'" % e)
+	def __run(self):
+		rows = iter(self.__stream)
+		chunk = list(islice(rows, self.__chunkSize))
+		if not chunk:
+			return
+		if not self.__stages:
+			yield from chunk
+			yield from rows
+			return
+		if isinstance(self.__executor, Executor):
+			pool, ownPool = self.__executor, False
+		else:
+			if self.__executor == 'process':
+				self.__checkPicklable(chunk)
+			pool, ownPool = EXECUTORS[self.__executor](max_workers=self.__workers), True
+		pending = deque() if self.__ordered else set()
+		try:
+			while chunk or pending:
+				while chunk and len(pending) < 2 * self.__workers:
+					future = pool.submit(_applyStages, self.__stages, chunk)
+					if self.__ordered:
+						pending.append(future)
+					else:
+						pending.add(future)
+					chunk = list(islice(rows, self.__chunkSize))
+				if self.__ordered:
+					yield from pending.popleft().result()
+				else:
+					done, pending = wait(pending, return_when=FIRST_COMPLETED)
+					for future in done:
+						yield from future.result()
+		finally:
+			for future in pending:
+				future.cancel()
+			if ownPool:
+				pool.shutdown(wait=True)
+
+def parallel(self, workers=None, chunkSize=1000, ordered=True, executor='process'):
+	'''returns a stream which runs the filter, transform and extend stages following it in parallel, on chunks of chunkSize rows (see datatable_parallel)
+	workers - the number of worker processes or threads (defaults to the number of CPUs)
+	ordered - keep the rows in their original order (if false, the rows of each chunk are yielded as soon as it is done)
+	executor - 'process' (for CPU bound stages), 'thread' (for stages which release the GIL, e.g. I/O), or a concurrent.futures.Executor to use'''
+	return ParallelDataTableStream(self, self.headers(), workers, chunkSize, ordered, executor)
+DataTableStream.parallel = parallel
@@ -0,0 +1,96 @@
+'''
+External (spill-to-disk) merge sort, used by DataTableStream.sorted to sort more rows than fit in memory.
+Rows are collected into runs of about memoryLimit bytes, each run is sorted in memory and pickled to a temporary file,
+	and the runs are then k-way merged (with heapq.merge) as the sorted rows are consumed.
+The runs are read back a batch of rows at a time, with the batches sized so that the batches of all of the runs being merged
+	take about memoryLimit bytes between them.
+The sort is stable, so it orders rows exactly as sorting them in memory with the same key would.
+'''
+import heapq
+import pickle
+import sys
+import tempfile
+from itertools import islice
+
+BATCH_SIZE = 1000
+MAX_MERGE_WIDTH = 64
+
+def rowSize(row):
+	'''rough estimate of the bytes of memory used by a row (the row plus its values, not counting shared keys)'''
+	return sys.getsizeof(row) + sum(map(sys.getsizeof, row.values()))
+
+def _batchSize(memoryLimit, rowBytes):
+	'''returns the number of rows (of about rowBytes bytes each) per batch of a run, so that reading a batch of each of the runs
+	being merged (plus the batch being written, when merging runs into a longer run) holds about memoryLimit bytes'''
+	return max(1, min(BATCH_SIZE, int(memoryLimit / ((MAX_MERGE_WIDTH + 1) * max(rowBytes, 1)))))
+
+def _spill(rows, tempDir, batchSize=BATCH_SIZE):
+	'''writes the rows to a new temporary file (in batches of batchSize rows), returning the file'''
+	f = tempfile.TemporaryFile(dir=tempDir)
+	rows = iter(rows)
+	while True:
+		batch = list(islice(rows, batchSize))
+		if not batch:
+			break
+		pickle.dump(batch, f, pickle.HIGHEST_PROTOCOL)
+	f.seek(0)
+	return f
+
+def _readRun(f):
+	'''yields the rows written to f by _spill, holding one batch in memory at a time'''
+	while True:
+		try:
+			batch = pickle.load(f)
+		except EOFError:
+			return
+		yield from batch
+
+def externalSort(rows, key, memoryLimit, tempDir=None):
+	'''
+	Yields the rows sorted by key, holding about memoryLimit bytes of rows in memory (as estimated by rowSize)
+If all of the rows fit within memoryLimit they are sorted in memory without touching the disk.
+	The rows (and their values) must be picklable to be spilled.
+Parameters:
+	rows - iterable of rows to sort
+	key - key function, as for sorted
+	memoryLimit - the approximate number of bytes of rows to hold in memory at once
+	tempDir - the directory to write the runs to (defaults to tempfile's default, e.g. $TMPDIR)
+	'''
+	runs = []
+	try:
+		buffer = []
+		size = 0
+		batchSize = None
+		for row in rows:
+			buffer.append(row)
+			size += rowSize(row)
+			if size >= memoryLimit:
+				if batchSize is None:
+					batchSize = _batchSize(memoryLimit, size / len(buffer))
+				buffer.sort(key=key)
+				runs.append(_spill(buffer, tempDir, batchSize))
+				buffer = []
+				size = 0
+		buffer.sort(key=key)
+		if not runs:
+			yield from buffer
+			return
+		# the remaining rows are spilled too, so that the merge only holds a batch of each run
+		runs.append(_spill(buffer, tempDir, batchSize))
+		buffer = None
+		# merge the runs in groups to stay within MAX_MERGE_WIDTH open runs
+		while len(runs) > MAX_MERGE_WIDTH:
+			merged = []
+			try:
+				for i in range(0, len(runs), MAX_MERGE_WIDTH):
+					group = runs[i:i + MAX_MERGE_WIDTH]
+					merged.append(_spill(heapq.merge(*map(_readRun, group), key=key), tempDir, batchSize))
+			finally:
+				# the merged runs replace the runs they were merged from (and are closed below if the merge fails)
+				for f in runs:
+					f.close()
+				runs = merged
+		yield from heapq.merge(*map(_readRun, runs), key=key)
+	finally:
+		for f in runs:
+			f.close()
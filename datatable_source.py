@@ -0,0 +1,202 @@
+'''
+Sources of rows for DataTableStream, which record whether they can be iterated (replayed) more than once:
+	IteratorSource - wraps an iterator (e.g. a generator): the rows can only be read once
+	TableSource - the rows of a DataTable (or a list of rows)
+	FileSource - re-opens and parses a file each time it is iterated
+	QuerySource - re-executes a DB-API 2.0 query each time it is iterated
+	DerivedSource - the rows of a stream stage (e.g. filter), produced by re-reading the stream(s) it reads from on each pass
+	CachedSource - tees the rows of another source into memory as they are first read (spilling them to a temporary file past a memory limit),
+		and replays them from there
+Operations which read a stream more than once (e.g. filtering a column by another column of the same stream) read its source again,
+	so they work on replayable sources, and raise a DataTableException (rather than silently seeing no rows) for a source which can't be replayed.
+'''
+import csv
+import os
+import pickle
+import tempfile
+from bisect import bisect_right
+from datatable_util import AttributeDict, DataTableException
+from datatable_sort import BATCH_SIZE, rowSize
+
+def isReplayable(rows):
+	'''returns if the rows (a source, stream, table or other iterable) can be iterated more than once'''
+	if isinstance(rows, StreamSource):
+		return rows.replayable
+	# looked up on the type, as tables return a column for any unknown attribute
+	if callable(getattr(type(rows), 'replayable', None)):
+		return rows.replayable()
+	return iter(rows) is not rows
+
+class StreamSource(object):
+	'''base class of the sources of a DataTableStream's rows: iterating a source starts a new pass over its rows'''
+	replayable = True
+	def __iter__(self):
+		raise NotImplementedError()
+
+class IteratorSource(StreamSource):
+	'''the rows of an iterator, which can only be read once'''
+	replayable = False
+	def __init__(self, rows):
+		self.__rows = rows
+		self.__read = False
+	def __iter__(self):
+		if self.__read:
+			raise DataTableException("The rows of this stream have already been read and can't be replayed.  Use cache() (or a replayable source, e.g. a table, file or query) to read them more than once")
+		self.__read = True
+		return iter(self.__rows)
+
+class TableSource(StreamSource):
+	'''the rows of a DataTable (or any other sequence of rows)'''
+	def __init__(self, table):
+		self.table = table
+	def __iter__(self):
+		return iter(self.table)
+
+def _csvRows(f):
+	return (AttributeDict(row) for row in csv.DictReader(f))
+
+class FileSource(StreamSource):
+	'''
+	The rows of a file, which is re-opened and parsed on each pass
+parse - a function taking the open file and returning an iterable of rows (defaults to reading a csv file with a header line)
+	'''
+	def __init__(self, path, parse=None, encoding=None):
+		self.path = path
+		self.parse = parse
+		self.encoding = encoding
+	def __iter__(self):
+		# csv.reader handles newlines itself
+		with open(os.path.expanduser(self.path), encoding=self.encoding, newline='' if self.parse is None else None) as f:
+			yield from (self.parse or _csvRows)(f)
+	def headers(self):
+		'''returns the headers of the file: from the header line of a csv file, otherwise the keys of its first row'''
+		if self.parse is None:
+			with open(os.path.expanduser(self.path), encoding=self.encoding, newline='') as f:
+				return next(csv.reader(f), [])
+		for row in self:
+			return list(row.keys())
+		return []
+
+class QuerySource(StreamSource):
+	'''
+	The rows returned by a query, which is re-executed (with a new cursor) on each pass
+connection - a DB-API 2.0 connection
+params - the parameters of the query (passed to cursor.execute)
+arraySize - the number of rows to fetch at a time
+	'''
+	def __init__(self, connection, query, params=None, arraySize=1000):
+		self.connection = connection
+		self.query = query
+		self.params = params
+		self.arraySize = arraySize
+	def __execute(self):
+		cursor = self.connection.cursor()
+		if self.params is None:
+			cursor.execute(self.query)
+		else:
+			cursor.execute(self.query, self.params)
+		return cursor
+	def __iter__(self):
+		cursor = self.__execute()
+		try:
+			headers = [description[0] for description in cursor.description or []]
+			while True:
+				rows = cursor.fetchmany(self.arraySize)
+				if not rows:
+					break
+				for row in rows:
+					yield AttributeDict(zip(headers, row))
+		finally:
+			cursor.close()
+	def headers(self):
+		'''returns the headers of the query's results (executing the query without fetching its rows)'''
+		cursor = self.__execute()
+		try:
+			return [description[0] for description in cursor.description or []]
+		finally:
+			cursor.close()
+
+class DerivedSource(StreamSource):
+	'''
+	The rows returned by makeRows() (e.g. a generator function reading the rows of other streams), which is called again for each pass
+	replayable if all of the inputs (the streams or other rows makeRows reads) are
+	'''
+	def __init__(self, makeRows, *inputs):
+		self.__makeRows = makeRows
+		self.replayable = all(map(isReplayable, inputs))
+	def __iter__(self):
+		return iter(self.__makeRows())
+
+class CachedSource(StreamSource):
+	'''
+	Replays the rows of another source (or stream), which are only read once: as the rows are first read they are kept in memory,
+	and once they take more than about memoryLimit bytes (as estimated by datatable_sort.rowSize) they are pickled to a temporary file,
+	in batches of datatable_sort.BATCH_SIZE rows, from which later passes read them back
+	Passes may be interleaved or stop early: a pass which gets ahead of the rows read so far reads the next rows from the source.
+	memoryLimit - None to keep all of the rows in memory
+	tempDir - the directory of the temporary file (defaults to tempfile's default, e.g. $TMPDIR)
+	'''
+	def __init__(self, rows, memoryLimit=None, tempDir=None):
+		self.__rows = rows
+		self.__memoryLimit = memoryLimit
+		self.__tempDir = tempDir
+		self.__source = None
+		self.__complete = False
+		self.__memory = []
+		self.__size = 0
+		self.__file = None
+		self.__batchStarts = []
+		self.__batchOffsets = []
+		self.__spilled = 0
+	def __next(self):
+		'''reads the next row from the source into the cache, returning False at the end of the source'''
+		if self.__source is None:
+			self.__source = iter(self.__rows)
+		for row in self.__source:
+			self.__memory.append(row)
+			if self.__memoryLimit is not None:
+				self.__size += rowSize(row)
+				if self.__size >= self.__memoryLimit:
+					self.__spill()
+			return True
+		self.__complete = True
+		self.__source = None
+		return False
+	def __spill(self):
+		if self.__file is None:
+			self.__file = tempfile.TemporaryFile(dir=self.__tempDir)
+		self.__file.seek(0, os.SEEK_END)
+		for start in range(0, len(self.__memory), BATCH_SIZE):
+			self.__batchStarts.append(self.__spilled + start)
+			self.__batchOffsets.append(self.__file.tell())
+			pickle.dump(self.__memory[start:start + BATCH_SIZE], self.__file, pickle.HIGHEST_PROTOCOL)
+		self.__spilled += len(self.__memory)
+		self.__memory = []
+		self.__size = 0
+	def __batch(self, k):
+		self.__file.seek(self.__batchOffsets[k])
+		return pickle.load(self.__file)
+	def __iter__(self):
+		n = 0
+		while True:
+			if n < self.__spilled:
+				k = bisect_right(self.__batchStarts, n) - 1
+				start = self.__batchStarts[k]
+				batch = self.__batch(k)
+				yield from batch[n - start:]
+				n = start + len(batch)
+			elif n - self.__spilled < len(self.__memory):
+				yield self.__memory[n - self.__spilled]
+				n += 1
+			elif self.__complete or not self.__next():
+				return
+	def close(self):
+		'''removes the temporary file (if any) and drops the rows held in memory; the source can't be read afterwards'''
+		if self.__file is not None:
+			self.__file.close()
+			self.__file = None
+		self.__memory = []
+		self.__batchStarts = []
+		self.__batchOffsets = []
+		self.__spilled = 0
+		self.__complete = True
@@ -0,0 +1,658 @@
+'''
+Typed column storage used by datatable_alt.DataColumn in place of a list of values.
+Each storage is a sequence of the column's values (None for nulls) over compact buffers:
+	TypedStorage - int64, float64 or bool values in an array (or a memoryview, e.g. over a memory-mapped file)
+	StringStorage - str values as utf-8 bytes in a single blob, with an array of the offsets of each value in the blob
+	DictionaryStorage - ('category') low cardinality str values as a list of the distinct values and an array of int codes into it
+Nulls are recorded in a separate bitmap (bit i set if value i is None), which is None if the column has no nulls.
+	SelectionStorage - a view of the values of another storage (or list) at the positions in an index vector
+	ChunkedStorage - values held in a list of immutable chunks, so that appending to a column doesn't copy its existing values
+		(merged according to a CompactionPolicy)
+Storages are created by type inference (see columnKind and makeStorage), by DataTable.load, or by selecting from another storage (take, select, gather).
+A TypedStorage over an array may be changed in place with setValue (if the value fits its kind);
+	otherwise a DataColumn copies its storage into a list before it is changed (see DataColumn.__setitem__).
+NumPy is used to gather, compare and sort typed values when it is installed, but isn't required.
+'''
+from array import array
+from bisect import bisect_right
+from itertools import chain
+from datatable_util import DataTableException, sortKey
+try:
+	import numpy
+except ImportError:
+	numpy = None
+
+TYPECODES = {'int64': 'q', 'float64': 'd', 'bool': 'b'}
+NUMPY_TYPES = {'int64': 'int64', 'float64': 'float64', 'bool': 'int8'}
+PYTHON_TYPES = {'int64': int, 'float64': float, 'bool': bool, 'string': str}
+KINDS = ('int64', 'float64', 'bool', 'string', 'category', 'object')
+CATEGORY_MAX_RATIO = 0.5
+INT64_MIN, INT64_MAX = -2**63, 2**63 - 1
+
+def isNull(nulls, i):
+	'''returns if bit i of the null bitmap is set'''
+	return nulls[i >> 3] & (1 << (i & 7))
+
+def nullBitmap(values):
+	'''returns a bitmap with bit i set where values[i] is None, or None if none of the values are None'''
+	bitmap = None
+	for i, value in enumerate(values):
+		if value is None:
+			if bitmap is None:
+				bitmap = bytearray((len(values) + 7) // 8)
+			bitmap[i >> 3] |= 1 << (i & 7)
+	return bitmap
+
+def columnKind(values):
+	'''returns the kind of storage which can hold all of the values: 'int64', 'float64', 'bool', 'string', or 'object' if none can
+	(values of mixed types are always 'object', so that the values keep their types)'''
+	kind = None
+	for value in values:
+		if value is None:
+			continue
+		t = type(value)
+		if t is int:
+			valueKind = 'int64' if INT64_MIN <= value <= INT64_MAX else 'object'
+		elif t is float:
+			valueKind = 'float64'
+		elif t is bool:
+			valueKind = 'bool'
+		elif t is str:
+			valueKind = 'string'
+		else:
+			return 'object'
+		if kind is None:
+			kind = valueKind
+		elif kind != valueKind:
+			return 'object'
+		if kind == 'object':
+			return kind
+	return kind or 'object'
+
+def inferKind(values):
+	'''returns the kind of storage to use for the values: as columnKind, but 'category' for str values with few distinct values
+	(at most CATEGORY_MAX_RATIO of the number of values)'''
+	kind = columnKind(values)
+	if kind == 'string' and len(set(values)) <= CATEGORY_MAX_RATIO * len(values):
+		return 'category'
+	return kind
+
+def canHold(kind, valueKind):
+	'''returns if storage of the given kind can hold values of valueKind (as returned by columnKind)'''
+	return kind == valueKind or (kind == 'category' and valueKind == 'string')
+
+def fullStorage(kind, value, length):
+	'''returns a storage of the given kind holding length copies of value'''
+	if kind in TYPECODES and value is not None:
+		return TypedStorage(kind, array(TYPECODES[kind], [value]) * length)
+	if kind == 'category':
+		return DictionaryStorage([value] if value is not None else [], array('i', [0 if value is not None else -1]) * length)
+	return makeStorage([value] * length, kind)
+
+def _kindOf(value):
+	return columnKind([value]) if value is not None else None
+
+def makeStorage(values, kind=None):
+	'''returns a storage holding the given list of values (using inferKind if kind isn't given), or None for the 'object' kind'''
+	if kind is None:
+		kind = inferKind(values)
+	if kind == 'category':
+		return DictionaryStorage.encode(values)
+	nulls = nullBitmap(values)
+	if kind in TYPECODES:
+		if nulls is None:
+			return TypedStorage(kind, array(TYPECODES[kind], values))
+		return TypedStorage(kind, array(TYPECODES[kind], (0 if value is None else value for value in values)), nulls)
+	if kind == 'string':
+		encoded = [b'' if value is None else value.encode('utf-8') for value in values]
+		offsets = array('q', [0])
+		position = 0
+		for value in encoded:
+			position += len(value)
+			offsets.append(position)
+		return StringStorage(offsets, b''.join(encoded), nulls)
+	return None
+
+class ColumnStorage(object):
+	'''base class for the read-only sequences of values held by a DataColumn'''
+	kind = 'object'
+	encoded = False
+	def __len__(self):
+		raise NotImplementedError()
+	def value(self, index):
+		'''returns the value at the (non-negative) index'''
+		raise NotImplementedError()
+	def __getitem__(self, index):
+		if isinstance(index, slice):
+			return [self.value(i) for i in range(*index.indices(len(self)))]
+		length = len(self)
+		if index < 0:
+			index += length
+		if not 0 <= index < length:
+			raise IndexError("column index out of range")
+		return self.value(index)
+	def __iter__(self):
+		return map(self.value, range(len(self)))
+	def take(self, indices):
+		'''returns a new storage with the values at the given indices'''
+		return _storageOrList([self.value(i) for i in indices], self.kind)
+	def writable(self):
+		'''returns if the values may be changed in place (they are held in an array rather than e.g. a memory-mapped file)'''
+		return False
+	def gather(self, indices):
+		'''returns a new storage with the values at the given indices, or None where the index is -1 (e.g. the unmatched rows of an outer join)'''
+		return _storageOrList([None if i < 0 else self.value(i) for i in indices], self.kind)
+	def setValue(self, index, value):
+		'''sets the value at index in place, returning False if this storage can't hold it (e.g. it is read-only, or the value is of another kind)'''
+		return False
+	def copy(self):
+		'''returns a copy of this storage which may be changed independently (read-only storages return themselves)'''
+		return self
+	def numpyValues(self):
+		'''returns the values as a numpy array if numpy is installed and they can all be represented in one (no nulls), otherwise None'''
+		return None
+	def mapValues(self, fn):
+		'''returns a list of fn(value) for each value (dictionary encoded storages call fn once per distinct value)'''
+		return list(map(fn, self))
+	def __repr__(self):
+		return '%s(%s, %d values)' % (type(self).__name__, self.kind, len(self))
+
+class TypedStorage(ColumnStorage):
+	'''int64, float64 or bool values held in an array (or a memoryview cast to the matching format)'''
+	def __init__(self, kind, values, nulls=None):
+		self.kind = kind
+		self.__values = values
+		self.__nulls = nulls
+	def __len__(self):
+		return len(self.__values)
+	def value(self, index):
+		if self.__nulls is not None and isNull(self.__nulls, index):
+			return None
+		if self.kind == 'bool':
+			return bool(self.__values[index])
+		return self.__values[index]
+	def __iter__(self):
+		values = map(bool, self.__values) if self.kind == 'bool' else iter(self.__values)
+		nulls = self.__nulls
+		if nulls is None:
+			return values
+		return (None if isNull(nulls, i) else value for i, value in enumerate(values))
+	def buffers(self):
+		'''returns (values, nulls) - the buffers holding the values and the null bitmap (or None)'''
+		return self.__values, self.__nulls
+	def _numpy(self):
+		'''returns the values as a numpy array sharing this storage's buffer (or None if numpy isn't installed)'''
+		if numpy is None:
+			return None
+		return numpy.frombuffer(self.__values, dtype=NUMPY_TYPES[self.kind])
+	def hasNulls(self):
+		return self.__nulls is not None and any(self.__nulls)
+	def numpyValues(self):
+		if numpy is None or self.hasNulls():
+			return None
+		values = self._numpy()
+		return values.astype(bool) if self.kind == 'bool' else values
+	def writable(self):
+		'''returns if the values may be changed in place (they are held in an array rather than e.g. a memory-mapped file)'''
+		return isinstance(self.__values, array)
+	def setValue(self, index, value):
+		if not self.writable() or (value is not None and _kindOf(value) != self.kind):
+			return False
+		if index < 0:
+			index += len(self)
+		if value is None and self.__nulls is None:
+			self.__nulls = bytearray((len(self) + 7) // 8)
+		elif self.__nulls is not None and not isinstance(self.__nulls, bytearray):
+			self.__nulls = bytearray(self.__nulls)
+		if value is None:
+			self.__values[index] = 0
+			self.__nulls[index >> 3] |= 1 << (index & 7)
+			return True
+		self.__values[index] = value
+		if self.__nulls is not None:
+			self.__nulls[index >> 3] &= ~(1 << (index & 7))
+		return True
+	def copy(self):
+		if not self.writable():
+			return self
+		return TypedStorage(self.kind, array(TYPECODES[self.kind], self.__values), None if self.__nulls is None else bytearray(self.__nulls))
+	def take(self, indices):
+		if not isinstance(indices, (list, range, array)):
+			indices = list(indices)
+		values = self._numpy()
+		if values is not None:
+			taken = array(TYPECODES[self.kind])
+			taken.frombytes(values[numpy.fromiter(indices, dtype=numpy.int64, count=len(indices))].tobytes())
+		else:
+			taken = array(TYPECODES[self.kind], map(self.__values.__getitem__, indices))
+		nulls = None
+		if self.hasNulls():
+			nulls = nullBitmap([None if isNull(self.__nulls, i) else True for i in indices])
+		return TypedStorage(self.kind, taken, nulls)
+	def gather(self, indices):
+		if not len(self):
+			return fullStorage(self.kind, None, len(indices))
+		taken = self.take(array('q', [0 if i < 0 else i for i in indices]))
+		values, nulls = taken.buffers()
+		if -1 in indices:
+			if nulls is None:
+				nulls = bytearray((len(indices) + 7) // 8)
+			for position, i in enumerate(indices):
+				if i < 0:
+					nulls[position >> 3] |= 1 << (position & 7)
+		return TypedStorage(self.kind, values, nulls)
+	def indicesOf(self, value):
+		'''returns the ascending indices of the values equal to value'''
+		if value is None:
+			if self.__nulls is None:
+				return []
+			return [i for i in range(len(self)) if isNull(self.__nulls, i)]
+		if type(value) not in (int, float, bool):
+			return []
+		values = self._numpy()
+		if values is not None:
+			indices = numpy.flatnonzero(values == value).tolist()
+		else:
+			indices = [i for i, v in enumerate(self.__values) if v == value]
+		if self.hasNulls():
+			indices = [i for i in indices if not isNull(self.__nulls, i)]
+		return indices
+	def __reduce__(self):
+		nulls = None if self.__nulls is None else bytes(self.__nulls)
+		return TypedStorage, (self.kind, array(TYPECODES[self.kind], self.__values), nulls)
+
+class StringStorage(ColumnStorage):
+	'''str values held as utf-8 bytes in one blob; value i is blob[offsets[i]:offsets[i + 1]]'''
+	kind = 'string'
+	def __init__(self, offsets, blob, nulls=None):
+		self.__offsets = offsets
+		self.__blob = blob
+		self.__nulls = nulls
+	def __len__(self):
+		return len(self.__offsets) - 1
+	def value(self, index):
+		if self.__nulls is not None and isNull(self.__nulls, index):
+			return None
+		return str(self.__blob[self.__offsets[index]:self.__offsets[index + 1]], 'utf-8')
+	def buffers(self):
+		'''returns (offsets, blob, nulls) - the buffers holding the value offsets, the utf-8 bytes and the null bitmap (or None)'''
+		return self.__offsets, self.__blob, self.__nulls
+	def take(self, indices):
+		'''returns a new StringStorage with the values at the given indices (copying their bytes without decoding them)'''
+		offsets, blob = self.__offsets, self.__blob
+		if not isinstance(indices, (list, range, array)):
+			indices = list(indices)
+		encoded = [blob[offsets[i]:offsets[i + 1]] for i in indices]
+		newOffsets = array('q', [0])
+		position = 0
+		for value in encoded:
+			position += len(value)
+			newOffsets.append(position)
+		nulls = None
+		if self.__nulls is not None:
+			nulls = nullBitmap([None if isNull(self.__nulls, i) else True for i in indices])
+		return StringStorage(newOffsets, b''.join(encoded), nulls)
+	def __reduce__(self):
+		nulls = None if self.__nulls is None else bytes(self.__nulls)
+		return StringStorage, (array('q', self.__offsets), bytes(self.__blob), nulls)
+
+def _composeIndices(baseIndices, indices):
+	if isinstance(baseIndices, range) and isinstance(indices, range):
+		return baseIndices[indices.start:indices.stop:indices.step]
+	return array('q', map(baseIndices.__getitem__, indices))
+
+def _numpyIndices(indices):
+	if isinstance(indices, array):
+		return numpy.frombuffer(indices, dtype=numpy.int64)
+	return numpy.asarray(indices, dtype=numpy.int64)
+
+def _materialized(data):
+	return data
+
+def select(data, indices, composed=None):
+	'''returns a SelectionStorage of the values of data (a list or ColumnStorage) at the given indices (a range or array('q'))
+	if data is itself a selection the index vectors are composed, so the result refers to the underlying values directly;
+	pass the same composed dict when selecting the same indices from several columns, so each distinct index vector is only composed once'''
+	if not isinstance(data, SelectionStorage):
+		return SelectionStorage(data, indices)
+	if composed is None:
+		composed = {}
+	key = id(data.indices)
+	if key not in composed:
+		composed[key] = (data.indices, _composeIndices(data.indices, indices))
+	return SelectionStorage(data.base, composed[key][1])
+
+def gather(data, indices):
+	'''returns the values of data (a list or ColumnStorage) at the given indices (an array('q')) in new storage of the same kind (or a list),
+	with None where the index is -1'''
+	if isinstance(data, ColumnStorage):
+		return data.gather(indices)
+	lookup = list(data)
+	lookup.append(None)
+	return [lookup[i] for i in indices]
+
+class SelectionStorage(ColumnStorage):
+	'''a read-only view of the values of base (a list or ColumnStorage which must not change while the view exists) at the positions in indices'''
+	def __init__(self, base, indices):
+		self.base = base
+		self.indices = indices
+		self.kind = base.kind if isinstance(base, ColumnStorage) else 'object'
+		self.encoded = isinstance(base, DictionaryStorage)
+	def __len__(self):
+		return len(self.indices)
+	def value(self, index):
+		return self.base[self.indices[index]]
+	def __iter__(self):
+		return map(self.base.__getitem__, self.indices)
+	def take(self, indices):
+		return select(self, indices).compact()
+	def gather(self, indices):
+		base = self.base
+		composed = array('q', [-1 if i < 0 else self.indices[i] for i in indices])
+		if isinstance(base, ColumnStorage):
+			return base.gather(composed)
+		return gather(base, composed)
+	def compact(self):
+		'''returns the selected values in a storage of their own (of the same kind as base), or a list if base is a list'''
+		if isinstance(self.base, ColumnStorage):
+			return self.base.take(self.indices)
+		base = self.base
+		return [base[i] for i in self.indices]
+	def numpyValues(self):
+		values = self.base.numpyValues() if isinstance(self.base, ColumnStorage) else None
+		if values is None:
+			return None
+		return values[_numpyIndices(self.indices)]
+	def mapValues(self, fn):
+		if self.encoded:
+			return self.base.mapValues(fn, self.indices)
+		return list(map(fn, self))
+	def __reduce__(self):
+		return _materialized, (self.compact(),)
+
+class DictionaryStorage(ColumnStorage):
+	'''str values encoded as an int code per value (an array('i') or memoryview) indexing a list of the distinct values (code -1 for None)
+	the dictionary may be shared between storages (e.g. those selected from this one) - it is only ever appended to'''
+	kind = 'category'
+	encoded = True
+	def __init__(self, dictionary, codes, index=None):
+		self.dictionary = dictionary
+		self.codes = codes
+		self.__index = index
+	@staticmethod
+	def encode(values):
+		'''returns a DictionaryStorage holding the given str (or None) values'''
+		index = {}
+		dictionary = []
+		codes = array('i')
+		for value in values:
+			if value is None:
+				codes.append(-1)
+				continue
+			code = index.get(value)
+			if code is None:
+				code = index[value] = len(dictionary)
+				dictionary.append(value)
+			codes.append(code)
+		return DictionaryStorage(dictionary, codes, index)
+	def index(self):
+		'''returns the dict of value -> code'''
+		if self.__index is None:
+			self.__index = {value: code for code, value in enumerate(self.dictionary)}
+		return self.__index
+	def code(self, value):
+		'''returns the code for value (-1 for None), or None if value isn't in the dictionary'''
+		if value is None:
+			return -1
+		try:
+			return self.index().get(value)
+		except TypeError:
+			return None
+	def __len__(self):
+		return len(self.codes)
+	def value(self, index):
+		code = self.codes[index]
+		return None if code < 0 else self.dictionary[code]
+	def __iter__(self):
+		return map((self.dictionary + [None]).__getitem__, self.codes)
+	def take(self, indices):
+		if not isinstance(indices, (list, range, array)):
+			indices = list(indices)
+		return DictionaryStorage(self.dictionary, array('i', map(self.codes.__getitem__, indices)), self.__index)
+	def gather(self, indices):
+		'''as take, but with code -1 (None) where the index is -1, sharing the dictionary'''
+		codes = self.codes
+		return DictionaryStorage(self.dictionary, array('i', [-1 if i < 0 else codes[i] for i in indices]), self.__index)
+	def ranks(self):
+		'''returns the rank of each code's value in sorted order of the values (the ranks order the codes as the values would be ordered)'''
+		ranks = [0] * len(self.dictionary)
+		for rank, code in enumerate(sorted(range(len(self.dictionary)), key=self.dictionary.__getitem__)):
+			ranks[code] = rank
+		return ranks
+	def mapValues(self, fn, indices=None):
+		'''returns a list of fn(value) for each value (or the values at the given indices), calling fn once per distinct value'''
+		lookup = [fn(value) for value in self.dictionary] + [fn(None)]
+		codes = self.codes if indices is None else map(self.codes.__getitem__, indices)
+		return list(map(lookup.__getitem__, codes))
+	def indicesOf(self, value):
+		'''returns the ascending indices of the values equal to value (comparing codes rather than the values)'''
+		code = self.code(value)
+		if code is None:
+			return []
+		if numpy is not None:
+			return numpy.flatnonzero(numpy.frombuffer(self.codes, dtype=numpy.int32) == code).tolist()
+		return [i for i, c in enumerate(self.codes) if c == code]
+	def writable(self):
+		return isinstance(self.codes, array)
+	def setValue(self, index, value):
+		if not self.writable() or (value is not None and type(value) is not str):
+			return False
+		code = self.code(value)
+		if code is None:
+			code = self.index()[value] = len(self.dictionary)
+			self.dictionary.append(value)
+		self.codes[index] = code
+		return True
+	def copy(self):
+		if not self.writable():
+			return self
+		return DictionaryStorage(self.dictionary, array('i', self.codes), self.__index)
+	def __reduce__(self):
+		return DictionaryStorage, (list(self.dictionary), array('i', self.codes))
+
+def _chunkKind(chunk):
+	return chunk.kind if isinstance(chunk, ColumnStorage) else 'object'
+
+def _storageOrList(values, kind):
+	'''returns the values in storage of the given kind, or the list itself for the 'object' kind'''
+	storage = makeStorage(values, kind) if kind != 'object' else None
+	return values if storage is None else storage
+
+def mergeChunks(chunks):
+	'''returns a single chunk holding the values of the given chunks (of the same kind as them if they share one, otherwise a list)'''
+	if len(chunks) == 1:
+		return chunks[0]
+	kinds = {_chunkKind(chunk) for chunk in chunks}
+	return _storageOrList(list(chain.from_iterable(chunks)), kinds.pop() if len(kinds) == 1 else 'object')
+
+class CompactionPolicy(object):
+	'''
+	Decides when the chunks of a ChunkedStorage are merged, as values are appended
+After each append the last two chunks are merged while the last one has at least 1/ratio as many values as the one before it,
+	which keeps the number of chunks logarithmic in the number of values, while each value is only copied a logarithmic number of times.
+	A ratio of None never merges chunks (until the column is compacted explicitly).
+maxChunks - if given, all of the chunks are merged whenever there are more than this many
+	'''
+	def __init__(self, ratio=2, maxChunks=None):
+		self.ratio = ratio
+		self.maxChunks = maxChunks
+	def compact(self, chunks):
+		'''returns the list of chunks to hold after appending the last of the given chunks'''
+		if self.maxChunks is not None and len(chunks) > self.maxChunks:
+			return [mergeChunks(chunks)]
+		if self.ratio is None:
+			return chunks
+		chunks = list(chunks)
+		while len(chunks) > 1 and len(chunks[-1]) * self.ratio >= len(chunks[-2]):
+			chunks[-2:] = [mergeChunks(chunks[-2:])]
+		return chunks
+
+DEFAULT_COMPACTION = CompactionPolicy()
+
+class ChunkedStorage(ColumnStorage):
+	'''values held in a list of chunks (lists of values or ColumnStorages), so that appending doesn't copy the existing values
+	the chunks are treated as immutable: they may be shared with other ChunkedStorages (copies and appended storages),
+	so setValue copies a chunk (once) before changing it'''
+	def __init__(self, chunks):
+		self.chunks = [chunk for chunk in chunks if len(chunk)]
+		self.__starts = []
+		length = 0
+		for chunk in self.chunks:
+			self.__starts.append(length)
+			length += len(chunk)
+		self.__length = length
+		self.__owned = set()
+		self.__setKind()
+	def __setKind(self):
+		kinds = {_chunkKind(chunk) for chunk in self.chunks}
+		self.kind = kinds.pop() if len(kinds) == 1 else 'object'
+		self.encoded = bool(self.chunks) and all(getattr(chunk, 'encoded', False) for chunk in self.chunks)
+	def __len__(self):
+		return self.__length
+	def value(self, index):
+		if len(self.chunks) == 1:
+			return self.chunks[0][index]
+		k = bisect_right(self.__starts, index) - 1
+		return self.chunks[k][index - self.__starts[k]]
+	def __iter__(self):
+		return chain.from_iterable(self.chunks)
+	def appended(self, chunk, policy=DEFAULT_COMPACTION):
+		'''returns a new ChunkedStorage with the values of this one followed by those of chunk (which must not be changed afterwards)'''
+		return ChunkedStorage(policy.compact(self.chunks + [chunk]) if len(chunk) else self.chunks)
+	def merged(self):
+		'''returns the values in a single chunk'''
+		if not self.chunks:
+			return []
+		return mergeChunks(self.chunks)
+	def take(self, indices):
+		return _storageOrList([self.value(i) for i in indices], self.kind)
+	def numpyValues(self):
+		if numpy is None or not self.chunks:
+			return None
+		values = [chunk.numpyValues() if isinstance(chunk, ColumnStorage) else None for chunk in self.chunks]
+		if any(v is None for v in values):
+			return None
+		return numpy.concatenate(values)
+	def mapValues(self, fn):
+		return list(chain.from_iterable(chunk.mapValues(fn) if isinstance(chunk, ColumnStorage) else map(fn, chunk) for chunk in self.chunks))
+	def setValue(self, index, value):
+		if index < 0:
+			index += self.__length
+		k = bisect_right(self.__starts, index) - 1
+		chunk = self.chunks[k]
+		if k not in self.__owned:
+			chunk = chunk.copy() if isinstance(chunk, ColumnStorage) else list(chunk)
+			self.__owned.add(k)
+		if isinstance(chunk, ColumnStorage) and not chunk.setValue(index - self.__starts[k], value):
+			chunk = list(chunk)
+		if not isinstance(chunk, ColumnStorage):
+			chunk[index - self.__starts[k]] = value
+		self.chunks[k] = chunk
+		self.__setKind()
+		return True
+	def copy(self):
+		self.__owned = set()
+		return ChunkedStorage(self.chunks)
+	def __reduce__(self):
+		return ChunkedStorage, (list(self.chunks),)
+
+def nullsFirst(kind, ascending=True, nulls=None):
+	'''returns if None sorts before the values of the given kind: as nulls says ('first' or 'last'),
+	otherwise as sortKey orders None against values of that kind (reversed if not ascending)'''
+	if nulls is not None:
+		return nulls == 'first'
+	kind = 'string' if kind == 'category' else kind
+	return (sortKey(None) < sortKey(PYTHON_TYPES[kind]())) == ascending
+
+def _sortByColumn(indices, data, ascending, nulls):
+	'''returns the list of indices stably sorted by the values of data (a list or ColumnStorage) at each index'''
+	if isinstance(data, TypedStorage):
+		values, bitmap = data.buffers()
+		kind = data.kind
+		isNullRow = (lambda i: isNull(bitmap, i)) if data.hasNulls() else None
+	elif isinstance(data, DictionaryStorage):
+		ranks = data.ranks()
+		ranks.append(-1)
+		codes = data.codes
+		values = [ranks[code] for code in codes]
+		kind = 'string'
+		isNullRow = lambda i: codes[i] < 0
+	else:
+		values = list(data)
+		kind = data.kind if isinstance(data, ColumnStorage) and data.kind != 'object' else columnKind(values)
+		isNullRow = lambda i: values[i] is None
+		if kind == 'object':
+			# values of mixed types are ordered by sortKey, which (unless nulls says otherwise) also places None
+			if nulls is None:
+				values = list(map(sortKey, values))
+				isNullRow = None
+			else:
+				values = [None if value is None else sortKey(value) for value in values]
+	if isNullRow is None:
+		return sorted(indices, key=values.__getitem__, reverse=not ascending)
+	nullRows = [i for i in indices if isNullRow(i)]
+	if not nullRows:
+		return sorted(indices, key=values.__getitem__, reverse=not ascending)
+	rows = sorted([i for i in indices if not isNullRow(i)], key=values.__getitem__, reverse=not ascending)
+	return nullRows + rows if nullsFirst(kind, ascending, nulls) else rows + nullRows
+
+def _numpySortKeys(data, ascending, nulls):
+	'''returns the numpy arrays to pass to numpy.lexsort to order by data (least significant first), or None if data isn't a TypedStorage or DictionaryStorage'''
+	if isinstance(data, TypedStorage):
+		values = data._numpy()
+		if not ascending:
+			values = -values if data.kind == 'float64' else ~values
+		bitmap = data.buffers()[1] if data.hasNulls() else None
+	elif isinstance(data, DictionaryStorage):
+		ranks = numpy.array(data.ranks() + [0], dtype=numpy.int64)
+		codes = numpy.frombuffer(data.codes, dtype=numpy.int32)
+		values = ranks[codes]
+		if not ascending:
+			values = -values
+		bitmap = numpy.packbits(codes < 0, bitorder='little') if (codes < 0).any() else None
+	else:
+		return None
+	if bitmap is None:
+		return [values]
+	isNullRow = numpy.unpackbits(numpy.frombuffer(bitmap, dtype=numpy.uint8), count=len(values), bitorder='little')
+	return [values, isNullRow ^ 1 if nullsFirst(data.kind, ascending, nulls) else isNullRow]
+
+def sortIndices(columns, length, ascending=True, nulls=None):
+	'''
+	Returns the permutation (a list of indices) which stably sorts rows by the given columns (lists or ColumnStorages, most significant first)
+The rows are sorted a column at a time, least significant first, using the typed or dictionary encoded values rather than building a key per row
+	(with numpy.lexsort when NumPy is installed and all of the columns are typed or dictionary encoded).
+	With the defaults the order is that of sorting by a tuple of sortKey(value) for each column (as DataTable.sort in datatable does).
+Parameters:
+	ascending - a bool, or a sequence of a bool for each column
+	nulls - where None sorts for each column: 'first', 'last', or None to place it as sortKey does (which is after the values if descending)
+	'''
+	if isinstance(ascending, bool):
+		ascending = [ascending] * len(columns)
+	if len(ascending) != len(columns):
+		raise DataTableException("ascending must be a bool or have one value per field")
+	if nulls not in (None, 'first', 'last'):
+		raise DataTableException("nulls must be 'first', 'last' or None, not %r" % (nulls,))
+	if numpy is not None and columns:
+		keys = []
+		for data, up in zip(reversed(columns), reversed(ascending)):
+			columnKeys = _numpySortKeys(data, up, nulls)
+			if columnKeys is None:
+				break
+			keys += columnKeys
+		else:
+			return numpy.lexsort(keys).tolist()
+	indices = list(range(length))
+	for data, up in zip(reversed(columns), reversed(ascending)):
+		indices = _sortByColumn(indices, data, up, nulls)
+	return indices
@@ -1,8 +1,13 @@
 from collections import defaultdict, Counter
-from datatable_util import AttributeDict, CSV_GivenHeaders, FIXEDWIDTH, JoinType, sortKey
+from datatable_util import AttributeDict, RowFingerprints, DataTableException, CSV_GivenHeaders, FIXEDWIDTH, JoinType, sortKey
 from hierarchies import Hierarchy
+import heapq
 import os
 from datatable import DataTable, DataColumn
+from datatable_aggregate import accumulate, accumulateSorted, aggregateParallel, finalizeRow, finalizeRows
+from datatable_join import hashJoin, mergeJoin, joinedHeaders, sortedKeyGetter
+from datatable_sort import externalSort
+from datatable_source import StreamSource, IteratorSource, TableSource, FileSource, QuerySource, DerivedSource, CachedSource, isReplayable
 from itertools import chain
 from functools import reduce
 
@@ -18,6 +23,12 @@ def createColumnFilter(criteria):
 		return lambda value: value in criteria
 	return lambda value: value == criteria
 
+def _headerSet(other, headers):
+	'''returns the set of headers given by other: a header of the stream, or a collection of headers'''
+	if isinstance(other, (list, tuple, set, frozenset)) and not (isinstance(other, tuple) and other in headers):
+		return set(other)
+	return {other}
+
 class KeyParamedDefaultDict(dict):
 	def __init__(self, defaultMethod, *args, **kwargs):
 		super(KeyParamedDefaultDict, self).__init__(*args, **kwargs)
@@ -35,7 +46,7 @@ class DataColumnStream(object):
 		else:
 			self.header = header
 	def __iter__(self):
-		for row in self.__dataTable:
+		for row in self.__dataTableStream:
 			yield row[self.header]
 	def __getitem__(self, index):
 		'''Gets the index'th row of data'''
@@ -73,7 +84,8 @@ Value may be one of the following:
 	value - returns rows where column value equals the given value
 '''
 		criteria = createColumnFilter(value)
-		return DataTableStream((row for row in self.__dataTableStream if criteria(row[self.header])), self.__dataTableStream.headers())
+		stream = self.__dataTableStream
+		return DataTableStream(DerivedSource(lambda: (row for row in stream if criteria(row[self.header])), stream), stream.headers())
 	def set(self, value):
 		'''
 	sets the items in this column to the given value
@@ -84,7 +96,8 @@ Value may be one of the following:
 			transform = lambda row: row + {self.header: value(row[self.header])}
 		else:
 			transform = lambda row: row + {self.header: value}
-		return DataTableStream((transform(row) for row in self.__dataTableStream), self.__dataTableStream.headers())
+		stream = self.__dataTableStream
+		return DataTableStream(DerivedSource(lambda: (transform(row) for row in stream), stream), stream.headers())
 	def sizeOfGroups(self):
 		return Counter(self)
 	def __repr__(self):
@@ -94,16 +107,55 @@ Value may be one of the following:
 
 class DataTableStream(object):
 	def __init__(self, rows, headers):
-		self.__rows = rows
+		'''creates a stream of the given rows with the given headers
+	rows may be a StreamSource (see datatable_source), another stream, a DataTable or list of rows (which may be read more than once),
+		or an iterator of rows (e.g. a generator, which can only be read once)'''
+		if isinstance(rows, StreamSource):
+			self.__source = rows
+		elif isinstance(rows, DataTableStream):
+			self.__source = DerivedSource(lambda: rows, rows)
+		elif isReplayable(rows):
+			self.__source = TableSource(rows)
+		else:
+			self.__source = IteratorSource(rows)
 		self.__headers = headers
 		self.__columns = KeyParamedDefaultDict(lambda header: DataColumnStream(self, header))
+	@staticmethod
+	def fromFile(path, parse=None, headers=None, encoding=None):
+		'''returns a stream of the rows of the file at path, which is re-read each time the stream is read (see datatable_source.FileSource)
+	parse - a function taking the open file and returning an iterable of rows (defaults to reading a csv file with a header line)
+	headers - the headers of the rows (defaults to reading them from the file)'''
+		source = FileSource(path, parse, encoding)
+		return DataTableStream(source, source.headers() if headers is None else headers)
+	@staticmethod
+	def fromQuery(connection, query, params=None, headers=None):
+		'''returns a stream of the rows returned by the query (on a DB-API 2.0 connection), which is re-executed each time the stream is read
+	(see datatable_source.QuerySource)
+	headers - the headers of the rows (defaults to executing the query to find them)'''
+		source = QuerySource(connection, query, params)
+		return DataTableStream(source, source.headers() if headers is None else headers)
 	def __iter__(self):
 		'''Gets an iterator over the data rows'''
-		return iter(self.__rows)
+		return iter(self.__source)
+	def replayable(self):
+		'''returns if the rows of this stream can be read more than once (as operations like columns, or filtering by another column of the stream, do)
+	streams of tables, files and queries are replayable, as are the streams derived from them, while streams of iterators are not (see cache)'''
+		return self.__source.replayable
+	def cache(self, memoryLimit=None, tempDir=None):
+		'''returns a replayable stream of the rows of this stream, which are read (once) as they are first needed, and kept for later passes
+	memoryLimit - if given, the rows are kept in memory until they take about memoryLimit bytes, and then pickled to a temporary file
+		(see datatable_source.CachedSource)'''
+		return DataTableStream(CachedSource(self, memoryLimit, tempDir), self.__headers)
+	def __derive(self, makeRows, headers, *others):
+		'''returns a stream of the rows returned by makeRows() (which reads this stream, and any others), calling it again for each pass'''
+		return DataTableStream(DerivedSource(makeRows, self, *others), headers)
 	def __getitem__(self, index):
 		'''Gets the index'th row of data'''
 		if '__iter__' in dir(index):
-			criteria = lambda i: i in set(index)
+			def it():
+				indices = set(index)
+				return (row for i, row in enumerate(self) if i in indices)
+			return self.__derive(it, self.__headers, index)
 		elif isinstance(index, slice):
 			criteria = lambda i: index.start <= i <= index.stop and (i - index.start) % index.step == 0
 		else:
@@ -111,7 +163,7 @@ class DataTableStream(object):
 				if i == index:
 					return row
 			return None
-		return DataTableStream((row for i, row in enumerate(self) if criteria(i)), self.__headers)
+		return self.__derive(lambda: (row for i, row in enumerate(self) if criteria(i)), self.__headers)
 	def column(self, header):
 		'''Gets the column named 'header' (same as dataTable.<header>)'''
 		return self.__columns[header]
@@ -132,9 +184,9 @@ class DataTableStream(object):
 			criteria = lambda row: all(v(row[k]) for k, v in filters)
 		else:
 			criteria = filterFunction
-		return DataTableStream((row for row in self if criteria(row)), self.__headers)
+		return self.__derive(lambda: (row for row in self if criteria(row)), self.__headers)
 	def transform(self, transformFunction, newHeaders=None):
-		return DataTableStream((transformFunction(row) for row in self), newHeaders or set())
+		return self.__derive(lambda: (transformFunction(row) for row in self), newHeaders or set())
 	def index(self, keyHeaders, leafHeaders=None):
 		if leafHeaders is None:
 			leafHeaders = set(self.headers()).difference(keyHeaders)
@@ -146,30 +198,32 @@ class DataTableStream(object):
 	def augment(self, other):
 		'''append the rows in other to the rows in this
 	if the headers don't match between the two instances then it adds blank columns to each with the headers from the other'''
-		if isinstance(other, DataTableStream, DataTable):
+		if isinstance(other, (DataTableStream, DataTable)):
 			headers = set(self.__headers).union(other.headers())
 		else:
 			headers = self.__headers
 		if isinstance(other, dict):
-			stream = chain(self, [other])
-		else:
-			stream = chain(self, other)
-		return DataTableStream(({header: row.get(header, None) for header in headers} for row in stream), headers)
+			other = [other]
+		return self.__derive(lambda: ({header: row.get(header, None) for header in headers} for row in chain(self, other)), headers, other)
 	def append(self, other):
 		'''append the rows in the other to the rows in this
 	requires that the headers match (or that one of self or other be empty)'''
 		if isinstance(other, dict):
-			stream = chain(self, [other])
-		else:
-			stream = chain(self, other)
-		return DataTableStream(stream, self.__headers)
-	def remove(self, other):
-		'''remove the rows from other that are in self - uses exact match of rows'''
+			other = [other]
+		return self.__derive(lambda: chain(self, other), self.__headers, other)
+	def remove(self, other, keyHeaders=None):
+		'''remove the rows from other that are in self - uses exact match of rows
+	if keyHeaders is given then rows are matched by their values for those headers instead (e.g. removal by primary key)
+	other is read (once) when the first row is requested'''
 		if isinstance(other, dict):
-			criteria = lambda row: row != other
-		else:
-			criteria = lambda row: row not in other
-		return self.filter(criteria)
+			other = [other]
+		def it():
+			headers = self.headers() if keyHeaders is None else keyHeaders
+			toRemove = RowFingerprints(other, headers, exact=keyHeaders is None)
+			for row in self:
+				if row not in toRemove:
+					yield row
+		return self.__derive(it, self.__headers, other)
 	def extend(self, other):
 		'''Add columns to the data using the dictionary keys from other as the new headers and their values as fields on each row
 Overwrites existing columns'''
@@ -198,11 +252,8 @@ Overwrites existing columns'''
 			length = len(data)
 			data = {header: [row[header] for row in data] for header in self.__headers}
 			data = {header: values for header, values in data.items() if not other(header, values)}
-			return DataTableStream(({header: values[i] for header, values in data.items()} for i in range(length)), data.keys())
-		if other in self.__headers:
-			other = {other}
-		else:
-			other = set(other)
+			return self.__derive(lambda: ({header: values[i] for header, values in data.items()} for i in range(length)), data.keys())
+		other = _headerSet(other, self.__headers)
 		transform = lambda row: {header: value for header, value in row.items() if header not in other}
 		return self.transform(transform, {header for header in self.__headers if header not in other})
 	def project(self, other): #not compatible with existing functions
@@ -214,27 +265,53 @@ Overwrites existing columns'''
 			length = len(data)
 			data = {header: [row[header] for row in data] for header in self.__headers}
 			data = {header: values for header, values in data.items() if other(header, values)}
-			return DataTableStream(({header: values[i] for header, values in data.items()} for i in range(length)), data.keys())
-		if other in self.__headers:
-			other = {other}
-		else:
-			other = set(other)
+			return self.__derive(lambda: ({header: values[i] for header, values in data.items()} for i in range(length)), data.keys())
+		other = _headerSet(other, self.__headers)
 		transform = lambda row: {header: value for header, value in row.items() if header in other}
 		return self.transform(transform, {header for header in self.__headers if header in other})
 	def removeBlankColumns(self):
 		'''returns a copy of this DataTable with all of the blank columns removed'''
 		return self.project(lambda header, values: any(values))
-	def sorted(self, *fields):
+	def sorted(self, *fields, memoryLimit=None):
+		'''returns a DataTable of the rows sorted on the given fields
+	memoryLimit - if given, instead returns a DataTableStream of the sorted rows, sorting them with an external merge sort
+		which holds about memoryLimit bytes of rows in memory, spilling sorted runs to temporary files (see datatable_sort)'''
 		def key(row):
 			return tuple(sortKey(row.get(field, None)) for field in fields)
+		if memoryLimit is not None:
+			return self.__derive(lambda: externalSort(self, key, memoryLimit), self.__headers)
 		return DataTable(sorted(self, key=key))
-	def iterBucket(self, *fields):
-		copy = self.sorted(*fields)
+	def iterBucket(self, *fields, ordered=True, presorted=False, memoryLimit=None):
+		'''Yields (bucket, DataTable of rows matching that bucket) for each distinct combination of values in the given fields
+	ordered - yield the buckets in sorted order (if false, the rows are grouped by hashing in a single pass, and the buckets are yielded in order of first appearance)
+	presorted - the stream is already sorted on the fields: each bucket is yielded as soon as it is complete, holding only one bucket in memory
+		raises a DataTableException if the rows are found to be out of order
+	memoryLimit - sort the rows with an external merge sort holding about memoryLimit bytes of rows in memory (see sorted)'''
+		if not ordered:
+			buckets = {}
+			for data in self:
+				key = tuple(data[field] for field in fields)
+				if key in buckets:
+					buckets[key].append(data)
+				else:
+					buckets[key] = [data]
+			for key, bucket in buckets.items():
+				yield key, DataTable(bucket)
+			return
+		sortedKey = sortedKeyGetter(fields)
+		if presorted:
+			rows = self
+		elif memoryLimit is not None:
+			rows = self.sorted(*fields, memoryLimit=memoryLimit)
+		else:
+			rows = sorted(self, key=lambda row: tuple(sortKey(row.get(field, None)) for field in fields))
 		currentKey = None
 		currentBucket = []
-		for data in copy:
+		for data in rows:
 			key = tuple(data[field] for field in fields)
 			if currentKey is not None and key != currentKey:
+				if presorted and sortedKey(data) < sortedKey(currentBucket[0]):
+					raise DataTableException("stream isn't sorted on %s: %r follows %r" % (', '.join(map(str, fields)), key, currentKey))
 				yield currentKey, DataTable(currentBucket)
 				currentBucket = []
 			currentKey = key
@@ -250,53 +327,43 @@ Overwrites existing columns'''
 			key = tuple(data[field] for field in fields)
 			buckets[key].append(data)
 		return AttributeDict((key, DataTable(bucket)) for key, bucket in buckets.items())
-	def filterBucket(self, predicate, *fields):
+	def filterBucket(self, predicate, *fields, ordered=True, presorted=False, memoryLimit=None):
 		'''Filter the datatable using an aggregate predicate
 fields specifies how the data will be grouped
 predicate is a method which takes a bucket of data and returns if the bucket should be included in the result
+ordered, presorted, memoryLimit - as for iterBucket
 '''
-		return DataTableStream(row for key, bucket in self.iterBucket(*fields) if predicate(bucket) for row in bucket)
-	def join(self, other, joinParams=None, otherFieldPrefix='', joinType=JoinType.LEFT_OUTER_JOIN):
+		return self.__derive(lambda: (row for key, bucket in self.iterBucket(*fields, ordered=ordered, presorted=presorted, memoryLimit=memoryLimit) if predicate(bucket) for row in bucket), self.__headers)
+	def join(self, other, joinParams=None, otherFieldPrefix='', joinType=JoinType.LEFT_OUTER_JOIN, expectedUnique=False, algorithm='hash'):
 		'''
 dataTable.join(otherTable, joinParams, otherFieldPrefix='')
 	returns a new table with rows in the first table joined with rows in the second table, using joinParams to map fields in the first to fields in the second
+	the rows of this stream are streamed, while the rows of other are held in memory (unless algorithm is 'merge')
 Parameters:
 	other - the table to join
 	joinParams - a dictionary of <field in self> to <field in other>. Defaults to "natural join", merging common headers
 	otherFieldPrefix - a string to prepend to the fields added from the second table
 	joinType - the instance of JoinType which indicates if items should be included in one data table which aren't in the other
+	expectedUnique - the join fields are unique in other (e.g. looking rows up by primary key), which allows a faster lookup;
+		raises a DataTableException if they aren't
+	algorithm - 'hash', or 'merge' for a streaming sort-merge join of inputs which are both already sorted on their join fields
+		(as by sorted/DataTable.sort); memory use is bounded by the longest run of rows in other sharing a join key.
+		Rows are in join field order, and a DataTableException is raised if either input is out of order
 		'''
 		if joinParams is None:
 			joinParams = {h: h for h in self.headers() if h in other.headers()}
 		elif not isinstance(joinParams, dict):
 			raise Exception("joinParams must be a dictionary of <field in self> to <field in other>")
-		selfJoinHeaders = list(joinParams.values())
-		otherJoinHeaders = [joinParams[h] for h in selfJoinHeaders]
-
-		newOtherHeaders = {(v if v in joinParams.values() else otherFieldPrefix + v) for v in otherJoinHeaders}
-		otherBuckets = other.extend(
-			lambda row: {otherFieldPrefix + v: row[v] for v in other.headers() if v not in otherJoinHeaders}
-		).project(newOtherHeaders
-		).bucket(*otherJoinHeaders)
-		emptyOtherRow = AttributeDict({otherFieldPrefix + v: None for v in other.headers() if v not in otherJoinHeaders})
-		emptySelfRow = AttributeDict({header: None for header in self.headers() if header not in selfJoinHeaders})
-		otherKeysSeen = set()
+		if algorithm not in ('hash', 'merge'):
+			raise DataTableException("Unknown join algorithm: %r.  Expected 'hash' or 'merge'" % (algorithm,))
+		otherHeaders = list(other.headers())
+		if algorithm == 'merge':
+			return self.__derive(lambda: mergeJoin(self, other, joinParams, self.headers(), otherHeaders, otherFieldPrefix, joinType, expectedUnique),
+					set(joinedHeaders(self.headers(), otherHeaders, joinParams, otherFieldPrefix)), other)
 		def it():
-			for row in self:
-				rowKey = tuple(row[selfHeader] for selfHeader, otherHeader in joinParams)
-				otherKeysSeen.add(rowKey)
-				if rowKey in otherBuckets:
-					for otherRow in otherBuckets[rowKey]:
-						yield row + otherRow
-				elif joinType.leftOuter:
-					yield emptyOtherRow + row
-			if joinType.rightOuter:
-				for otherKey, otherBucket in otherBuckets.items():
-					if otherKey not in otherKeysSeen:
-						for row in otherBucket:
-							yield emptySelfRow + row
-
-		return DataTableStream(it(), set(self.headers()).union(newOtherHeaders))
+			otherRows = other if isinstance(other, DataTable) else list(other)
+			yield from hashJoin(self, otherRows, joinParams, self.headers(), otherHeaders, otherFieldPrefix, joinType, expectedUnique)
+		return self.__derive(it, set(joinedHeaders(self.headers(), otherHeaders, joinParams, otherFieldPrefix)), other)
 	def writeTo(self, fileName, *headers):
 		'''Write the contents of this DataTable to a file with the given name in the standard csv format'''
 		if not headers:
@@ -305,8 +372,8 @@ Parameters:
 			f.write(self | CSV_GivenHeaders(*headers))
 	def duplicates(self, *fields):
 		'''given a list of fields as keys, return a DataTable instance with the rows for which those fields are not unique'''
-		matches = {}
 		def it():
+			matches = {}
 			for row in self:
 				key = tuple(row[field] for field in fields)
 				if key in matches:
@@ -318,7 +385,7 @@ Parameters:
 						yield row
 				else:
 					matches[key] = row
-		return DataTableStream(it(), self.headers())
+		return self.__derive(it, self.headers())
 	def _distinct(self):
 		rows = set()
 		headers = self.headers()
@@ -329,13 +396,13 @@ Parameters:
 				rows.add(items)
 	def distinct(self):
 		'''return a new DataTable with only unique rows'''
-		return DataTableStream(self._distinct(), self.headers())
+		return self.__derive(self._distinct, self.headers())
 	def fillDownBlanks(self, *fields):
 		'''fills in the blanks in the current table such that each blank field in a row is filled in with the first non-blank entry in the column before it'''
 		if not fields:
 			fields = self.headers()
-		populatedRow = {field: None for field in fields}
 		def it():
+			populatedRow = {field: None for field in fields}
 			for row in self:
 				copy = dict(row)
 				for field in fields:
@@ -344,7 +411,7 @@ Parameters:
 					else:
 						copy[field] = populatedRow[field]
 				yield copy
-		return DataTableStream(it(), self.headers())
+		return self.__derive(it, self.headers())
 	def pivot(self, rowID=None):
 		'''Returns a new DataTable with the rows and columns swapped
 In the resulting table, the headers from the previous table will be in the 'Field' column,
@@ -366,29 +433,33 @@ or a method which takes a table (this table) and the row index and returns the c
 				row = {rowId: row[header] for rowId, row in zip(rowIDs, origData)}
 				row['Field'] = header
 				yield row
-		return DataTableStream(tempIterRows(), rowIDs)
-	def aggregate(self, groupBy, aggregations={}):
+		return self.__derive(tempIterRows, rowIDs)
+	def aggregate(self, groupBy, aggregations={}, workers=None, chunkSize=50000, presorted=False, strict=True):
 		'''return an aggregation of the data grouped by a given set of fields.
-	Must processe the whole stream before it will start streaming resulting rows
+	Must processe the whole stream before it will start streaming resulting rows (unless presorted)
 Parameters:
 	groupBy - the set of fields to group
 	aggregations - a dict of field name -> aggregate method, where the method takes an intermediate DataTable
 		and returns the value for that field for that row.
+	workers - if more than 1, the rows are aggregated in chunks of chunkSize rows by a pool of that many processes
+		and the partial results combined (the aggregate methods must implement merge and be picklable - see datatable_aggregate)
+	presorted - the stream is already sorted on the groupBy fields (e.g. an ordered query or log file): each group's row is yielded
+		as soon as the group ends, holding only one group in memory (workers is ignored)
+	strict - with presorted, raise a DataTableException if the rows are found to be out of order;
+		if false, each run of rows with the same key is aggregated as a group of its own (see datatable_aggregate.accumulateSorted)
 		'''
+		if presorted:
+			return self.__derive(lambda: (finalizeRow(key, accRow, groupBy, aggregations) for key, accRow in accumulateSorted(self, groupBy, aggregations, strict)),
+					set(groupBy).union(aggregations.keys()))
 		if not aggregations:
 			return self.project(groupBy).distinct()
 		def tempIterRows():
-			accumulatedRows = {}
-			for row in self:
-				key = tuple(row[field] for field in groupBy)
-				if key not in accumulatedRows:
-					accumulatedRows[key] = {a: agg.newBucket(row) for a, agg in aggregations.items()}
-				accRow = accumulatedRows[key]
-				for a, agg in aggregations.items():
-					accRow[a] = agg.addRow(row, accRow[a])
-			for key, accRow in sorted(accumulatedRows.items()):
-				yield AttributeDict(zip(groupBy, key)) + {a: agg.finalize(accRow[a]) for a, agg in aggregations.items()}
-		return DataTableStream(tempIterRows(), set(groupBy).union(aggregations.keys()))
+			if workers and workers > 1:
+				accumulatedRows = aggregateParallel(self, groupBy, aggregations, workers, chunkSize)
+			else:
+				accumulatedRows = accumulate(self, groupBy, aggregations)
+			yield from finalizeRows(accumulatedRows, groupBy, aggregations)
+		return self.__derive(tempIterRows, set(groupBy).union(aggregations.keys()))
 	def renameColumn(self, column, newName):
 		'''rename the column in place'''
 		swap = lambda h: h if h != column else newName
@@ -399,13 +470,24 @@ Parameters:
 			return reduce(reduction, self)
 		return reduce(reduction, self, startingValue)
 	def minRow(self, *fields):
-		'''return the row with the minimum value(s) in the given field(s)'''
-		getValue = lambda row: tuple(row[field] for field in fields)
-		return min(self, key=getValue)
+		'''return the (first) row with the minimum value(s) in the given field(s), compared as DataTable.minRow does (by sortKey)'''
+		return min(self, key=sortedKeyGetter(fields), default=None)
 	def maxRow(self, *fields):
-		'''return the row with the maximum value(s) in the given field(s)'''
-		getValue = lambda row: tuple(row[field] for field in fields)
-		return min(self, key=getValue)
+		'''return the (last) row with the maximum value(s) in the given field(s), compared as DataTable.maxRow does (by sortKey)'''
+		key = sortedKeyGetter(fields)
+		maxRow = maxKey = None
+		for row in self:
+			rowKey = key(row)
+			if maxRow is None or rowKey >= maxKey:
+				maxRow, maxKey = row, rowKey
+		return maxRow
+	def topK(self, k, *fields, descending=False):
+		'''returns a DataTable with the k rows with the smallest (or largest, if descending) value(s) in the given field(s), in that order
+	rows with equal values keep their order in the stream (for descending too, unlike reversing sorted(*fields)),
+	and only k rows are kept in memory'''
+		def key(row):
+			return tuple(sortKey(row.get(field, None)) for field in fields)
+		return DataTable((heapq.nlargest if descending else heapq.nsmallest)(k, self, key=key))
 	def toTable(self):
 		return DataTable(self)
 
@@ -1,5 +1,7 @@
 import os
 import enum
+from collections import Counter
+from collections.abc import Mapping
 
 class JoinType(enum.Enum):
 	def __init__(self, leftOuter, rightOuter):
@@ -40,9 +42,172 @@ print d.a # 1
 	def filter(self, filterFunction):
 		return AttributeDict({k:v for k, v in self.items() if filterFunction(k, v)})
 
+class RowSchema(object):
+	'''
+	The header -> slot mapping shared by the CompactRows of a table
+Schemas are never changed once created: adding or removing a header moves a row to the (cached) schema for the new set of headers,
+	so rows which change the same way keep sharing a single schema
+	'''
+	def __init__(self, headers):
+		self.headers = tuple(headers)
+		self.slots = {h: i for i, h in enumerate(self.headers)}
+		self.__added = {}
+		self.__removed = {}
+	def withHeader(self, header):
+		'''returns the schema with header added after the existing headers'''
+		if header not in self.__added:
+			self.__added[header] = RowSchema(self.headers + (header,))
+		return self.__added[header]
+	def withoutHeader(self, header):
+		'''returns the schema with header removed'''
+		if header not in self.__removed:
+			self.__removed[header] = RowSchema(h for h in self.headers if h != header)
+		return self.__removed[header]
+	def fromMapping(self, row):
+		'''creates a CompactRow with this schema from the values in row (None for missing headers)'''
+		return CompactRow(self, [row[h] if h in row else None for h in self.headers])
+	def fromValues(self, values):
+		'''creates a CompactRow with this schema from the values (in header order)'''
+		return CompactRow(self, list(values))
+
+class CompactRow(object):
+	'''
+	Row which only stores a list of its values, relying on a RowSchema shared with the other rows of its table to map headers to slots.
+Supports the same access as AttributeDict (row[h], row.h, row + {...}, iterating over the headers, keys/values/items, etc)
+	while taking a fraction of the memory of a dict per row.
+	'''
+	__slots__ = ('_schema', '_values')
+	def __init__(self, schema, values):
+		object.__setattr__(self, '_schema', schema)
+		object.__setattr__(self, '_values', values)
+	def __getitem__(self, header):
+		return self._values[self._schema.slots[header]]
+	def __getattr__(self, attr):
+		try:
+			return self[attr]
+		except KeyError as e:
+			raise AttributeError(*e.args)
+	def __setitem__(self, header, value):
+		slot = self._schema.slots.get(header)
+		if slot is None:
+			object.__setattr__(self, '_schema', self._schema.withHeader(header))
+			self._values.append(value)
+		else:
+			self._values[slot] = value
+	__setattr__ = __setitem__
+	def __delitem__(self, header):
+		slot = self._schema.slots[header]
+		object.__setattr__(self, '_schema', self._schema.withoutHeader(header))
+		del self._values[slot]
+	def __contains__(self, header):
+		return header in self._schema.slots
+	def __iter__(self):
+		return iter(self._schema.headers)
+	def __len__(self):
+		return len(self._values)
+	def __dir__(self):
+		return dir(CompactRow) + [str(key) for key in self.keys()]
+	def __reduce__(self):
+		return CompactRow, (self._schema, self._values)
+	def keys(self):
+		return self._schema.headers
+	def values(self):
+		return list(self._values)
+	def items(self):
+		return list(zip(self._schema.headers, self._values))
+	def get(self, header, default=None):
+		slot = self._schema.slots.get(header)
+		if slot is None:
+			return default
+		return self._values[slot]
+	def copy(self):
+		return CompactRow(self._schema, list(self._values))
+	def update(self, other):
+		for k, v in (other.items() if hasattr(other, 'items') else other):
+			self[k] = v
+	def __iadd__(self, other):
+		self.update(other)
+		return self
+	def __add__(self, other):
+		row = self.copy()
+		row += other
+		return row
+	def filter(self, filterFunction):
+		return AttributeDict({k:v for k, v in self.items() if filterFunction(k, v)})
+	def __eq__(self, other):
+		if isinstance(other, CompactRow) and other._schema is self._schema:
+			return self._values == other._values
+		if not isinstance(other, Mapping):
+			return NotImplemented
+		return len(self) == len(other) and all(k in other and other[k] == v for k, v in self.items())
+	def __ne__(self, other):
+		result = self.__eq__(other)
+		if result is NotImplemented:
+			return result
+		return not result
+	__hash__ = None
+	def __repr__(self):
+		return '{%s}' % ', '.join('%r: %r' % item for item in self.items())
+Mapping.register(CompactRow)
+
 class DataTableException(Exception):
 	pass
 
+class RowFingerprints(object):
+	'''
+	Multiset of row fingerprints (the tuple of a row's values for a list of headers) used for hash-based matching of rows
+Rows with unhashable values fall back to being matched by equality.
+	exact - only rows with exactly the given headers are collected, so that matching is equivalent to whole-row equality
+	'''
+	def __init__(self, rows, headers, exact=False):
+		self.headers = list(headers)
+		self.__counts = Counter()
+		self.__unhashable = []
+		for row in rows:
+			if exact and len(row.keys()) != len(self.headers):
+				continue
+			try:
+				key = self.fingerprint(row)
+			except KeyError:
+				continue
+			try:
+				self.__counts[key] += 1
+			except TypeError:
+				self.__unhashable.append(key)
+	def fingerprint(self, row):
+		return tuple(row[h] for h in self.headers)
+	def __len__(self):
+		return sum(self.__counts.values()) + len(self.__unhashable)
+	def __contains__(self, row):
+		try:
+			return self.hasKey(self.fingerprint(row))
+		except KeyError:
+			return False
+	def hasKey(self, key):
+		'''returns if the fingerprint is in the collection'''
+		try:
+			return self.__counts[key] > 0
+		except TypeError:
+			return key in self.__unhashable
+	def discard(self, row):
+		'''removes one occurrence of the row's fingerprint, returning if there was one to remove'''
+		try:
+			return self.discardKey(self.fingerprint(row))
+		except KeyError:
+			return False
+	def discardKey(self, key):
+		'''removes one occurrence of the fingerprint, returning if there was one to remove'''
+		try:
+			if self.__counts[key] > 0:
+				self.__counts[key] -= 1
+				return True
+			return False
+		except TypeError:
+			if key in self.__unhashable:
+				self.__unhashable.remove(key)
+				return True
+			return False
+
 def _quoteField(field):
 	f = str(field)
 	if ',' in f: